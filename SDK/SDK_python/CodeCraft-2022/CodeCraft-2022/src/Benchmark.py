@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: Benchmark.py
+@time: 2022/3/31 9:40
+@description:基准测试：在不同规模、不同压力的算例矩阵上分阶段（read_data、construct、construct_1、objective、
+    check、write、improve）测量墙钟时间、峰值内存（RSS）、ALNS迭代速度和目标函数值，结果追加到JSON历史文件，
+    并与保存的基线比较，标记性能回退。每个算例在独立的子进程中运行，使峰值内存互不影响
+    用法：python Benchmark.py [--match simulated1000] [--repeat 3] [--save-baseline]
+         [--generate 8928,35,135,0.8 1000,35,135,0.99,0.2,1]（追加由InstanceGenerator生成的仿真算例）
+    另含优先级队列微基准（benchmark_priority_queue）：python Benchmark.py --priority-queue
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils import PriorityQueue, IndexedPriorityQueue
+
+root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # 项目目录（包含data、output、src）
+data_root = os.path.join(root_path, 'data')  # 算例目录
+history_file = os.path.join(root_path, 'output', 'benchmark_history.json')  # 基准测试历史文件
+baseline_file = os.path.join(root_path, 'output', 'benchmark_baseline.json')  # 基准测试基线文件
+name_pattern = re.compile(r'(\d+)t(\d+)cus(\d+)site(?:([\d.]+)pressure)?')  # 由算例名称解析规模和压力
+
+stages = ('read_data', 'construct', 'construct_1', 'objective', 'check', 'write', 'improve')  # 测量的阶段
+
+
+def instance_matrix(data_path=data_root, match=None) -> list:
+    """
+    算例矩阵：data_path下的各个算例目录，按(时刻数量, 客户节点数量, 边缘节点数量, 压力)排序
+    :param match: 算例名称需包含的子串列表，None表示不筛选
+    :return: [(算例名称, 算例目录, {'time': T, 'customers': M, 'sites': N, 'pressure': p})]
+    """
+    matrix = []
+    for name in sorted(os.listdir(data_path)):
+        path = os.path.join(data_path, name)
+        if not os.path.isdir(path) or (match and not any(m in name for m in match)):
+            continue
+        found = name_pattern.search(name)
+        scale = {'time': None, 'customers': None, 'sites': None, 'pressure': None}
+        if found:
+            scale.update(time=int(found.group(1)), customers=int(found.group(2)), sites=int(found.group(3)),
+                         pressure=float(found.group(4)) if found.group(4) else None)
+        matrix.append((name, path, scale))
+    matrix.sort(key=lambda item: tuple(-1 if v is None else v for v in item[2].values()))
+    return matrix
+
+
+def synthetic_matrix(specs: list, data_path=None) -> list:
+    """
+    由规格列表生成仿真算例（已存在时直接复用）并组成算例矩阵
+    :param specs: 规格字符串列表，格式为"时刻数量,客户节点数量,边缘节点数量,压力[,QoS密度[,随机数种子]]"
+    :param data_path: 仿真算例目录，None表示使用系统临时目录
+    """
+    from InstanceGenerator import generate_instance, instance_name
+
+    data_path = data_path or os.path.join(tempfile.gettempdir(), 'codecraft2022_synthetic')
+    matrix = []
+    for spec in specs:
+        values = spec.split(',')
+        n_time, n_cus, n_sit = (int(v) for v in values[:3])
+        pressure = float(values[3])
+        density = float(values[4]) if len(values) > 4 else 0.4
+        seed = int(values[5]) if len(values) > 5 else 0
+        name = instance_name(n_time, n_cus, n_sit, pressure, density, seed)
+        path = os.path.join(data_path, name)
+        if not os.path.exists(os.path.join(path, 'config.ini')):
+            generate_instance(path, n_time, n_cus, n_sit, pressure, density, seed)
+        matrix.append((name, path, {'time': n_time, 'customers': n_cus, 'sites': n_sit, 'pressure': pressure}))
+    return matrix
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值内存（MB）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_instance(data_path: str, repeat=1, iterations=200) -> dict:
+    """
+    在当前进程中对一个算例逐阶段测量（重复repeat次，各阶段取最短用时），标准输出和跟踪事件被关闭，
+    某阶段出错（如初始解生成算法无法满足需求）时记录错误信息并停止，已完成阶段的结果保留
+    :param iterations: improve阶段的ALNS迭代次数
+    :return: {'stages': {阶段: {'seconds': 用时, 'peak_rss_mb': 阶段结束时的峰值内存}}, 'obj_value': ...,
+              'error': 错误信息（仅出错时）}
+    """
+    from CallAlgorithm import initial_solution_generation, initial_solution_generation_1
+    from DestroyRepairOperator import random_destroy, worst_destroy, greedy_repair
+    from ReadData import parse_data, Instance
+    from utils import Tracer
+
+    stdout, sys.stdout = sys.stdout, None
+    Tracer().set_level('OFF')
+    result = {'stages': {}}
+
+    def measure(stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        value = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        record = result['stages'].setdefault(stage, {'seconds': seconds})
+        record['seconds'] = min(record['seconds'], seconds)
+        record['peak_rss_mb'] = round(peak_rss_mb(), 1)
+        return value
+
+    try:
+        for _ in range(repeat):
+            instance = measure('read_data', lambda: Instance(parse_data(data_path)))
+            args = (instance.cus_list, instance.sit_list, instance.qos_dict(), instance.qos_constraint)
+            solution = measure('construct', initial_solution_generation, *args, write_file=False)
+            solution_1 = measure('construct_1', initial_solution_generation_1, *args, write_file=False)
+            measure('objective', solution.objective)
+            report = measure('check', solution.check_feasible)
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                measure('write', solution.write_to_file, os.path.join(tmp_dir, 'solution.txt'))
+
+            rnd_state = np.random.RandomState(0)
+            destroy_operators = [random_destroy, worst_destroy]
+            initial_obj_value = solution.obj_value
+
+            def improve():
+                for _ in range(iterations):
+                    destroy = destroy_operators[rnd_state.randint(len(destroy_operators))]
+                    candidate = greedy_repair(destroy(solution, rnd_state), rnd_state)
+                    if candidate.feasible and candidate.evaluate() <= 0:
+                        candidate.accept()
+                    else:
+                        candidate.reject()
+
+            measure('improve', improve)
+            result.update(
+                feasible=report.feasible,
+                obj_value=int(initial_obj_value),
+                obj_value_1=int(solution_1.obj_value),
+                improved_obj_value=int(solution.obj_value),
+                iterations=iterations,
+                iterations_per_s=round(iterations / max(result['stages']['improve']['seconds'], 1e-9), 2),
+            )
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        sys.stdout = stdout
+    for record in result['stages'].values():
+        record['seconds'] = round(record['seconds'], 6)
+    return result
+
+
+def git_commit() -> str:
+    """当前代码的git提交（无法获取时为None）"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def find_regressions(results: dict, baseline: dict, tolerance=0.2, min_seconds=0.05) -> list:
+    """
+    与基线比较，标记性能回退：阶段用时增加超过tolerance比例且超过min_seconds秒，峰值内存增加超过tolerance比例，
+    ALNS迭代速度下降超过tolerance比例，或初始解目标函数值变差
+    :return: 回退描述列表
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if 'error' in result and 'error' not in base:
+            regressions.append('{}：运行出错（{}），基线正常'.format(name, result['error']))
+        for stage, record in result['stages'].items():
+            base_record = base['stages'].get(stage)
+            if base_record is None:
+                continue
+            seconds, base_seconds = record['seconds'], base_record['seconds']
+            if seconds > base_seconds * (1 + tolerance) and seconds - base_seconds > min_seconds:
+                regressions.append('{}：阶段{}用时{:.4f}秒，基线{:.4f}秒'.format(name, stage, seconds, base_seconds))
+            if record['peak_rss_mb'] > base_record['peak_rss_mb'] * (1 + tolerance):
+                regressions.append('{}：阶段{}峰值内存{}MB，基线{}MB'.format(
+                    name, stage, record['peak_rss_mb'], base_record['peak_rss_mb']))
+        if 'iterations_per_s' not in result or 'iterations_per_s' not in base:
+            continue
+        if result['iterations_per_s'] < base['iterations_per_s'] * (1 - tolerance):
+            regressions.append('{}：ALNS迭代速度{}次/秒，基线{}次/秒'.format(
+                name, result['iterations_per_s'], base['iterations_per_s']))
+        for key in ('obj_value', 'obj_value_1'):
+            if result[key] > base[key]:
+                regressions.append('{}：{}为{}，基线{}'.format(name, key, result[key], base[key]))
+    return regressions
+
+
+def load_json(path: str, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def dump_json(path: str, value):
+    """原子写入JSON文件"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.{}.tmp'.format(os.getpid())
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(value, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def run_benchmark(matrix: list, repeat=1, iterations=200, tolerance=0.2, history_path=history_file,
+                  baseline_path=baseline_file, save_baseline=False) -> dict:
+    """
+    在算例矩阵上运行基准测试（每个算例一个新的子进程），将本次记录追加到历史文件，并与基线比较
+    :return: 本次记录
+    """
+    results = {}
+    for name, path, scale in matrix:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(run_instance, path, repeat, iterations).result()
+        result['scale'] = scale
+        results[name] = result
+        print('{}：{}'.format(name, '，'.join('{} {:.4f}秒'.format(stage, result['stages'][stage]['seconds'])
+                                              for stage in stages if stage in result['stages'])))
+        if 'error' in result:
+            print('    运行出错：{}'.format(result['error']))
+        else:
+            print('    峰值内存{}MB，ALNS迭代速度{}次/秒，目标函数值{}/{}->{}'.format(
+                max(record['peak_rss_mb'] for record in result['stages'].values()), result['iterations_per_s'],
+                result['obj_value'], result['obj_value_1'], result['improved_obj_value']))
+
+    baseline = load_json(baseline_path, {})
+    record = {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'repeat': repeat,
+        'results': results,
+        'regressions': find_regressions(results, baseline.get('results', {}), tolerance),
+    }
+
+    history = load_json(history_path, [])
+    history.append(record)
+    dump_json(history_path, history)
+    if save_baseline:
+        dump_json(baseline_path, record)
+
+    if record['regressions']:
+        print('\n发现{}项性能回退（基线提交{}）：'.format(len(record['regressions']), baseline.get('commit')))
+        for line in record['regressions']:
+            print('    ' + line)
+    elif baseline:
+        print('\n与基线（提交{}）相比未发现性能回退！'.format(baseline.get('commit')))
+    return record
+
+
+def benchmark_priority_queue(n_sites=135, n_customers=35, n_time=2000, seed=0):
+    """
+    优先级队列微基准：模拟初始解生成算法中每个时刻的边缘节点选择过程（每个时刻重建队列，逐客户节点出队若干
+    不满足QoS约束的边缘节点并按剩余带宽占比重新计算其优先级，再从被选中的边缘节点分配带宽并修改其优先级），
+    比较原实现（PriorityQueue，每次计算优先级时对剩余带宽求和）和现实现（IndexedPriorityQueue，增量维护剩余带宽总和）
+    :return: {实现名称: 用时（秒）}
+    """
+    rnd = np.random.RandomState(seed)
+    priorities = rnd.random_sample((n_time, n_sites)).round(4).tolist()
+    skips = rnd.randint(0, 8, size=(n_time, n_customers)).tolist()
+    demand = rnd.randint(1, 100, size=(n_time, n_customers)).tolist()
+    band_width = rnd.randint(1000, 10000, size=n_sites).tolist()
+
+    def run_heapq():
+        for t in range(n_time):
+            supply = band_width[:]
+            queue = PriorityQueue()
+            for j in range(n_sites):
+                queue.put(j, priorities[t][j])
+            for i in range(n_customers):
+                memory_list = []
+                for _ in range(skips[t][i]):
+                    k = queue.get()
+                    memory_list.append((k, round(0.5 * supply[k] / sum(supply) + 0.5 * priorities[t][k], 4)))
+                j = queue.get()
+                supply[j] -= demand[t][i]
+                queue.put(j, round(0.5 * supply[j] / sum(supply) + 0.5 * priorities[t][j], 4))
+                for k, priority in memory_list:
+                    queue.put(k, priority)
+
+    def run_indexed():
+        total = sum(band_width)
+        queue = IndexedPriorityQueue(n_sites)
+        for t in range(n_time):
+            supply = band_width[:]
+            total_supply = total
+            queue.build(priorities[t])
+            for i in range(n_customers):
+                memory_list = []
+                for _ in range(skips[t][i]):
+                    k = queue.get()
+                    memory_list.append((k, round(0.5 * supply[k] / total_supply + 0.5 * priorities[t][k], 4)))
+                j = queue.peek()
+                supply[j] -= demand[t][i]
+                total_supply -= demand[t][i]
+                queue.update(j, round(0.5 * supply[j] / total_supply + 0.5 * priorities[t][j], 4))
+                for k, priority in memory_list:
+                    queue.put(k, priority)
+
+    elapsed = {}
+    for name, run in (('PriorityQueue+求和', run_heapq), ('IndexedPriorityQueue+增量总和', run_indexed)):
+        start = time.perf_counter()
+        run()
+        elapsed[name] = time.perf_counter() - start
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CodeCraft-2022基准测试')
+    parser.add_argument('--data', default=data_root, help='算例目录')
+    parser.add_argument('--match', nargs='*', help='仅测试名称包含这些子串的算例')
+    parser.add_argument('--repeat', type=int, default=1, help='每个算例的重复次数（各阶段取最短用时）')
+    parser.add_argument('--iterations', type=int, default=200, help='improve阶段的ALNS迭代次数')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='判定回退的相对阈值')
+    parser.add_argument('--history', default=history_file, help='历史文件路径')
+    parser.add_argument('--baseline', default=baseline_file, help='基线文件路径')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为基线')
+    parser.add_argument('--generate', nargs='*', default=[],
+                        help='追加仿真算例，格式为"时刻数量,客户节点数量,边缘节点数量,压力[,QoS密度[,随机数种子]]"')
+    parser.add_argument('--synthetic-only', action='store_true', help='仅测试--generate指定的仿真算例')
+    parser.add_argument('--priority-queue', action='store_true', help='仅运行优先级队列微基准')
+    arguments = parser.parse_args()
+
+    if arguments.priority_queue:
+        for n_sites in (135, 1000):
+            for name, seconds in benchmark_priority_queue(n_sites=n_sites, n_time=500).items():
+                print('边缘节点数量{}，{}用时{:.4f}秒！'.format(n_sites, name, seconds))
+        sys.exit(0)
+
+    matrix = [] if arguments.synthetic_only else instance_matrix(arguments.data, arguments.match)
+    matrix += synthetic_matrix(arguments.generate)
+    benchmark = run_benchmark(matrix, arguments.repeat,
+                              arguments.iterations, arguments.tolerance, arguments.history, arguments.baseline,
+                              arguments.save_baseline)
+    sys.exit(1 if benchmark['regressions'] else 0)
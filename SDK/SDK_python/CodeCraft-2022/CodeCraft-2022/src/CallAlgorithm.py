@@ -6,17 +6,93 @@
 @time: 2022/3/22 20:54
 @description:
 """
-import copy
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from Results import Results
-from ReadData import read_data
-from utils import PriorityQueue, time_this, Parameter
+from Results import Results, SiteLoadTracker, SolutionSnapshot
+from WaterFilling import water_fill, water_fill_timesteps
+from DestroyRepairOperator import Candidate, random_destroy, worst_destroy, single_destroy, greedy_repair, \
+    random_repair
+from OperatorSelection import OperatorSelector, ProgressClock
+from Criteria import make_criterion
+from ScheduleCache import ScheduleCache
+from ReadData import read_data, Instance
+from utils import IndexedPriorityQueue, InfeasibleError, time_this, Parameter, RunController, SharedArray, \
+    Tracer
 
 parameter = Parameter()
 
+_worker = {}  # 子进程中的全局状态（由进程池初始化函数设置）
+
+
+class ConstructionVariant:
+    """
+    初始解生成算法的变体，用于多起点构建：每个变体拥有独立的alpha、客户节点排序方式和随机数流，
+    随机数流由变体编号派生，与进程数量无关，保证任意进程数量下结果可复现
+    """
+
+    orders = ('qos', 'demand', 'random')  # 客户节点排序方式：可服务边缘节点数量、总需求降序、随机
+
+    def __init__(self, index: int, generator: str, alpha: float, order: str, seed_sequence):
+
+        self.index = index  # 变体编号，0号变体为默认配置
+        self.generator = generator  # 初始解生成函数名称
+        self.alpha = alpha  # 更新边缘节点被选择的优先级时使用的系数
+        self.order = order  # 客户节点排序方式
+        self.rng = np.random.default_rng(seed_sequence)  # 独立的随机数流
+
+    def site_jitter(self, n: int, p: float) -> np.ndarray:
+        """边缘节点初始选择优先级的随机扰动，用于打破边缘节点之间的平局，0号变体不扰动"""
+        if self.index == 0:
+            return np.zeros(n)
+        return self.rng.uniform(0, p, n)
+
+    def customer_priority(self, cus_priority_list: list, demand: np.ndarray) -> list:
+        """按照排序方式计算客户节点的优先级（越小越先被分配）"""
+        if self.order == 'demand':
+            total_demand = demand.sum(axis=0).tolist()
+            return [(cus_priority_list[i], -total_demand[i]) for i in range(len(cus_priority_list))]
+        if self.order == 'random':
+            return self.rng.permutation(len(cus_priority_list)).tolist()
+        return cus_priority_list
+
+    def __repr__(self):
+        return 'ConstructionVariant({}, {}, alpha={:.4f}, order={})'.format(
+            self.index, self.generator, self.alpha, self.order)
+
+
+def construction_variants(starts: int) -> list:
+    """
+    生成starts个初始解生成算法的变体，0号变体与单起点构建的默认配置一致
+    """
+    seed_sequences = np.random.SeedSequence(parameter.seed).spawn(starts)
+    generators = ('initial_solution_generation', 'initial_solution_generation_1')
+    variants = [ConstructionVariant(0, generators[0], parameter.alpha, 'qos', seed_sequences[0])]
+    for k in range(1, starts):
+        alpha = float(np.random.default_rng(seed_sequences[k].spawn(1)[0]).uniform(0.1, 0.9))
+        variants.append(ConstructionVariant(k, generators[k % len(generators)], alpha,
+                                            ConstructionVariant.orders[k // len(generators) % 3], seed_sequences[k]))
+    return variants
+
+
+def customer_order(cus_priority_list: list) -> list:
+    """
+    客户节点分配顺序：将客户节点按优先级构建优先级队列，依次出队（优先级相同时索引小者优先）
+    :param cus_priority_list: 各个客户节点的优先级
+    """
+    priority_queue_i = IndexedPriorityQueue(len(cus_priority_list))
+    priority_queue_i.build(cus_priority_list)
+    cus_order = []
+    while not priority_queue_i.empty():
+        cus_order.append(priority_queue_i.get())
+    return cus_order
+
 
 @time_this
-def initial_solution_generation(cus_list: list, sit_list: list, qos_dict: dict, qos_constraint: int):
+def initial_solution_generation(cus_list: list, sit_list: list, qos_dict: dict, qos_constraint: int,
+                                variant=None, write_file=True):
     """
     基于贪婪启发式算法构建流量分配模型初始解，算法逻辑：
         （1）迭代次数=len(mtime_list)，索引为t，此为外层循环
@@ -30,6 +106,8 @@ def initial_solution_generation(cus_list: list, sit_list: list, qos_dict: dict,
     :param sit_list: 边缘节点类对象列表
     :param qos_dict: 边缘节点和客户之间的时延字典，键(site_name, customer_name)，值qos_value
     :param qos_constraint: 客户节点和边缘节点之间的网络质量
+    :param variant: 初始解生成算法的变体（ConstructionVariant，用于多起点构建），None表示默认配置
+    :param write_file: 是否将结果写入到文件
     :return:
     """
     print('\n开始初始解生成算法！')
@@ -39,50 +117,65 @@ def initial_solution_generation(cus_list: list, sit_list: list, qos_dict: dict,
     # 时刻列表
     mtime_list = initial_solution.mtime_list
 
+    # 更新边缘节点被选择的优先级时使用的系数
+    alpha = parameter.alpha if variant is None else variant.alpha
+
+    # 带宽需求矩阵（t*i）和边缘节点带宽上限列表，直接索引以避免内层循环中的属性查找
+    demand = initial_solution.instance.demand
+    band_width = initial_solution.instance.band_width.tolist()
+
     # 构建二维数组，表示时刻t边缘节点j被选择的优先级
     p = 1 / len(sit_list)
     select_priority = np.full((len(mtime_list), len(sit_list)), round(p, parameter.decimal))
+    if variant is not None:
+        select_priority += variant.site_jitter(len(sit_list), p)
+
+    # 各个边缘节点截止到当前时刻的负载序列的顺序统计结构，用来更新边缘节点被选择的优先级
+    tracker = SiteLoadTracker(np.zeros((len(mtime_list), len(sit_list)), dtype=np.int64), length=0)
 
     # 计算客户节点优先级选择队列输入数据，基于对每个客户节点i，其优先级=能为该客户节点服务的边缘节点数量
-    cus_priority_list = []
-    # 记录能对客户节点进行服务的边缘节点索引，{i_index:[j_index_1,j_index_2]}
-    # cus_serve_by_site = {}
-    for i in range(len(cus_list)):
-        count = 0
-        # cus_serve_by_site[i] = []
-        for j in range(len(sit_list)):
-            if initial_solution.qos_np[i][j] < initial_solution.qos_constraint:
-                count += 1
-                # cus_serve_by_site[i].append(j)
-        cus_priority_list.append(count)
+    cus_priority_list = initial_solution.adjacency.cus_degree.tolist()
+    # 客户节点i能否被边缘节点j服务（Python嵌套列表，供内层循环逐元素访问）
+    qos_feasible = initial_solution.adjacency.mask.tolist()
+    if variant is not None:
+        cus_priority_list = variant.customer_priority(cus_priority_list, demand)
+
+    # 构建客户节点优先级队列，优先级越小的客户节点，在每次时刻迭代中，优先被安排分配流量，由于各个时刻的
+    # 客户节点顺序相同，只需出队一次得到客户节点分配顺序
+    cus_order = customer_order(cus_priority_list)
+
+    # 边缘节点优先级队列，优先级越小的边缘节点，在被分配时候将被优先选择（每个时刻O(1)清空后O(N)重建）
+    priority_queue_j = IndexedPriorityQueue(len(sit_list))
+    total_band_width = sum(band_width)
+    decimal = parameter.decimal  # 边缘节点优先级保留的小数位数
+
+    # 热点路径计数（局部累加，结束后计入跟踪类的计数器）：分配次数、堆操作次数、边缘节点带宽耗尽次数
+    tracer = Tracer()
+    allocations = heap_ops = exhaustions = 0
 
     # 逐时刻，将边缘节点带宽分配给客户节点
     for t in range(len(mtime_list)):
-        print('\n开始为时刻{}安排流量分配计划!'.format(mtime_list[t]))
+        if tracer.debug:
+            tracer.emit('DEBUG', '\n开始为时刻{}安排流量分配计划!', mtime_list[t])
 
-        # 当前时刻，各个边缘节点剩余可供分配的带宽
-        sit_left_supply = [sit_list[j].band_width for j in range(len(sit_list))]
+        # 当前时刻，各个边缘节点剩余可供分配的带宽，及其总和（随分配增量维护，不再逐次求和）
+        sit_left_supply = band_width[:]
+        total_left_supply = total_band_width
 
         # 当前时刻，各个客户节点还未满足的带宽
-        cus_left_demand = [cus_list[i].demand[t] for i in range(len(cus_list))]
-
-        # 构建客户节点优先级队列，优先级越小的客户节点，在每次时刻迭代中，优先被安排分配流量
-        priority_queue_i = PriorityQueue()
-        for i in range(len(cus_list)):
-            priority_queue_i.put(i, cus_priority_list[i])
+        cus_left_demand = demand[t].tolist()
 
-        # 构建边缘节点优先级队列，优先级越小的边缘节点，在被分配时候将被优先选择
-        priority_queue_j = PriorityQueue()
-        for j in range(len(sit_list)):
-            priority_queue_j.put(j, select_priority[t][j])
+        # 构建边缘节点优先级队列（使用Python浮点数，避免内层循环中numpy标量运算的开销）
+        select_row = select_priority[t].tolist()
+        priority_queue_j.build(select_row)
+        heap_ops += 1
 
         # 在当前t时刻，按照客户节点优先级越低，逐客户节点分配带宽
-        while not priority_queue_i.empty():
+        for i_index in cus_order:
 
-            i_index = priority_queue_i.get()
-            print('开始为客户节点{}分配流量带宽，其当前时刻带宽需求为{}！'.format(
-                cus_list[i_index].name, cus_list[i_index].demand[t]), end='->'
-            )
+            if tracer.debug:
+                tracer.emit('DEBUG', '开始为客户节点{}分配流量带宽，其当前时刻带宽需求为{}！',
+                            cus_list[i_index].name, cus_left_demand[i_index], end='->')
 
             # 记忆列表，用来记住在给当前客户节点分配带宽之后，依然还剩下带宽需求的边缘节点
             memory_list = []
@@ -94,60 +187,79 @@ def initial_solution_generation(cus_list: list, sit_list: list, qos_dict: dict,
                 if cus_left_demand[i_index] == 0:
                     break
 
-                # 根据优先级队列选择优先级最小的边缘节点用来服务当前客户节点
-                j_index = priority_queue_j.get()
+                # 根据优先级队列选择优先级最小的边缘节点用来服务当前客户节点（可被一次性满足时原地修改其优先级，
+                # 否则出队）
+                j_index = priority_queue_j.peek()
 
                 # 若客户节点i和边缘节点j之间的QoS满足给定阈值，则进行分配
-                if initial_solution.qos_np[i_index, j_index] < initial_solution.qos_constraint:
+                if qos_feasible[i_index][j_index]:
 
                     if cus_left_demand[i_index] < sit_left_supply[j_index]:  # 可被一次性满足
                         initial_solution.solution[t, i_index, j_index] += cus_left_demand[i_index]
                         sit_left_supply[j_index] -= cus_left_demand[i_index]
+                        total_left_supply -= cus_left_demand[i_index]
                         cus_left_demand[i_index] = 0
 
-                        priority = parameter.alpha * (sit_left_supply[j_index] / sum(sit_left_supply)) + \
-                                   (1 - parameter.alpha) * select_priority[t][j_index]
-                        priority_queue_j.put(j_index, round(priority, parameter.decimal))
+                        priority = alpha * (sit_left_supply[j_index] / total_left_supply) + \
+                                   (1 - alpha) * select_row[j_index]
+                        priority_queue_j.update(j_index, round(priority, decimal))
+                        allocations += 1
+                        heap_ops += 1
 
                         break
 
+                    priority_queue_j.get()
+                    heap_ops += 1
                     if 0 < sit_left_supply[j_index] <= cus_left_demand[i_index]:  # 不可被一次性满足
                         initial_solution.solution[t, i_index, j_index] += sit_left_supply[j_index]
                         cus_left_demand[i_index] -= sit_left_supply[j_index]
+                        total_left_supply -= sit_left_supply[j_index]
                         sit_left_supply[j_index] = 0
+                        allocations += 1
+                        exhaustions += 1
 
                 # 否则不分配，并且插入为优先级队列中
                 else:
-                    priority = parameter.alpha * (sit_left_supply[j_index] / sum(sit_left_supply)) + \
-                               (1 - parameter.alpha) * select_priority[t][j_index]
-                    memory_list.append((j_index, round(priority, parameter.decimal)))
+                    priority_queue_j.get()
+                    heap_ops += 1
+                    priority = alpha * (sit_left_supply[j_index] / total_left_supply) + \
+                               (1 - alpha) * select_row[j_index]
+                    memory_list.append((j_index, round(priority, decimal)))
 
             # 若遍历完优先级队列，依然无法满足当前客户节点，则应该抛出错误！
             if cus_left_demand[i_index] != 0:
-                print("分配失败！")
-                raise Exception("无法满足客户节点{}的带宽需求！".format(cus_list[i_index].name))
-            else:
-                print("分配成功！")
+                tracer.emit('ERROR', "分配失败！")
+                raise InfeasibleError("无法满足客户节点{}的带宽需求！".format(cus_list[i_index].name))
+            elif tracer.debug:
+                tracer.emit('DEBUG', "分配成功！")
 
             for memo in memory_list:
                 priority_queue_j.put(memo[0], memo[1])
+            heap_ops += len(memory_list)
+
+        # 更新下一时刻边缘节点被选择的优先级，基于顺序统计结构增量维护截止到当前时刻的95分位带宽值
+        if parameter.priority_update and t < len(mtime_list) - 1:
+            cost_to_now = tracker.append(initial_solution.solution[t].sum(axis=0))
+            total_cost_to_now = cost_to_now.sum()
+            if total_cost_to_now > 0:
+                select_priority[t + 1] = alpha * (cost_to_now / total_cost_to_now) + \
+                                         (1 - alpha) * select_priority[t]
+            else:
+                select_priority[t + 1] = select_priority[t]
 
-        # # 更新下一时刻边缘节点被选择的优先级
-        # if t < len(mtime_list) - 1:
-        #     total_cost_to_now = initial_solution.objective_terminated_t(t, [j for j in range(len(sit_list))])
-        #     for j in range(len(sit_list)):
-        #         total_cost_to_now_j = initial_solution.objective_terminated_t(t, [j]) / total_cost_to_now
-        #         select_priority[t + 1, j] = parameter.alpha * total_cost_to_now_j + \
-        #                                     (1 - parameter.alpha) * select_priority[t, j]
+    tracer.count('allocations', allocations)
+    tracer.count('heap_ops', heap_ops)
+    tracer.count('site_exhaustions', exhaustions)
 
-    # 验证当前解是否为可行解
-    if parameter.env != 'norm':
-        flag = initial_solution.check_feasible()
-        if flag is True:
-            initial_solution.objective()  # 计算目标函数值
+    # 验证当前解是否为可行解（向量化检查，比赛环境下同样开启）
+    report = initial_solution.check_feasible()
+    print("\n{}".format(report))
+    if report.feasible:
+        initial_solution.objective()  # 计算目标函数值
 
     # 将结果写入到文件
-    initial_solution.write_to_file()
+    if write_file:
+        initial_solution.write_to_file()
 
     print('\n初始解生成算法结束！')
 
@@ -155,13 +267,16 @@ def initial_solution_generation(cus_list: list, sit_list: list, qos_dict: dict,
 
 
 @time_this
-def initial_solution_generation_1(cus_list: list, sit_list: list, qos_dict: dict, qos_constraint: int):
+def initial_solution_generation_1(cus_list: list, sit_list: list, qos_dict: dict, qos_constraint: int,
+                                  variant=None, write_file=True):
     """
     基于贪婪启发式算法构建流量分配模型初始解，本函数在上一函数的基础上进行优化，减少对不必要的边缘节点进行分配
     :param cus_list: 客户类对象列表
     :param sit_list: 边缘节点类对象列表
     :param qos_dict: 边缘节点和客户之间的时延字典，键(site_name, customer_name)，值qos_value
     :param qos_constraint: 客户节点和边缘节点之间的网络质量
+    :param variant: 初始解生成算法的变体（ConstructionVariant，用于多起点构建），None表示默认配置
+    :param write_file: 是否将结果写入到文件
     :return:
     """
     print('\n开始初始解生成算法！')
@@ -171,48 +286,111 @@ def initial_solution_generation_1(cus_list: list, sit_list: list, qos_dict: dict
     # 时刻列表
     mtime_list = initial_solution.mtime_list
 
+    # 更新边缘节点被选择的优先级时使用的系数
+    alpha = parameter.alpha if variant is None else variant.alpha
+
+    # 带宽需求矩阵（t*i）和边缘节点带宽上限列表，直接索引以避免内层循环中的属性查找
+    demand = initial_solution.instance.demand
+    band_width = initial_solution.instance.band_width.tolist()
+
     # 构建二维数组，表示时刻t边缘节点j被选择的优先级
     p = 1 / len(sit_list)
     select_priority = np.full((len(mtime_list), len(sit_list)), round(p, parameter.decimal))
+    if variant is not None:
+        select_priority += variant.site_jitter(len(sit_list), p)
+
+    # 各个边缘节点截止到当前时刻的负载序列的顺序统计结构，用来更新边缘节点被选择的优先级
+    tracker = SiteLoadTracker(np.zeros((len(mtime_list), len(sit_list)), dtype=np.int64), length=0)
 
     # 计算客户节点优先级选择队列输入数据，基于对每个客户节点i，其优先级=能为该客户节点服务的边缘节点数量
-    cus_priority_list = []
+    cus_priority_list = initial_solution.adjacency.cus_degree.tolist()
     # 记录能对客户节点进行服务的边缘节点索引，{i_index:[j_index_1,j_index_2]}
-    cus_serve_by_site = {}
-    for i in range(len(cus_list)):
-        count = 0
-        cus_serve_by_site[i] = []
-        for j in range(len(sit_list)):
-            if initial_solution.qos_np[i][j] < initial_solution.qos_constraint:
-                count += 1
-                cus_serve_by_site[i].append(j)
-        cus_priority_list.append(count)
-
-    # 构建客户节点优先级队列，优先级越小的客户节点，在每次时刻迭代中，优先被安排分配流量
-    priority_queue_i_for_all = PriorityQueue()
-    for i in range(len(cus_list)):
-        priority_queue_i_for_all.put(i, cus_priority_list[i])
+    cus_serve_by_site = initial_solution.adjacency.serve_lists()
+    if variant is not None:
+        cus_priority_list = variant.customer_priority(cus_priority_list, demand)
+
+    # 构建客户节点优先级队列，优先级越小的客户节点，在每次时刻迭代中，优先被安排分配流量，由于各个时刻的
+    # 客户节点顺序相同，只需出队一次得到客户节点分配顺序
+    cus_order = customer_order(cus_priority_list)
+    cus_names = [cus.name for cus in cus_list]
+
+    # 逐时刻分配的实现：向量化注水内核或逐元素循环（参考实现），二者结果逐位相同
+    allocate = water_fill_timesteps if parameter.water_fill else allocate_timesteps
+
+    # 各个时刻相互独立（select_priority不被更新时），可将时间轴切分为若干块并行分配
+    workers = parameter.construct_workers if not _worker else 1
+    if (workers is None or workers > 1) and not parameter.priority_update:
+        parallel_allocate_timesteps(initial_solution.solution, demand, band_width, select_priority,
+                                    cus_serve_by_site, cus_order, cus_names, mtime_list, workers)
+    elif not parameter.priority_update:
+        allocate(initial_solution.solution, demand, band_width, select_priority,
+                 cus_serve_by_site, cus_order, cus_names, mtime_list, 0, len(mtime_list))
+    else:
+        # 逐时刻，将边缘节点带宽分配给客户节点，并更新下一时刻边缘节点被选择的优先级
+        for t in range(len(mtime_list)):
+            allocate(initial_solution.solution, demand, band_width, select_priority,
+                     cus_serve_by_site, cus_order, cus_names, mtime_list, t, t + 1)
+
+            # 基于顺序统计结构增量维护截止到当前时刻的95分位带宽值
+            if t < len(mtime_list) - 1:
+                cost_to_now = tracker.append(initial_solution.solution[t].sum(axis=0))
+                total_cost_to_now = cost_to_now.sum()
+                if total_cost_to_now > 0:
+                    select_priority[t + 1] = alpha * (cost_to_now / total_cost_to_now) + \
+                                             (1 - alpha) * select_priority[t]
+                else:
+                    select_priority[t + 1] = select_priority[t]
+
+    # 验证当前解是否为可行解（向量化检查，比赛环境下同样开启）
+    report = initial_solution.check_feasible()
+    print("\n{}".format(report))
+    if report.feasible:
+        initial_solution.objective()  # 计算目标函数值
+
+    # 将结果写入到文件
+    if write_file:
+        initial_solution.write_to_file()
+
+    print('\n初始解生成算法结束！')
+
+    return initial_solution
+
+
+def allocate_timesteps(solution: np.ndarray, demand: np.ndarray, band_width: list, select_priority: np.ndarray,
+                       cus_serve_by_site: dict, cus_order: list, cus_names: list, mtime_list: list,
+                       t_start: int, t_end: int):
+    """
+    initial_solution_generation_1在时刻[t_start, t_end)内的逐时刻分配，结果直接写入solution
+    :param solution: 解数组，维度：t*i*j（可为共享内存中的数组）
+    :param demand: 带宽需求矩阵，维度：t*i
+    :param band_width: 边缘节点带宽上限列表
+    :param select_priority: 时刻t边缘节点j被选择的优先级，维度：t*j
+    :param cus_serve_by_site: 能对客户节点进行服务的边缘节点索引，{i_index:[j_index_1,j_index_2]}
+    :param cus_order: 客户节点分配顺序
+    :param cus_names: 客户节点名称列表
+    :param mtime_list: 时刻列表
+    """
+    # 热点路径计数（局部累加，结束后计入跟踪类的计数器）：分配次数、边缘节点带宽耗尽次数
+    tracer = Tracer()
+    allocations = exhaustions = 0
 
     # 逐时刻，将边缘节点带宽分配给客户节点
-    for t in range(len(mtime_list)):
-        print('\n开始为时刻{}安排流量分配计划!'.format(mtime_list[t]))
+    for t in range(t_start, t_end):
+        if tracer.debug:
+            tracer.emit('DEBUG', '\n开始为时刻{}安排流量分配计划!', mtime_list[t])
 
         # 当前时刻，各个边缘节点剩余可供分配的带宽
-        sit_left_supply = [sit_list[j].band_width for j in range(len(sit_list))]
+        sit_left_supply = band_width[:]
 
         # 当前时刻，各个客户节点还未满足的带宽
-        cus_left_demand = [cus_list[i].demand[t] for i in range(len(cus_list))]
-
-        # 客户节点优先级队列
-        priority_queue_i = copy.deepcopy(priority_queue_i_for_all)
+        cus_left_demand = demand[t].tolist()
 
         # 在当前t时刻，按照客户节点优先级从低到高，逐客户节点分配带宽
-        while not priority_queue_i.empty():
+        for i_index in cus_order:
 
-            i_index = priority_queue_i.get()
-            print('开始为客户节点{}分配流量带宽，其当前时刻带宽需求为{}！'.format(
-                cus_list[i_index].name, cus_list[i_index].demand[t]), end='->'
-            )
+            if tracer.debug:
+                tracer.emit('DEBUG', '开始为客户节点{}分配流量带宽，其当前时刻带宽需求为{}！',
+                            cus_names[i_index], cus_left_demand[i_index], end='->')
 
             # 构建边缘节点选择列表，选择优先级越小越靠后，靠后的边缘节点，在被分配时候将被优先选择
             sit_select_list = []
@@ -232,43 +410,224 @@ def initial_solution_generation_1(cus_list: list, sit_list: list, qos_dict: dict
                 j_index = sit_select_list.pop()[0]
 
                 if cus_left_demand[i_index] < sit_left_supply[j_index]:  # 可被一次性满足
-                    initial_solution.solution[t, i_index, j_index] += cus_left_demand[i_index]
+                    solution[t, i_index, j_index] += cus_left_demand[i_index]
                     sit_left_supply[j_index] -= cus_left_demand[i_index]
                     cus_left_demand[i_index] = 0
+                    allocations += 1
 
                     break
 
                 if 0 < sit_left_supply[j_index] <= cus_left_demand[i_index]:  # 不可被一次性满足
-                    initial_solution.solution[t, i_index, j_index] += sit_left_supply[j_index]
+                    solution[t, i_index, j_index] += sit_left_supply[j_index]
                     cus_left_demand[i_index] -= sit_left_supply[j_index]
                     sit_left_supply[j_index] = 0
+                    allocations += 1
+                    exhaustions += 1
 
             # 若遍历完优先级队列，依然无法满足当前客户节点，则应该抛出错误！
             if cus_left_demand[i_index] != 0:
-                print("分配失败！")
-                raise Exception("无法满足客户节点{}的带宽需求！".format(cus_list[i_index].name))
-            else:
-                print("分配成功！")
-
-        # 更新下一时刻边缘节点被选择的优先级（由于下述代码极其耗时）
-        # if t < len(mtime_list) - 1:
-        #     total_cost_to_now = initial_solution.objective_terminated_t(t, [j for j in range(len(sit_list))])
-        #     for j in range(len(sit_list)):
-        #         total_cost_to_now_j = initial_solution.objective_terminated_t(t, [j]) / total_cost_to_now
-        #         select_priority[t + 1, j] = parameter.alpha * total_cost_to_now_j + \
-        #                                     (1 - parameter.alpha) * select_priority[t, j]
-
-    # 验证当前解是否为可行解
-    if parameter.env != 'norm':
-        flag = initial_solution.check_feasible()
-        if flag is True:
-            initial_solution.objective()  # 计算目标函数值
+                tracer.emit('ERROR', "分配失败！")
+                raise InfeasibleError("无法满足客户节点{}的带宽需求！".format(cus_names[i_index]))
+            elif tracer.debug:
+                tracer.emit('DEBUG', "分配成功！")
+
+    tracer.count('allocations', allocations)
+    tracer.count('site_exhaustions', exhaustions)
+
+
+def _init_allocate_worker(arrays: dict, args: tuple, quiet: bool):
+    """
+    并行逐时刻分配进程池的初始化函数：挂载共享内存中的需求矩阵、选择优先级和解数组
+    """
+    if quiet:
+        sys.stdout = None
+    _worker['shared'] = {key: SharedArray.attach(spec) for key, spec in arrays.items()}
+    _worker['args'] = args
+
+
+def _run_allocate_chunk(t_range: tuple):
+    """在子进程中分配时刻[t_start, t_end)，结果直接写入共享内存中的解数组"""
+    shared = _worker['shared']
+    band_width, cus_serve_by_site, cus_order, cus_names, mtime_list = _worker['args']
+    allocate = water_fill_timesteps if parameter.water_fill else allocate_timesteps
+    allocate(shared['solution'].array, shared['demand'].array, band_width,
+             shared['select_priority'].array, cus_serve_by_site, cus_order, cus_names, mtime_list,
+             t_range[0], t_range[1])
+
+
+def parallel_allocate_timesteps(solution: np.ndarray, demand: np.ndarray, band_width: list,
+                                select_priority: np.ndarray, cus_serve_by_site: dict, cus_order: list,
+                                cus_names: list, mtime_list: list, workers=None):
+    """
+    将时间轴切分为若干连续的块，在进程池中并行调用allocate_timesteps，各进程直接写入共享内存中的解数组，
+    由于各个时刻相互独立，结果与串行分配逐位相同
+    :param workers: 进程数量，None表示使用全部CPU核心
+    """
+    workers = workers or multiprocessing.cpu_count()
+    bounds = np.linspace(0, len(mtime_list), min(len(mtime_list), workers * 4) + 1).astype(int).tolist()
+    chunks = [(bounds[k], bounds[k + 1]) for k in range(len(bounds) - 1) if bounds[k] < bounds[k + 1]]
+
+    shared = {
+        'solution': SharedArray.from_array(solution),
+        'demand': SharedArray.from_array(demand),
+        'select_priority': SharedArray.from_array(select_priority),
+    }
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_allocate_worker,
+                                 initargs=({key: array.spec() for key, array in shared.items()},
+                                           (band_width, cus_serve_by_site, cus_order, cus_names, mtime_list),
+                                           sys.stdout is None)) as pool:
+            list(pool.map(_run_allocate_chunk, chunks))
+        solution[...] = shared['solution'].array
+    finally:
+        for array in shared.values():
+            array.close()
+
+
+def _init_multi_start(arrays: dict, names: dict, output_spec: tuple, best, quiet: bool):
+    """
+    多起点构建进程池的初始化函数：挂载共享内存中的输入数组和输出数组，并在子进程中重建问题实例
+    """
+    if quiet:
+        sys.stdout = None
+    shared = {key: SharedArray.attach(spec) for key, spec in arrays.items()}
+    data = {key: array.array for key, array in shared.items()}
+    data.update(names)
+    instance = Instance(data)
+    _worker['shared'] = shared
+    _worker['instance'] = instance
+    _worker['qos_dict'] = instance.qos_dict()
+    _worker['output'] = SharedArray.attach(output_spec)
+    _worker['best'] = best
+
+
+def _run_variant(variant: ConstructionVariant) -> tuple:
+    """
+    在子进程中运行一个初始解生成算法的变体，若其目标函数值优于当前最优（目标函数值相同时变体编号小者优先），
+    则将解写入共享内存中的输出数组，仅最优解被传回父进程
+    仅捕获无法满足需求的异常（InfeasibleError），其余异常经由future传回父进程
+    :return: (变体编号, 目标函数值, 无法满足需求时的异常信息)
+    """
+    instance = _worker['instance']
+    try:
+        solution = globals()[variant.generator](instance.cus_list, instance.sit_list, _worker['qos_dict'],
+                                                instance.qos_constraint, variant=variant, write_file=False)
+    except InfeasibleError as e:
+        return variant.index, sys.maxsize, str(e)
+    obj_value = solution.obj_value
+    best = _worker['best']
+    with best.get_lock():
+        if (obj_value, variant.index) < (best[0], best[1]):
+            _worker['output'].array[...] = solution.solution
+            best[0], best[1] = obj_value, variant.index
+    return variant.index, obj_value, None
+
+
+def multi_start_generation(cus_list: list, sit_list: list, qos_dict: dict, qos_constraint: int,
+                           starts=None, workers=None):
+    """
+    多起点构建初始解：在进程池中并行运行starts个初始解生成算法的变体（各自的alpha、随机数种子和客户节点排序方式），
+    输入数组通过共享内存发布一次，仅最优变体的解通过共享内存传回
+    :param starts: 变体数量，默认为parameter.multi_start
+    :param workers: 进程数量，默认为parameter.workers
+    :return: 最优变体的解决方案
+    """
+    instance = cus_list[0].instance
+    starts = parameter.multi_start if starts is None else starts
+    workers = parameter.workers if workers is None else workers
+    variants = construction_variants(starts)
+    print('\n开始多起点构建初始解！变体数量{}，进程数量{}！'.format(starts, workers))
+
+    shared = {
+        'demand': SharedArray.from_array(instance.demand),
+        'band_width': SharedArray.from_array(instance.band_width),
+        'qos': SharedArray.from_array(instance.qos),
+    }
+    names = {
+        'mtime': np.array(instance.mtime),
+        'cus_names': np.array(instance.cus_names),
+        'sit_names': np.array(instance.sit_names),
+        'qos_constraint': np.array(instance.qos_constraint),
+    }
+    output = SharedArray((len(instance.mtime), len(cus_list), len(sit_list)), np.int64)
+    tracer = Tracer()
+    best = multiprocessing.Array('q', [sys.maxsize, sys.maxsize])  # 当前最优的(目标函数值, 变体编号)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_multi_start,
+                                 initargs=({key: array.spec() for key, array in shared.items()}, names,
+                                           output.spec(), best, sys.stdout is None)) as pool:
+            for index, obj_value, error in pool.map(_run_variant, variants):
+                if error is not None:
+                    tracer.count('infeasible_variants')
+                    tracer.emit('WARNING', '变体{}未得到可行解：{}', variants[index], error)
+                elif obj_value == sys.maxsize:
+                    tracer.count('infeasible_variants')
+                    tracer.emit('WARNING', '变体{}未得到可行解：可行性检查未通过！', variants[index])
+                else:
+                    print('变体{}的目标函数值为{}！'.format(variants[index], obj_value))
+        if best[1] == sys.maxsize:
+            raise Exception("多起点构建失败，所有变体均未得到可行解！")
+        initial_solution = Results(cus_list, sit_list, qos_dict, qos_constraint)
+        initial_solution.solution[...] = output.array
+    finally:
+        for array in list(shared.values()) + [output]:
+            array.close()
+
+    print('最优变体为{}！'.format(variants[best[1]]))
+    report = initial_solution.check_feasible()
+    print("\n{}".format(report))
+    if report.feasible:
+        initial_solution.objective()  # 计算目标函数值
 
     # 将结果写入到文件
     initial_solution.write_to_file()
 
-    print('\n初始解生成算法结束！')
+    return initial_solution
+
+
+@time_this
+def cached_generation(cus_list: list, sit_list: list, qos_dict: dict, qos_constraint: int, cache: ScheduleCache):
+    """
+    基于解决方案缓存构建初始解：需求未变化的时刻直接复用缓存的分配，需求变化或新增的时刻在复用结果的基础上
+    贪婪修复（优先分配给不抬高95分位带宽值的边缘节点，见greedy_repair），并增量更新受影响边缘节点的95分位带宽值；
+    贪婪修复失败时，改用向量化注水分配这些时刻
+    :param cache: 解决方案缓存
+    :return: 初始解，缓存未命中时返回None
+    """
+    initial_solution = Results(cus_list, sit_list, qos_dict, qos_constraint)
+    match = cache.match(initial_solution.instance)
+    if match is None:
+        print('\n解决方案缓存未命中！')
+        return None
+    t_reuse, flows, t_changed = match
+    print('\n解决方案缓存命中！复用{}个时刻，重新分配{}个时刻！'.format(len(t_reuse), len(t_changed)))
+
+    # 复用缓存的分配，并基于复用结果（重新分配的时刻负载为0）建立顺序统计结构
+    adjacency = initial_solution.adjacency
+    initial_solution.solution[t_reuse[:, None], adjacency.edge_cus, adjacency.cus_sites] = flows
+    initial_solution.objective()
+
+    if len(t_changed) > 0:
+        candidate = greedy_repair(Candidate(initial_solution, t_changed.tolist()), np.random.RandomState(parameter.seed))
+        if candidate.feasible:
+            candidate.accept()
+        else:
+            candidate.reject()
+            print('贪婪修复失败，改用向量化注水分配需求变化的时刻！')
+            instance = initial_solution.instance
+            select_priority = np.full((len(t_changed), len(sit_list)), round(1 / len(sit_list), parameter.decimal))
+            rows = water_fill(instance.demand[t_changed], instance.band_width, select_priority, adjacency.mask,
+                              customer_order(adjacency.cus_degree.tolist()), instance.cus_names)
+            initial_solution.set_rows(t_changed, rows)
+
+    report = initial_solution.check_feasible()
+    print("\n{}".format(report))
+    if not report.feasible:
+        return None
+    print("合并后的目标函数值为{}！".format(initial_solution.obj_value))
 
+    # 将结果写入到文件
+    initial_solution.write_to_file()
     return initial_solution
 
 
@@ -287,15 +646,102 @@ def algorithm(cus_list: list, sit_list: list, qos_dict: dict, qos_constraint: in
     :param qos_constraint: 客户节点和边缘节点之间的网络质量
     :return:
     """
-    initial_solution = initial_solution_generation(cus_list, sit_list, qos_dict, qos_constraint)
+    controller = RunController()
+    cache = ScheduleCache() if parameter.schedule_cache else None
+
+    # 构建初始解，初始解生成后立即写入文件，确保在截止时刻之前文件中始终存在可行解；启用解决方案缓存时，
+    # 优先复用缓存中需求未变化的时刻
+    with controller.phase('construct'):
+        initial_solution = None
+        if cache is not None:
+            initial_solution = cached_generation(cus_list, sit_list, qos_dict, qos_constraint, cache)
+        if initial_solution is None:
+            if parameter.multi_start > 1:
+                initial_solution = multi_start_generation(cus_list, sit_list, qos_dict, qos_constraint)
+            else:
+                initial_solution = initial_solution_generation(cus_list, sit_list, qos_dict, qos_constraint)
 
     if parameter.iterations < 0:
         raise ValueError("Negative number of iterations.")
 
+    destroy_operators = [random_destroy, worst_destroy]  # 破坏算子
+    if parameter.adaptive_operators:
+        destroy_operators.append(single_destroy)  # 代价最小的单节点破坏，其使用频率由自适应选择决定
+    repair_operators = [greedy_repair]  # 修复算子
+    if parameter.acceptance != 'hc':
+        repair_operators.append(random_repair)  # 可能劣化的随机修复，仅用于可接受劣化候选解的接受标准
+    rnd_state = np.random.RandomState(parameter.seed)
+    selector = OperatorSelector(destroy_operators, repair_operators)
+
+    # 候选解原地修改当前解（事务式，拒绝时回滚）；最优解为当前解的快照，仅在当前解改进时复制被修改的时刻
     current_solution = best_solution = initial_solution
-    for iteration in range(parameter.iterations):
+    if current_solution.tracker is None:
+        current_solution.objective()
+    initial_obj_value = current_solution.obj_value
+    snapshot = SolutionSnapshot(current_solution)
+    criterion = make_criterion(initial_obj_value)  # 接受标准
+
+    print('\n开始ALNS算法！')
+    tracer = Tracer()
+    start = time.perf_counter()
+    accepted = iterations = 0
+    with controller.phase('improve'):
+        # 搜索进度用于随截止时刻临近降低破坏比例，可用时间取剩余时间与改进阶段预算的较小者
+        budget = parameter.phase_budget.get('improve')
+        clock = ProgressClock(parameter.iterations,
+                              controller.remaining() if budget is None else min(controller.remaining(), budget))
+        for iteration in range(parameter.iterations):
+
+            # 在截止时刻（已预留写入时间）或阶段预算用完之前停止
+            if controller.should_stop('improve'):
+                print('ALNS算法到达时间预算，提前停止！')
+                break
+            iterations += 1
+
+            progress = clock.progress(iteration)
+            stats = selector.select(rnd_state)
+            degree = selector.degree(progress) if selector.adaptive else None
+            cpu_start = time.process_time()
+            with tracer.span('destroy'):
+                candidate = stats.destroy(current_solution, rnd_state, degree)
+            with tracer.span('repair'):
+                candidate = stats.repair(candidate, rnd_state)
+
+            # 先以下界判断能否提前拒绝，否则仅重算受影响边缘节点的95分位带宽值
+            with tracer.span('evaluate'):
+                if criterion.decide(candidate, snapshot.obj_value, progress, rnd_state):
+                    candidate.accept()
+                    snapshot.touch(candidate.t_index)
+                    snapshot.update()
+                    accepted += 1
+                    selector.update(stats, max(0, -candidate.delta), time.process_time() - cpu_start, True)
+                else:
+                    candidate.reject()
+                    selector.update(stats, 0, time.process_time() - cpu_start, False)
+
+    # 当前解劣于最优解时（模拟退火等接受了劣化的候选解），恢复为最优解
+    snapshot.restore()
+
+    tracer.count('alns_iterations', iterations)
+    tracer.count('alns_accepted', accepted)
+    elapsed = time.perf_counter() - start
+    print('ALNS算法结束！迭代{}次，接受{}次，用时{:.4f}秒，{:.2f}次/秒，目标函数值{}->{}！'.format(
+        iterations, accepted, elapsed, iterations / elapsed if elapsed > 0 else 0,
+        initial_obj_value, best_solution.obj_value))
+    print(criterion.report())
+    criterion.record()
+    print(selector.report())
+    selector.write_stats()
 
-        pass
+    # 将结果写入到文件
+    if best_solution.obj_value < initial_obj_value:
+        with controller.phase('write'):
+            best_solution.write_to_file()
+
+    # 将最优解写入解决方案缓存，供需求文件重新下发后增量重算
+    if cache is not None and controller.remaining() > 0:
+        with controller.phase('cache'):
+            cache.store(best_solution)
 
     return best_solution
 
@@ -4,212 +4,332 @@
 @contact: yuanxin9997@qq.com
 @file: CallSolver.py
 @time: 2022/3/21 19:53
-@description:
+@description:基于95分位紧凑模型和求解器后端（默认HiGHS，可选Gurobi）的精确求解方法，仅适用于小规模算例；
+    大规模算例使用滚动时域分解（rolling_horizon_solve），逐窗口求解并拼接
 """
 
-import math
 import sys
+import time
+import multiprocessing
 import numpy as np
-from gurobipy import *
-from gurobipy import GRB
 from ReadData import read_data
-from utils import Parameter
-from Results import Results
+from utils import Parameter, RunController, Tracer
+from Results import Results, percentile_index
+from SolverBackend import LinearModel, make_backend
 
 parameter = Parameter()
 parameter.produce_path()
 
 
-def construct_scheduling_model(cus_list: list, sit_list: list, qos_dict: dict, qos_constraint: int):
+def build_scheduling_model(instance, t_start=0, t_end=None, burst_quota=None, level=None) -> tuple:
     """
-    基于Gurobi构建流量分配模型，并调用Gurobi进行求解
+    基于问题实例的整数索引数组（带宽需求、带宽上限、QoS邻接结构）批量构建时刻[t_start, t_end)上的95分位紧凑模型：
+        x_{te}：t时刻边e=(i, j)上分配的带宽，仅为满足QoS约束的边创建变量，索引x_start+t*E+e
+        s_j：边缘节点j的95分位带宽值，索引s_start+j
+        b_{tj}：t时刻是否为边缘节点j的突发时刻，索引b_start+t*N+j
+    各类约束均以稀疏COO块一次性添加
+    :param burst_quota: 各边缘节点在窗口内可用的突发时刻数量，维度：j，None表示T-k（完整时间轴）
+    :param level: 各边缘节点已承担的95分位带宽值（作为s_j的下界），维度：j，None表示0
+    :return: (模型, 变量布局字典{'x': x_start, 's': s_start, 'b': b_start, 'n_edges': E})
+    """
+    demand, band_width, adjacency = instance.demand[t_start:t_end], instance.band_width, instance.adjacency
+    n_time, n_cus = demand.shape
+    n_sit, n_edges = len(band_width), adjacency.n_edges
+    edge_cus, edge_sit = adjacency.edge_cus, adjacency.cus_sites
+    burst_quota = n_time - percentile_index(n_time) if burst_quota is None else burst_quota
+    level = 0 if level is None else np.minimum(level, band_width)
+
+    m = LinearModel("flow_scheduling_model")
+
+    # 定义变量
+    x = m.add_variables(n_time * n_edges, lb=0, integer=True)[0]
+    # s_j最优时等于某一时刻的负载，为整数，故可松弛为连续变量
+    s = m.add_variables(n_sit, lb=level, ub=band_width, obj=1)[0]
+    b = m.add_variables(n_time * n_sit, lb=0, ub=1, integer=True)[0]
+
+    # 各个x_{te}的变量索引、所在时刻、客户节点和边缘节点，维度：T*E（展平）
+    t_of = np.repeat(np.arange(n_time), n_edges)
+    x_cols = x + np.arange(n_time * n_edges)
+    cus_of, sit_of = np.tile(edge_cus, n_time), np.tile(edge_sit, n_time)
+
+    # （2）客户节点带宽需求只能分配到满足QoS约束的边缘节点：不满足约束的边不创建变量
+
+    # （3）客户节点带宽需求必须全部分配给边缘节点，约束t*M+i
+    m.add_constraints(n_time * n_cus, t_of * n_cus + cus_of, x_cols, 1, lb=demand.ravel(), ub=demand.ravel())
+
+    # （4）边缘节点接收的带宽需求不能超过其带宽上限，约束t*N+j
+    load_rows = t_of * n_sit + sit_of
+    m.add_constraints(n_time * n_sit, load_rows, x_cols, 1, ub=np.tile(band_width, n_time))
+
+    # （5）非突发时刻，边缘节点接收的带宽需求不能超过s_j：sum_i x_ijt - s_j - (C_j - level_j) * b_tj <= 0，
+    # 由s_j >= level_j，突发时刻的负载仍仅受带宽上限约束，约束t*N+j
+    tj = np.arange(n_time * n_sit)
+    m.add_constraints(
+        n_time * n_sit,
+        np.concatenate([load_rows, tj, tj]),
+        np.concatenate([x_cols, s + tj % n_sit, b + tj]),
+        np.concatenate([np.ones(len(x_cols)), -np.ones(len(tj)), -np.tile(band_width - level, n_time).astype(float)]),
+        ub=0)
+
+    # （6）每个边缘节点的突发时刻数量不超过T-k（或窗口内的突发时刻配额），约束j
+    m.add_constraints(n_sit, tj % n_sit, b + tj, 1, ub=burst_quota)
+
+    return m.finish(), {'x': x, 's': s, 'b': b, 'n_edges': n_edges}
+
+
+def construct_scheduling_model(cus_list: list, sit_list: list, qos_dict: dict, qos_constraint: int, backend=None):
+    """
+    构建流量分配模型（O(N*T)规模的95分位紧凑模型，见build_scheduling_model），并调用求解器后端进行求解：
+        对每个边缘节点j，允许至多T-k个"突发时刻"（b_tj=1）的负载超过s_j，其余时刻负载不超过s_j，
+        其中k为95分位数的位次，则最优解中s_j恰为边缘节点j负载序列的第k小值（即95分位带宽值），
+        突发时刻的负载仅受带宽上限约束（以带宽上限作为大M）
     :param cus_list: 客户类对象列表
     :param sit_list: 边缘节点类对象列表
     :param qos_dict: 边缘节点和客户之间的时延字典，键(site_name, customer_name)，值qos_value
     :param qos_constraint: 客户节点和边缘节点之间的网络质量
-    :return:
+    :param backend: 求解器后端（SolverBackend或其名称），None表示使用parameter.solver_backend
+    :return: (模型规模统计, 求解结果, Results对象（无可行解时为None）)
     """
-    # 创建Gurobi模型
-    m = Model("flow_scheduling_model")
+    backend = make_backend(backend) if backend is None or isinstance(backend, str) else backend
 
-    # 定义变量
+    # 创建模型
+    results = Results(cus_list, sit_list, qos_dict, qos_constraint)
+    m, layout = build_scheduling_model(results.instance)
+    stats = m.stats()
+    print(m.describe())
+
+    # 求解模型，时间上限不超过剩余可用时间
+    time_limit = parameter.solver_time_limit
+    remaining = RunController().remaining()
+    time_limit = remaining if time_limit is None else min(time_limit, remaining)
+    result = backend.solve(m, time_limit=time_limit, mip_gap=parameter.solver_mip_gap)
+    print('求解器后端{}：{}'.format(backend.name, result))
+    stats.update(backend=backend.name, status=result.status, objective=result.objective, solve_time=result.solve_time)
 
-    # x_{ijt}: 用 𝑋 表示一组流量分配方案，即 𝑡 时刻第 𝑖 个客户节点向第 𝑗 个
-    # 边缘节点分配的带宽为 𝑋𝑖𝑗𝑡 (1 ≤ 𝑖 ≤ 𝑀, 1 ≤ 𝑗 ≤ 𝑁，𝑡 ∈ 𝑇)。
-    x_index = {}
-    mtime_list = cus_list[0].mtime
-    for t in range(len(mtime_list)):
-        for i in range(len(cus_list)):
-            for j in range(len(sit_list)):
-                x_index[cus_list[i].name, sit_list[j].name, mtime_list[t]] = 0
-    x = m.addVars(x_index.keys(), lb=0, vtype=GRB.INTEGER, name='x')
-
-    # w_{j, t}: 第 𝑗 个边缘节点在 𝑡 时刻的总带宽需求
-    w_index = {}
-    for j in range(len(sit_list)):
-        for t in mtime_list:
-            w_index[sit_list[j].name, t] = 0
-    w = m.addVars(w_index, lb=0, vtype=GRB.INTEGER, name='w')
-
-    # u_{j, t1, t2}: 第 j 个边缘节点，若在t1时刻的总带宽需求，大于等于，在t2时刻的总带宽需求，则为1，否则为0，t1可等于t2
-    u_index = {}
-    for j in range(len(sit_list)):
-        for t1 in mtime_list:
-            for t2 in mtime_list:
-                u_index[sit_list[j].name, t1, t2] = 0
-    u = m.addVars(u_index, vtype=GRB.BINARY, name='u')
-
-    # s_j：对所有 𝑡 ∈ 𝑇，边缘节点 𝑗 的 95 百分位带宽值
-    s_index = {}
-    for j in range(len(sit_list)):
-        s_index[sit_list[j].name] = 0
-    s = m.addVars(s_index, lb=0, vtype=GRB.INTEGER, name='s')
-
-    # v_{j, t}：若v_{j,t}=1，则s_j=w_{j,t}，否则为0，不成立
-    v_index = {}
-    for j in range(len(sit_list)):
-        for t in mtime_list:
-            v_index[sit_list[j].name, t] = 0
-    v = m.addVars(v_index, vtype=GRB.BINARY, name='v')
-
-    # 构建约束
-
-    # （2）客户节点带宽需求只能分配到满足 QoS 约束的边缘节点
-    for i in range(len(cus_list)):
-        for j in range(len(sit_list)):
-            if qos_dict[sit_list[j].name, cus_list[i].name] >= qos_constraint:
-                for t in mtime_list:
-                    m.addConstr(x[cus_list[i].name, sit_list[j].name, t] == 0,
-                                name='(2)_%s_%s_%s' % (
-                                    cus_list[i].name, sit_list[j].name, t
-                                ))
-
-    # （3）客户节点带宽需求必须全部分配给边缘节点
-    for t in mtime_list:
-        for i in range(len(cus_list)):
-            ind = cus_list[i].mtime.index(t)
-            m.addConstr(
-                x.sum(cus_list[i].name, '*', t) == cus_list[i].demand[ind], name='(3)_%s_%s' % (
-                    t, cus_list[i].name
-                )
-            )
-
-    # （4）边缘节点接收的带宽需求不能超过其带宽上限
-    for t in mtime_list:
-        for j in range(len(sit_list)):
-            m.addConstr(x.sum('*', sit_list[j].name, t) <= sit_list[j].band_width, name='(4)_%s_%s' % (
-                t, sit_list[j].name
-            ))
-
-    # （5）定义变量w
-    for j in range(len(sit_list)):
-        for t in range(len(mtime_list)):
-            m.addConstr(w[sit_list[j].name, mtime_list[t]] == x.sum('*', sit_list[j].name, mtime_list[t]),
-                        name='(5)_%s_%s' % (sit_list[j].name, mtime_list[t]))
-
-    # （6）定义变量u
-    for j in range(len(sit_list)):
-        # 同一边缘节点，所有时刻变量值相加等于，1+2+...+len(时刻列表)
-        # m.addConstr(u.sum(sit_list[j].name, '*') == sum(i for i in range(1, len(mtime_list) + 1)))
-        for t1 in range(len(mtime_list)):
-            for t2 in range(t1, len(mtime_list)):
-                m.addGenConstrIndicator(
-                    u[sit_list[j].name, mtime_list[t1], mtime_list[t2]],
-                    True,
-                    w[sit_list[j].name, mtime_list[t1]] - w[sit_list[j].name, mtime_list[t2]],
-                    GRB.GREATER_EQUAL,
-                    0,
-                    name='(6)_%s_%s_%s' % (sit_list[j].name, mtime_list[t1], mtime_list[t2])
-                )
-
-    # （7）定义变量v和s
-    percentile_95 = math.ceil(0.95 * len(mtime_list))
-    for j in range(len(sit_list)):
-        m.addConstr(
-            v.sum(sit_list[j].name, '*') == 1, name='(7.2)_%s' % (sit_list[j].name)
-        )
-        for t in range(len(mtime_list)):
-            m.addGenConstrIndicator(
-                v[sit_list[j].name, mtime_list[t]],
-                True,
-                s[sit_list[j].name] - w[sit_list[j].name, mtime_list[t]],
-                GRB.EQUAL,
-                0,
-                name='(7.1)_%s_%s' % (sit_list[j].name, mtime_list[t])
-            )
-            m.addGenConstrIndicator(
-                v[sit_list[j].name, mtime_list[t]],
-                True,
-                u.sum(sit_list[j].name, mtime_list[t], '*'),
-                GRB.EQUAL,
-                percentile_95,
-                name='(7.3)_%s_%s' % (sit_list[j].name, mtime_list[t])
-            )
-
-    # 构建目标函数
-    total_cost = 0
-    for j in range(len(sit_list)):
-        total_cost += s[sit_list[j].name]
-    m.setObjective(total_cost, GRB.MINIMIZE)
-    m.update()
-
-    # 求解模型
-    m.optimize()
-
-    # 打印解，并将解决方案写入到文件中
-    if m.status == GRB.OPTIMAL:
-
-        # 打印解决方案
-        for t in range(len(mtime_list)):
-            for i in range(len(cus_list)):
-                for j in range(len(sit_list)):
-                    if x[cus_list[i].name, sit_list[j].name, mtime_list[t]].x != 0:
-                        print('%s-%s-%s: %s' % (
-                            mtime_list[t],
-                            cus_list[i].name,
-                            sit_list[j].name,
-                            x[cus_list[i].name, sit_list[j].name, mtime_list[t]].x))
-        print('\n\n最优解: %g' % m.objVal)
-
-        # 将解决方案写入到文件中
-        with open(parameter.solution_path, mode='w', encoding='utf-8') as f:
-            for t in range(len(mtime_list)):
-                for i in range(len(cus_list)):
-                    f.write(cus_list[i].name + ':')
-                    if cus_list[i].demand == 0:
-                        continue
-                    str_to_write = ''
-                    for j in range(len(sit_list)):
-                        if x[cus_list[i].name, sit_list[j].name, mtime_list[t]].x != 0:
-                            str_to_write += '<' + sit_list[j].name + ',' + str(int(x[cus_list[i].name,
-                                                                                     sit_list[j].name,
-                                                                                     mtime_list[t]].x)) + '>,'
-                    f.write(str_to_write[0:-1])
-                    f.write('\n')
-            print("\n\n成功将解决方案写入到文件{}!".format(parameter.solution_path))
-
-        # 检查Gurobi求解的结果是否满足题目要求
-        results = Results(cus_list, sit_list, qos_dict, qos_constraint)
-        # results.solution = np.zeros((len(mtime_list), len(cus_list), len(sit_list)))
-        for t in range(len(mtime_list)):
-            for i in range(len(cus_list)):
-                for j in range(len(sit_list)):
-                    results.solution[t][i][j] = int(x[cus_list[i].name, sit_list[j].name, mtime_list[t]].x)
-        status = results.check_feasible()
-        if status is False:
-            sys.exit("探测到不可行解，系统退出！")
-        else:
-            print("检测通过，满足所有约束！")
-
-    elif m.status == GRB.INFEASIBLE:
-        print("模型无解！")
-        m.computeIIS()
-        print('\nThe following constraint cannot be satisfied:')
-        for c in m.getConstrs():
-            if c.IISConstr:
-                print('%s' % c.constrName)
+    if not result.has_solution:
+        print("模型无解！" if result.status == 'infeasible' else "未找到可行解！")
+        return stats, result, None
+
+    # 将解决方案转换为Results
+    adjacency = results.adjacency
+    n_time, n_edges = results.solution.shape[0], layout['n_edges']
+    flows = np.rint(result.x[layout['x']:layout['x'] + n_time * n_edges]).astype(np.int64).reshape(n_time, n_edges)
+    results.solution[:, adjacency.edge_cus, adjacency.cus_sites] = flows
+    print('\n\n{}解: {}'.format('最优' if result.status == 'optimal' else '可行', result.objective))
+
+    # 检查求解的结果是否满足题目要求，并将解决方案写入到文件中
+    report = results.check_feasible()
+    print(report)
+    if not report.feasible:
+        sys.exit("探测到不可行解，系统退出！")
     else:
-        print("未知错误！")
+        print("检测通过，满足所有约束！")
+    results.objective()
+    results.write_to_file()
+
+    return stats, result, results
+
+
+def window_level(loads: np.ndarray, burst_quota: np.ndarray, level: np.ndarray) -> np.ndarray:
+    """
+    给定窗口内各边缘节点的负载，在突发时刻配额下各边缘节点的最小95分位带宽值：每个边缘节点负载最大的
+    burst_quota[j]个时刻作为突发时刻，其余时刻的最大负载与已承担的带宽值level[j]取大者
+    :param loads: 窗口内各边缘节点的负载，维度：t*j
+    :return: 各边缘节点的95分位带宽值，维度：j
+    """
+    n_time = loads.shape[0]
+    quota = np.clip(burst_quota, 0, n_time).astype(np.int64)
+    ranked = -np.sort(-loads, axis=0)  # 各边缘节点负载从大到小排序
+    padded = np.vstack([ranked, np.zeros((1, loads.shape[1]), dtype=ranked.dtype)])
+    return np.maximum(level, padded[quota, np.arange(loads.shape[1])])
+
+
+def window_start(instance, layout: dict, flows: np.ndarray, burst_quota: np.ndarray, level: np.ndarray) -> tuple:
+    """
+    将窗口内的分配结果（维度：t*i*j）转换为窗口模型的变量取值，作为MIP初始解
+    :return: (变量取值数组, 目标函数值)
+    """
+    adjacency, n_sit = instance.adjacency, len(instance.band_width)
+    loads = flows.sum(axis=1)
+    cost = window_level(loads, burst_quota, level)
+    x = flows[:, adjacency.edge_cus, adjacency.cus_sites].ravel()
+    b = (loads > cost).ravel()
+    start = np.zeros(layout['b'] + len(b))
+    start[layout['x']:layout['x'] + len(x)], start[layout['s']:layout['s'] + n_sit], start[layout['b']:] = x, cost, b
+    return start, int(cost.sum())
+
+
+def _solve_window(connection, backend, model, time_limit, mip_gap, start, quiet: bool):
+    """在子进程中求解一个窗口模型，求解结果通过管道传回"""
+    if quiet:
+        sys.stdout = None
+    connection.send(backend.solve(model, time_limit=time_limit, mip_gap=mip_gap, start=start))
+    connection.close()
+
+
+def solve_windows(tasks: list, time_limit: float) -> list:
+    """
+    每个窗口模型在独立的子进程中同时求解，超过time_limit+parameter.rolling_kill_grace仍未返回的子进程被终止
+    （HiGHS在部分模型上会远超其时间上限），以保证不超过全局截止时刻
+    :param tasks: [(求解器后端, 模型, MIP初始解或None), ...]
+    :return: 各窗口的求解结果，被终止的窗口为None
+    """
+    processes = []
+    for backend, model, start in tasks:
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_solve_window, daemon=True, args=(
+            sender, backend, model, time_limit, parameter.solver_mip_gap, start, sys.stdout is None))
+        process.start()
+        sender.close()
+        processes.append((process, receiver))
+
+    kill_time = time.perf_counter() + time_limit + parameter.rolling_kill_grace
+    results = []
+    for process, receiver in processes:
+        try:
+            result = receiver.recv() if receiver.poll(max(0.0, kill_time - time.perf_counter())) else None
+        except EOFError:  # 子进程异常退出
+            result = None
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        receiver.close()
+        results.append(result)
+    return results
+
+
+def rolling_horizon_solve(cus_list: list, sit_list: list, qos_dict: dict, qos_constraint: int, backend=None,
+                          window=None, overlap=None, window_time_limit=None, workers=None):
+    """
+    滚动时域分解求解：将时间轴切分为长度为window、相邻窗口重叠overlap个时刻的窗口，逐窗口构建95分位紧凑模型求解，
+    每个窗口仅提交前window-overlap个时刻（最后一个窗口全部提交），重叠部分留给下一窗口重新优化。
+    窗口之间传递的状态：
+        已用突发时刻：各边缘节点在窗口内的突发时刻配额为T-k减去已提交时刻中的突发时刻数量，再减去初始解在
+            窗口之后的突发时刻数量（为后续时刻保留初始解所需的配额）
+        已承担的95分位带宽值：作为窗口模型中s_j的下界，不超过该值的负载不再增加成本
+    每个窗口以initial_solution_generation_1的分配结果作为初始解：支持MIP初始解的后端直接使用，否则以初始解的
+    目标函数值作为窗口模型目标函数的上界；求解失败或劣于初始解时使用初始解的分配结果，因此拼接结果始终可行。
+    workers>1时，每轮以同一状态并行求解workers个相邻窗口，各窗口的配额再扣除本轮中排在其之前的窗口内初始解的
+    突发时刻数量，一轮结束后再更新状态（同一轮的窗口互不知晓对方抬高的带宽值，质量通常不如串行求解）。
+    剩余时间不足时不再求解，剩余窗口直接使用初始解的分配结果
+    :param backend: 求解器后端（SolverBackend或其名称），None表示使用parameter.solver_backend
+    :param window: 窗口长度，默认为parameter.rolling_window
+    :param overlap: 相邻窗口重叠的时刻数量，默认为parameter.rolling_overlap
+    :param window_time_limit: 每个窗口的求解时间上限（秒），默认为parameter.rolling_time_limit
+    :param workers: 每轮并行求解的窗口数量（进程数量），默认为parameter.rolling_workers
+    :return: 拼接得到的解决方案与初始解中目标函数值较小者（Results对象）
+    """
+    from CallAlgorithm import initial_solution_generation_1
+
+    backend = make_backend(backend) if backend is None or isinstance(backend, str) else backend
+    window = parameter.rolling_window if window is None else window
+    overlap = parameter.rolling_overlap if overlap is None else overlap
+    window_time_limit = parameter.rolling_time_limit if window_time_limit is None else window_time_limit
+    workers = parameter.rolling_workers if workers is None else workers
+    workers = workers or multiprocessing.cpu_count()
+    if not 0 <= overlap < window:
+        raise Exception("滚动时域窗口长度{}应大于重叠时刻数量{}！".format(window, overlap))
+
+    controller, tracer = RunController(), Tracer()
+
+    # 贪婪初始解：立即写入文件，确保在截止时刻之前文件中始终存在可行解
+    with controller.phase('construct'):
+        greedy = initial_solution_generation_1(cus_list, sit_list, qos_dict, qos_constraint)
+    if greedy.obj_value == sys.maxsize:
+        raise Exception("初始解不可行，无法进行滚动时域求解！")
+
+    instance = greedy.instance
+    n_time, n_sit = greedy.solution.shape[0], len(sit_list)
+    total_burst = n_time - percentile_index(n_time)  # 每个边缘节点在完整时间轴上的突发时刻数量
+    # 初始解中各边缘节点在时刻t及之后的突发时刻数量，维度：(T+1)*j
+    greedy_loads = greedy.solution.sum(axis=1)
+    greedy_burst = greedy_loads > greedy.tracker.cost
+    burst_after = np.vstack([np.cumsum(greedy_burst[::-1], axis=0)[::-1], np.zeros((1, n_sit), dtype=np.int64)])
+    step = window - overlap
+    starts = list(range(0, max(n_time - overlap, 1), step))
+    print('\n开始滚动时域求解！{}个时刻，窗口长度{}，重叠{}，共{}个窗口，每轮并行{}个窗口！'.format(
+        n_time, window, overlap, len(starts), workers))
+
+    stitched = Results(cus_list, sit_list, qos_dict, qos_constraint)
+    used = np.zeros(n_sit, dtype=np.int64)  # 各边缘节点已提交时刻中的突发时刻数量
+    level = np.zeros(n_sit, dtype=np.int64)  # 各边缘节点已承担的95分位带宽值
+    solved = fallback = 0
+    with controller.phase('rolling'):
+        for wave in range(0, len(starts), workers):
+            wave_starts = starts[wave:wave + workers]
+
+            # 以本轮开始时的状态构建本轮各窗口的模型
+            windows = []
+            for t_start in wave_starts:
+                t_end = min(t_start + window, n_time)
+                commit_end = t_end if t_start == starts[-1] else t_start + step
+                ahead = burst_after[wave_starts[0]] - burst_after[t_start]  # 本轮排在前面的窗口所需的配额
+                quota = np.maximum(total_burst - used - ahead - burst_after[t_end], 0)
+                flows = greedy.solution[t_start:t_end]
+                model, layout = build_scheduling_model(instance, t_start, t_end, quota, level)
+                start, start_obj = window_start(instance, layout, flows, quota, level)
+                if not backend.supports_start:
+                    # 不支持MIP初始解的后端：以初始解的目标函数值作为上界，剪除劣于初始解的分支
+                    model.add_constraints(1, np.zeros(n_sit, dtype=np.int64), layout['s'] + np.arange(n_sit), 1,
+                                          ub=start_obj)
+                    model.finish()
+                windows.append((t_start, t_end, commit_end, quota, flows, model, layout, start, start_obj))
+
+            # 剩余时间（扣除终止子进程的宽限时间）按剩余轮数平均分配给本轮，不足时直接使用初始解的分配结果
+            rounds_left = -(-(len(starts) - wave) // workers)
+            time_limit = min(window_time_limit,
+                             controller.remaining() / rounds_left - parameter.rolling_kill_grace)
+            if time_limit > parameter.rolling_min_time:
+                with tracer.span('window'):
+                    results = solve_windows([(backend, w[5], w[7] if backend.supports_start else None)
+                                             for w in windows], time_limit)
+            else:
+                results = [None] * len(windows)
+
+            # 提交各窗口前window-overlap个时刻的分配结果，并更新状态
+            for (t_start, t_end, commit_end, quota, flows, model, layout, start, start_obj), result in \
+                    zip(windows, results):
+                if result is not None and result.has_solution:
+                    n_edges = layout['n_edges']
+                    x = np.rint(result.x[layout['x']:layout['x'] + (t_end - t_start) * n_edges])
+                    solved_flows = np.zeros_like(flows)
+                    solved_flows[:, instance.adjacency.edge_cus, instance.adjacency.cus_sites] = \
+                        x.astype(np.int64).reshape(t_end - t_start, n_edges)
+                    # 以提交时的状态比较求解器解与初始解（并行时本轮排在前面的窗口可能已抬高已承担的带宽值）
+                    if window_level(solved_flows.sum(axis=1), quota, level).sum() < \
+                            window_level(flows.sum(axis=1), quota, level).sum():
+                        flows = solved_flows
+                        solved += 1
+                    else:
+                        fallback += 1
+                else:
+                    fallback += 1
+                commit = flows[:commit_end - t_start]
+                stitched.solution[t_start:commit_end] = commit
+
+                window_cost = window_level(flows.sum(axis=1), quota, level)
+                used += (commit.sum(axis=1) > window_cost).sum(axis=0)
+                level = np.maximum(level, window_cost)
+                print('窗口[{}, {})：提交[{}, {})，{}，窗口目标函数值{}（初始解{}）！'.format(
+                    t_start, t_end, t_start, commit_end,
+                    '求解器{}'.format(result.status) if result is not None else '未得到求解结果',
+                    int(window_cost.sum()), start_obj))
+
+    tracer.count('rolling_windows', solved + fallback)
+    tracer.count('rolling_fallbacks', fallback)
+
+    # 拼接结果的每个时刻均来自可行的分配（求解器解或初始解），逐时刻满足所有约束
+    report = stitched.check_feasible()
+    print(report)
+    if not report.feasible:
+        sys.exit("探测到不可行解，系统退出！")
+    stitched.objective()
+    print('滚动时域求解结束！采用求解器解的窗口{}个，采用初始解的窗口{}个，目标函数值{}（初始解{}）！'.format(
+        solved, fallback, stitched.obj_value, greedy.obj_value))
+
+    best = stitched if stitched.obj_value <= greedy.obj_value else greedy
+    best.write_to_file()
+    return best
 
 
 if __name__ == '__main__':
@@ -9,12 +9,12 @@
 若程序运行超时、运行出错或输出不合法的解（包括调度分配方案不满足题目约束或解格式不正确），
 则判定无成绩。
 """
+from utils import Parameter, RunController, Tracer
 import sys
 import datetime
 from ReadData import read_data
-# from CallSolver import construct_scheduling_model
+# from CallSolver import construct_scheduling_model  # 仅在使用求解器时导入（依赖scipy或gurobipy）
 from CallAlgorithm import algorithm
-from utils import Parameter
 parameter = Parameter()
 
 
@@ -24,23 +24,39 @@ def main(methd=parameter.method):
     :param methd: 求解方法，默认为使用启发式算法
     :return:
     """
+    tracer = Tracer()
     if 'win' not in sys.platform:
         print("程序开始，后续将禁用打印到控制台！")
         sys.stdout = None
+        tracer.set_level('OFF')  # 标准输出已禁用，关闭全部跟踪事件（计数器和阶段计时不受影响）
 
+    controller = RunController()
     print("程序开始，当前时刻为{}！".format(datetime.datetime.now()))
-    customer_list, site_list, qos, qos_constraint = read_data()
-    if methd == 'solver':
-        # construct_scheduling_model(customer_list, site_list, qos, qos_constraint)
-        print("当前系统不支持！")
-    elif methd == 'algorithm':
-        algorithm(customer_list, site_list, qos, qos_constraint)
-    else:
-        raise Exception("求解方式错误！")
+    if methd != 'online':  # 在线分配模式逐行读取需求数据
+        with controller.phase('load'):
+            customer_list, site_list, qos, qos_constraint = read_data()
+    try:
+        if methd == 'online':
+            from Online import run_online
+            run_online()
+        elif methd == 'solver':
+            from CallSolver import construct_scheduling_model
+            construct_scheduling_model(customer_list, site_list, qos, qos_constraint)
+        elif methd == 'rolling':
+            from CallSolver import rolling_horizon_solve
+            rolling_horizon_solve(customer_list, site_list, qos, qos_constraint)
+        elif methd == 'algorithm':
+            algorithm(customer_list, site_list, qos, qos_constraint)
+        else:
+            raise Exception("求解方式错误！")
+    finally:
+        # 标准输出在比赛环境下被禁用，各阶段用时汇总和JSON运行汇总输出到标准错误
+        print(controller.report(), file=sys.stderr)
+        tracer.write_summary()
 
 
 if __name__ == '__main__':
-    if parameter.env is 'norm':
+    if parameter.env == 'norm':
         main()
     else:  # 函数性能分析
         import cProfile
@@ -4,5 +4,132 @@
 @contact: yuanxin9997@qq.com
 @file: Criteria.py
 @time: 2022/3/27 17:28
-@description:ALNS算法接受标准
+@description:ALNS算法接受标准：爬山（HillClimbing）、模拟退火（SimulatedAnnealing）、record-to-record travel
+    （RecordToRecordTravel）。每个接受标准在评估候选解之前先给出可接受的目标函数变化量上限（阈值），再以候选解
+    目标函数变化量的下界（Candidate.lower_bound，不重算95分位带宽值）与阈值比较，下界已超过阈值时提前拒绝，
+    否则才精确评估（Candidate.evaluate）；下界的计算量与时刻数量无关，时刻数量较少、下界不比精确评估更快时跳过
 """
+import math
+import numpy as np
+from utils import Parameter, Tracer
+parameter = Parameter()
+
+
+class Criterion:
+    """接受标准基类，统计候选解数量、不可行数量、提前拒绝数量、精确评估数量和接受数量"""
+    name = None  # 接受标准名称
+
+    def __init__(self):
+        self.candidates = 0  # 候选解数量
+        self.infeasible = 0  # 修复失败（不可行）的候选解数量
+        self.bound_checks = 0  # 计算下界的候选解数量（下界的计算量不低于精确评估时跳过）
+        self.early_rejects = 0  # 基于下界提前拒绝的候选解数量
+        self.evaluations = 0  # 精确评估的候选解数量
+        self.accepted = 0  # 被接受的候选解数量
+
+    def threshold(self, current_obj: int, best_obj: int, progress: float, rnd_state: np.random.RandomState) -> float:
+        """
+        可接受的目标函数变化量上限
+        :param current_obj: 当前解的目标函数值
+        :param best_obj: 最优解的目标函数值
+        :param progress: 搜索进度（0~1）
+        """
+        raise NotImplementedError
+
+    def decide(self, candidate, best_obj: int, progress: float, rnd_state: np.random.RandomState) -> bool:
+        """
+        判断是否接受候选解：先以下界与阈值比较，下界超过阈值时提前拒绝，否则精确评估
+        """
+        self.candidates += 1
+        if not candidate.feasible:
+            self.infeasible += 1
+            return False
+        threshold = self.threshold(candidate.current.obj_value, best_obj, progress, rnd_state)
+        if candidate.bound_pays_off():
+            self.bound_checks += 1
+            if candidate.lower_bound() > threshold:
+                self.early_rejects += 1
+                return False
+        self.evaluations += 1
+        if candidate.evaluate() <= threshold:
+            self.accepted += 1
+            return True
+        return False
+
+    @property
+    def early_reject_fraction(self) -> float:
+        """提前拒绝的候选解占可行候选解的比例"""
+        feasible = self.candidates - self.infeasible
+        return self.early_rejects / feasible if feasible > 0 else 0.0
+
+    def record(self):
+        """将统计计入跟踪计数器"""
+        tracer = Tracer()
+        tracer.count('acceptance_candidates', self.candidates)
+        tracer.count('acceptance_bound_checks', self.bound_checks)
+        tracer.count('acceptance_early_rejects', self.early_rejects)
+        tracer.count('acceptance_evaluations', self.evaluations)
+
+    def report(self) -> str:
+        return '接受标准{}：候选解{}个，不可行{}个，计算下界{}个，提前拒绝{}个（占可行候选解{:.2%}），精确评估{}个，' \
+               '接受{}个！'.format(self.name, self.candidates, self.infeasible, self.bound_checks, self.early_rejects,
+                                 self.early_reject_fraction, self.evaluations, self.accepted)
+
+
+class HillClimbing(Criterion):
+    """爬山：仅接受不劣于当前解的候选解"""
+    name = 'hc'
+
+    def threshold(self, current_obj, best_obj, progress, rnd_state) -> float:
+        return 0
+
+
+class SimulatedAnnealing(Criterion):
+    """
+    模拟退火：以概率exp(-delta/T)接受劣化量为delta的候选解，温度T随搜索进度从start指数降至end。
+    评估前先抽取u~U(0,1)，则接受条件等价于delta<=-T*ln(u)
+    """
+    name = 'sa'
+
+    def __init__(self, start: float, end: float):
+        super().__init__()
+        self.start, self.end = start, end  # 初始温度、结束温度
+
+    def temperature(self, progress: float) -> float:
+        if self.start <= 0:
+            return 0.0
+        return self.start * (max(self.end, 1e-12) / self.start) ** min(max(progress, 0.0), 1.0)
+
+    def threshold(self, current_obj, best_obj, progress, rnd_state) -> float:
+        temperature = self.temperature(progress)
+        if temperature <= 0:
+            return 0
+        return -temperature * math.log(1.0 - rnd_state.random_sample())
+
+
+class RecordToRecordTravel(Criterion):
+    """record-to-record travel：接受目标函数值不超过最优解*(1+ratio)的候选解，ratio随搜索进度从start线性降至end"""
+    name = 'rrt'
+
+    def __init__(self, start: float, end: float):
+        super().__init__()
+        self.start, self.end = start, end  # 搜索开始、结束时允许劣于最优解的比例
+
+    def threshold(self, current_obj, best_obj, progress, rnd_state) -> float:
+        ratio = self.start - (self.start - self.end) * min(max(progress, 0.0), 1.0)
+        return best_obj * (1 + ratio) - current_obj
+
+
+def make_criterion(initial_obj: int, name=None) -> Criterion:
+    """
+    按名称创建接受标准，None表示使用parameter.acceptance
+    :param initial_obj: 初始解的目标函数值，模拟退火的温度按其比例设置
+    """
+    name = parameter.acceptance if name is None else name
+    if name == 'hc':
+        return HillClimbing()
+    if name == 'sa':
+        return SimulatedAnnealing(parameter.sa_start_ratio * initial_obj, parameter.sa_end_ratio * initial_obj)
+    if name == 'rrt':
+        return RecordToRecordTravel(parameter.rrt_start_ratio, parameter.rrt_end_ratio)
+    raise Exception("未知的接受标准{}！可选：hc、sa、rrt".format(name))
@@ -4,67 +4,289 @@
 @contact: yuanxin9997@qq.com
 @file: DestroyRepairOperator.py
 @time: 2022/3/27 17:30
-@description:
+@description:ALNS算法破坏算子和修复算子，算子逻辑：
+    破坏：选择若干边缘节点，对每个边缘节点j，移除其负载在95分位附近的destroy_window+1个时刻的全部带宽，
+    并将这些时刻边缘节点j的负载上限设置为窗口下方的负载值，若修复成功则边缘节点j的95分位带宽值将降至该值
+    修复：在被破坏的时刻，将未被满足的客户节点需求重新分配给不会抬高95分位带宽值的边缘节点（即负载低于其
+    95分位带宽值，或者该时刻处于其前5%的免费时刻），仍无法满足时再分配给剩余带宽最大的边缘节点
 """
-import copy
-import random
-from Results import Results
-from utils import Parameter
+import numpy as np
+from Results import Results, UndoLog
+from utils import Parameter, Tracer
 parameter = Parameter()
-random.seed(42)
 
 
-def worst_destroy(current_solution: Results):
+class Candidate:
     """
-    TODO：最差破坏启发式算法
+    ALNS事务式候选解：破坏和修复算子直接原地修改当前解，并将被修改单元格的原值记录到撤销日志中；评估时仅重算
+    受影响边缘节点的95分位带宽值，接受时提交修改并增量更新当前解的聚合状态，拒绝时按撤销日志回滚
     """
-    destroyed = copy.deepcopy(current_solution)
-    be_destroyed_sit_num = int(parameter.degree_of_destruction * len(current_solution.sit_list))
-    be_destroyed_sit_index = random.sample(current_solution.sit_list, be_destroyed_sit_num)
-    return destroyed
 
+    def __init__(self, current: Results, t_index):
 
-def random_destroy(current_solution: Results):
+        self.current = current  # 当前解
+        self.t_index = np.array(sorted(t_index), dtype=np.int64)  # 被破坏的时刻索引
+        self.undo = UndoLog(current.solution)  # 撤销日志
+        self.level = {}  # 被破坏的时刻索引->{边缘节点索引: 修复时该边缘节点在该时刻允许的负载上限}
+        self.floor = {}  # 被破坏的边缘节点索引->(被破坏的时刻数量m, 原负载序列中第k-m小的负载)，k为95分位带宽值的位次
+        self.feasible = True  # 修复后是否满足所有客户节点的需求
+
+        # 被破坏时刻各个边缘节点的负载、各个客户节点未被满足的需求（随修改增量维护），维度：len(t_index)*j、len(t_index)*i
+        self.loads = current.tracker.loads[self.t_index]
+        self.unmet = current.cus_residual[self.t_index] if current.cus_residual is not None else \
+            current.instance.demand[self.t_index] - current.solution[self.t_index].sum(axis=2)
+
+        self.j_index = None  # 受影响的边缘节点索引（评估后）
+        self.cost = None  # 受影响的边缘节点新的95分位带宽值（评估后）
+        self.delta = 0  # 候选解相对当前解的目标函数变化量（评估后）
+
+    def clear(self, r: int, j: int):
+        """移除第r个被破坏时刻边缘节点j的全部带宽"""
+        t = int(self.t_index[r])
+        column = self.current.solution[t, :, j]
+        i_index = np.nonzero(column)[0]
+        if len(i_index) == 0:
+            return
+        self.undo.record(t, i_index, j)
+        removed = column[i_index]
+        self.current.solution[t, i_index, j] = 0
+        self.loads[r, j] -= removed.sum()
+        self.unmet[r, i_index] += removed
+
+    def add(self, r: int, i: int, sites: np.ndarray, alloc: np.ndarray) -> int:
+        """
+        在第r个被破坏时刻将客户节点i的需求按alloc分配给边缘节点sites
+        :return: 分配的带宽总量
+        """
+        total = int(alloc.sum())
+        if total == 0:
+            return 0
+        t = int(self.t_index[r])
+        self.undo.record(t, i, sites)
+        self.current.solution[t, i, sites] += alloc
+        self.loads[r, sites] += alloc
+        self.unmet[r, i] -= total
+        return total
+
+    def site_loads(self) -> np.ndarray:
+        """被破坏时刻各个边缘节点的负载，维度：len(t_index)*j"""
+        return self.loads
+
+    def bound_pays_off(self) -> bool:
+        """
+        计算下界是否可能比精确评估更快：下界的计算量约为len(t_index)*(band_size+2)*j，与时刻数量无关，
+        精确评估的计算量约为t*j（np.partition）
+        """
+        tracker = self.current.tracker
+        return len(self.t_index) * (tracker.band_size + 2) < tracker.length
+
+    def lower_bound(self) -> int:
+        """
+        不重算95分位带宽值，计算候选解相对当前解的目标函数变化量的下界：对每个负载发生变化的边缘节点，设S为原负载
+        序列，O、N为被破坏时刻的原负载和新负载，则新序列中小于y的负载数量为#{S<y}-#{O<y}+#{N<y}，若其不超过k-1，
+        则新的95分位带宽值不小于y；以band中的各个负载和各个新负载为y，以band估计#{S<y}的上界检验该条件，取通过
+        检验的最大值。
+        若负载下降的时刻不超过m个，则新的95分位带宽值不小于原序列中第k-m小的负载（破坏时记录于floor）
+        """
+        tracker = self.current.tracker
+        old = tracker.loads[self.t_index]
+        j_index = np.nonzero(np.any(self.loads != old, axis=0))[0]
+        if len(j_index) == 0:
+            return 0
+        old, new = old[:, j_index], self.loads[:, j_index]
+        band = tracker.band_of(j_index)  # (band_size+2)*len(j_index)
+        ranks = tracker.band_ranks()
+        k = ranks[1]
+
+        # 以band中的负载为y：#{S<s_r}<=r-1
+        below_new = (new[:, None, :] < band[None]).sum(axis=0)
+        below_old = (old[:, None, :] < band[None]).sum(axis=0)
+        passed = (ranks[:, None] - 1) - below_old + below_new <= k - 1
+        bound = np.where(passed, band, 0).max(axis=0)
+
+        # 以高于95分位带宽值的新负载为y：#{S<y}<=r-1，r为band中第一个不小于y的负载的位次（y超过band时不检验）
+        position = (band[None] < new[:, None, :]).sum(axis=1)  # len(t_index)*len(j_index)
+        r_index, c_index = np.nonzero((new > band[1]) & (position < len(ranks)))
+        if len(r_index) > 0:
+            y = new[r_index, c_index]
+            below_s = ranks[position[r_index, c_index]] - 1
+            below_new = (new[:, c_index] < y).sum(axis=0)
+            below_old = (old[:, c_index] < y).sum(axis=0)
+            passed = below_s - below_old + below_new <= k - 1
+            np.maximum.at(bound, c_index[passed], y[passed])
+        if self.floor:
+            decreased = (new < old).sum(axis=0)
+            for c, j in enumerate(j_index.tolist()):
+                if j in self.floor and decreased[c] <= self.floor[j][0]:
+                    bound[c] = max(bound[c], self.floor[j][1])
+        Tracer().count('bound_evaluations')
+        return int(bound.sum() - tracker.cost[j_index].sum())
+
+    def evaluate(self) -> int:
+        """
+        仅重算受影响边缘节点的95分位带宽值
+        :return: 候选解相对当前解的目标函数变化量
+        """
+        tracker = self.current.tracker
+        self.j_index, self.cost = tracker.evaluate_rows(self.t_index, self.loads)
+        Tracer().count('delta_evaluations')
+        self.delta = int(self.cost.sum() - tracker.cost[self.j_index].sum())
+        return self.delta
+
+    def accept(self):
+        """提交修改，并增量更新当前解的95分位带宽值、目标函数值和剩余量"""
+        if self.j_index is None:
+            self.evaluate()
+        self.current.refresh_rows(self.t_index, self.loads, self.unmet, self.j_index, self.cost)
+        self.undo.clear()
+
+    def reject(self):
+        """按撤销日志将当前解回滚到修改前的状态"""
+        self.undo.rollback()
+
+
+def destroy_sites(current_solution: Results, j_list) -> Candidate:
+    """
+    对边缘节点列表j_list中的每个边缘节点，移除其负载在95分位附近的时刻的全部带宽
+    """
+    tracker = current_solution.tracker
+    k = current_solution.percentile_95
+    window = min(parameter.destroy_window, k - 1)
+
+    site_window = {}  # 边缘节点索引->(被破坏的时刻索引数组, 负载上限)
+    for j in j_list:
+        column = tracker.loads[:tracker.length, j]
+        kth = [r for r in sorted({k - 2 - window, k - 1 - window, k - 1}) if r >= 0]  # 负载上限及窗口两端的位次
+        order = np.argpartition(column, kth)
+        level = int(column[order[k - 2 - window]]) if k - 2 - window >= 0 else 0
+        site_window[j] = (order[k - 1 - window:k], level)
+
+    t_index = set()
+    for t_window, _ in site_window.values():
+        t_index.update(t_window.tolist())
+    candidate = Candidate(current_solution, t_index)
+
+    row = {t: r for r, t in enumerate(candidate.t_index.tolist())}
+    for j, (t_window, level) in site_window.items():
+        for t in t_window.tolist():
+            candidate.clear(row[t], j)
+            candidate.level.setdefault(t, {})[j] = level
+        candidate.floor[j] = (len(t_window), level)
+    return candidate
+
+
+def worst_destroy(current_solution: Results, rnd_state: np.random.RandomState, degree=None) -> Candidate:
+    """
+    最差破坏启发式算法：从95分位带宽值最大的2*n个边缘节点中随机选择n个进行破坏
+    :param degree: 破坏比例，默认为parameter.degree_of_destruction
+    """
+    degree = parameter.degree_of_destruction if degree is None else degree
+    cost = current_solution.tracker.cost
+    be_destroyed_sit_num = max(1, int(degree * np.count_nonzero(cost)))
+    worst = np.argsort(-cost, kind='stable')[:min(2 * be_destroyed_sit_num, np.count_nonzero(cost))]
+    be_destroyed_sit_index = rnd_state.choice(worst, size=min(be_destroyed_sit_num, len(worst)), replace=False)
+    return destroy_sites(current_solution, be_destroyed_sit_index.tolist())
+
+
+def random_destroy(current_solution: Results, rnd_state: np.random.RandomState, degree=None) -> Candidate:
     """
-    TODO：随机破坏启发式算法
+    随机破坏启发式算法：从95分位带宽值大于0的边缘节点中随机选择n个进行破坏
+    :param degree: 破坏比例，默认为parameter.degree_of_destruction
     """
-    destroyed = copy.deepcopy(current_solution)
-    be_destroyed_sit_num = int(parameter.degree_of_destruction * len(current_solution.sit_list))
-    be_destroyed_sit_index = random.sample(current_solution.sit_list, be_destroyed_sit_num)
-    for j_index in be_destroyed_sit_index:
-        destroyed.solution[]
-    return destroyed
+    degree = parameter.degree_of_destruction if degree is None else degree
+    positive = np.nonzero(current_solution.tracker.cost)[0]
+    be_destroyed_sit_num = max(1, int(degree * len(positive)))
+    be_destroyed_sit_index = rnd_state.choice(positive, size=min(be_destroyed_sit_num, len(positive)), replace=False)
+    return destroy_sites(current_solution, be_destroyed_sit_index.tolist())
 
 
-def greedy_repair(current_solution, rnd_state):
+def single_destroy(current_solution: Results, rnd_state: np.random.RandomState, degree=None) -> Candidate:
     """
-    TODO：贪婪修复算法
+    单节点破坏启发式算法：按95分位带宽值加权随机选择1个边缘节点进行破坏（与破坏比例无关），每次迭代的代价最小，
+    所有边缘节点的95分位带宽值均为0时返回空的候选解
     """
-    visited = set(current.edges.values())
+    cost = current_solution.tracker.cost
+    positive = np.nonzero(cost)[0]
+    if positive.size == 0:
+        return destroy_sites(current_solution, [])
+    j = rnd_state.choice(positive, p=cost[positive] / cost[positive].sum())
+    return destroy_sites(current_solution, [int(j)])
 
-    # This kind of randomness ensures we do not cycle between the same
-    # destroy and repair steps every time.
-    shuffled_idcs = rnd_state.permutation(len(current.nodes))
-    nodes = [current.nodes[idx] for idx in shuffled_idcs]
 
-    while len(current.edges) != len(current.nodes):
-        node = next(node for node in nodes
-                    if node not in current.edges)
+def pour(need: int, capacity: np.ndarray) -> np.ndarray:
+    """
+    注水分配：按照capacity的顺序依次分配，直到满足need
+    :return: 每个位置分配的带宽
+    """
+    before = np.cumsum(capacity) - capacity
+    return np.clip(need - before, 0, capacity)
 
-        # Computes all nodes that have not currently been visited,
-        # that is, those that this node might visit. This should
-        # not result in a subcycle, as that would violate the TSP
-        # constraints.
-        unvisited = {other for other in current.nodes
-                     if other != node
-                     if other not in visited
-                     if not would_form_subcycle(node, other, current)}
 
-        # Closest visitable node.
-        nearest = min(unvisited,
-                      key=lambda other: distances.euclidean(node[1], other[1]))
+def greedy_repair(candidate: Candidate, rnd_state: np.random.RandomState) -> Candidate:
+    """
+    贪婪修复算法：逐个被破坏的时刻，按照可服务边缘节点数量从少到多，将客户节点未被满足的需求依次分配给
+    不抬高95分位带宽值的余量最大的边缘节点，仍无法满足时再分配给剩余带宽最大的边缘节点
+    """
+    current = candidate.current
+    tracker = current.tracker
+    band_width = current.instance.band_width
+    adjacency = current.adjacency  # 满足QoS约束的二部图邻接结构
+    cus_order = np.argsort(adjacency.cus_degree, kind='stable')
+
+    loads, unmet = candidate.loads, candidate.unmet
+
+    for r, t in enumerate(candidate.t_index.tolist()):
+        if not unmet[r].any():
+            continue
+
+        # 不抬高95分位带宽值的负载上限：免费时刻为带宽上限，其余时刻为当前95分位带宽值
+        level = np.where(tracker.loads[t] > tracker.cost, band_width, tracker.cost)
+        residual = band_width - loads[r]
+        headroom = np.clip(np.minimum(level, band_width) - loads[r], 0, None)
+        for j, j_level in candidate.level.get(t, {}).items():
+            headroom[j] = max(0, min(j_level, band_width[j]) - loads[r, j])
+
+        for i in cus_order.tolist():
+            need = int(unmet[r, i])
+            if need == 0:
+                continue
+            sites = adjacency.sites_of(i)
+            for capacity in (headroom, residual):
+                sites = sites[np.argsort(-capacity[sites], kind='stable')]
+                alloc = pour(need, np.minimum(capacity[sites], residual[sites]))
+                need -= candidate.add(r, i, sites, alloc)
+                residual[sites] -= alloc
+                headroom[sites] = np.clip(headroom[sites] - alloc, 0, None)
+                if need == 0:
+                    break
+            if need != 0:
+                candidate.feasible = False
+                return candidate
+
+    return candidate
+
+
+def random_repair(candidate: Candidate, rnd_state: np.random.RandomState) -> Candidate:
+    """
+    随机修复算法：逐个被破坏的时刻，按随机顺序将客户节点未被满足的需求分配给随机排列的可服务边缘节点（仅受剩余
+    带宽限制，可能抬高95分位带宽值），用于模拟退火等可接受劣化候选解的接受标准进行多样化
+    """
+    current = candidate.current
+    band_width = current.instance.band_width
+    adjacency = current.adjacency  # 满足QoS约束的二部图邻接结构
+    loads, unmet = candidate.loads, candidate.unmet
 
-        current.edges[node] = nearest
-        visited.add(nearest)
+    for r in range(len(candidate.t_index)):
+        if not unmet[r].any():
+            continue
+        residual = band_width - loads[r]
+        for i in rnd_state.permutation(np.nonzero(unmet[r])[0]).tolist():
+            sites = rnd_state.permutation(adjacency.sites_of(i))
+            alloc = pour(int(unmet[r, i]), residual[sites])
+            candidate.add(r, i, sites, alloc)
+            residual[sites] -= alloc
+            if unmet[r, i] != 0:
+                candidate.feasible = False
+                return candidate
 
-    return current
+    return candidate
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: InstanceGenerator.py
+@time: 2022/3/31 15:20
+@description:确定性的仿真算例生成器，按read_data()读取的格式写入demand.csv、site_bandwidth.csv、qos.csv和config.ini，
+    规模上限为比赛规模（8928个时刻、35个客户节点、135个边缘节点）。
+    可行性保证：每个时刻先构造一个满足QoS约束和带宽上限的分数流（各边缘节点按该时刻的负载率将带宽随机分给
+    可服务的客户节点），客户节点需求取其流入量之和向下取整，由运输问题的整性可知每个时刻均存在整数可行解。
+    压力：各时刻总需求与可达带宽（至少能服务一个客户节点的边缘节点带宽之和）之比的目标均值，各时刻负载率
+    按日周期波动并截断在1以内。
+    需求按天（288个时刻）分块生成并流式写入磁盘，内存占用与时刻数量无关；每块的随机数由(seed, 块序号)决定，
+    相同参数生成的文件逐字节相同
+    用法：python InstanceGenerator.py --time 8928 --customers 35 --sites 135 --pressure 0.8 --density 0.4 --seed 0
+"""
+import argparse
+import datetime
+import os
+import numpy as np
+from ReadData import demand_file_name, site_bandwidth_file_name, qos_file_name, config_file_name
+
+max_time, max_customers, max_sites = 8928, 35, 135  # 比赛规模上限
+block_size = 288  # 需求分块生成的时刻数量（一天，5分钟一个时刻）
+start_time = datetime.datetime(2021, 11, 1)  # 第一个时刻
+name_alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'  # 节点名称字符集
+
+
+def instance_name(n_time: int, n_cus: int, n_sit: int, pressure: float, density: float, seed: int) -> str:
+    """算例目录名称（与Benchmark中的名称解析规则一致）"""
+    return 'synthetic{}t{}cus{}site{}pressure{}density{}seed'.format(n_time, n_cus, n_sit, pressure, density, seed)
+
+
+def node_names(rng: np.random.Generator, n: int) -> list:
+    """n个互不相同的两字符节点名称"""
+    codes = rng.choice(len(name_alphabet) ** 2, size=n, replace=False)
+    return [name_alphabet[c // len(name_alphabet)] + name_alphabet[c % len(name_alphabet)] for c in codes]
+
+
+def write_table(path: str, header: list, row_names: list, rows):
+    """写入CSV表格：首列为行名，其余列为整数，rows可为逐块产生的二维数组"""
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(','.join(header) + '\n')
+        names = iter(row_names)
+        for block in rows:
+            f.write(''.join('{},{}\n'.format(next(names), ','.join(map(str, row))) for row in block.tolist()))
+
+
+def demand_blocks(seed: int, n_time: int, band_width: np.ndarray, qos_mask: np.ndarray, pressure: float):
+    """
+    逐块产生带宽需求矩阵（每块最多block_size个时刻，维度：t*i），每个时刻的需求均可被满足
+    """
+    reachable = qos_mask.any(axis=0)  # 至少能服务一个客户节点的边缘节点
+    affinity = np.random.default_rng([seed, 1]).random(qos_mask.shape) * qos_mask  # 客户节点对边缘节点的偏好，i*j
+    for block, start in enumerate(range(0, n_time, block_size)):
+        rng = np.random.default_rng([seed, 2, block])
+        t = np.arange(start, min(start + block_size, n_time))
+
+        # 各时刻负载率：日周期波动（均值为pressure）加噪声，截断在[0, 1]内
+        profile = 1 + 0.3 * np.sin(2 * np.pi * (t % block_size) / block_size - np.pi / 2)
+        load_rate = np.clip(pressure * profile * (1 + 0.05 * rng.standard_normal(len(t))), 0, 1)
+
+        # 各边缘节点按负载率将带宽分给可服务的客户节点（分配比例随时刻扰动），得到满足约束的分数流，t*i*j
+        weight = affinity * (0.8 + 0.4 * rng.random((len(t),) + qos_mask.shape))
+        weight /= np.where(reachable, weight.sum(axis=1, keepdims=True), 1)
+        flow = weight * (load_rate[:, None] * (band_width * reachable))[:, None, :]
+        yield np.floor(flow.sum(axis=2)).astype(np.int64)
+
+
+def generate_instance(data_path: str, n_time=max_time, n_cus=max_customers, n_sit=max_sites, pressure=0.8,
+                      density=0.4, seed=0, qos_constraint=400, max_band_width=1000000) -> str:
+    """
+    生成算例并写入目录data_path
+    :param n_time: 时刻数量（不超过8928）
+    :param n_cus: 客户节点数量（不超过35）
+    :param n_sit: 边缘节点数量（不超过135）
+    :param pressure: 各时刻总需求与可达带宽之比的目标均值，(0, 1]
+    :param density: 客户节点和边缘节点之间满足QoS约束的比例，(0, 1]，每个客户节点至少有一个可服务的边缘节点
+    :param seed: 随机数种子
+    :param qos_constraint: QoS约束上限
+    :param max_band_width: 边缘节点带宽上限的最大值
+    :return: data_path
+    """
+    if not (0 < n_time <= max_time and 0 < n_cus <= max_customers and 0 < n_sit <= max_sites):
+        raise Exception("算例规模超出上限！时刻数量{}（上限{}），客户节点数量{}（上限{}），边缘节点数量{}（上限{}）！".format(
+            n_time, max_time, n_cus, max_customers, n_sit, max_sites))
+    if not (0 < pressure <= 1 and 0 < density <= 1):
+        raise Exception("压力{}和QoS密度{}应在(0, 1]内！".format(pressure, density))
+
+    rng = np.random.default_rng([seed, 0])
+    cus_names = node_names(rng, n_cus)
+    sit_names = node_names(rng, n_sit)
+    band_width = rng.integers(max_band_width // 10, max_band_width, size=n_sit, endpoint=True)
+
+    qos_mask = rng.random((n_cus, n_sit)) < density  # 客户节点i能否被边缘节点j服务
+    qos_mask[np.arange(n_cus), rng.integers(0, n_sit, size=n_cus)] = True
+    qos = np.where(qos_mask, rng.integers(1, qos_constraint, size=qos_mask.shape),
+                   rng.integers(qos_constraint, 2 * qos_constraint, size=qos_mask.shape))
+
+    os.makedirs(data_path, exist_ok=True)
+    mtime = [(start_time + datetime.timedelta(minutes=5 * t)).strftime('%Y-%m-%dT%H:%M') for t in range(n_time)]
+    write_table(os.path.join(data_path, demand_file_name), ['mtime'] + cus_names, mtime,
+                demand_blocks(seed, n_time, band_width, qos_mask, pressure))
+    write_table(os.path.join(data_path, site_bandwidth_file_name), ['site_name', 'bandwidth'], sit_names,
+                [band_width[:, None]])
+    write_table(os.path.join(data_path, qos_file_name), ['site_name'] + cus_names, sit_names, [qos.T])
+    with open(os.path.join(data_path, config_file_name), 'w', encoding='utf-8', newline='\n') as f:
+        f.write('[config]\nqos_constraint={}\n'.format(qos_constraint))
+    return data_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CodeCraft-2022仿真算例生成器')
+    parser.add_argument('--time', type=int, default=max_time, help='时刻数量')
+    parser.add_argument('--customers', type=int, default=max_customers, help='客户节点数量')
+    parser.add_argument('--sites', type=int, default=max_sites, help='边缘节点数量')
+    parser.add_argument('--pressure', type=float, default=0.8, help='总需求与可达带宽之比的目标均值')
+    parser.add_argument('--density', type=float, default=0.4, help='满足QoS约束的比例')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    parser.add_argument('--qos-constraint', type=int, default=400, help='QoS约束上限')
+    parser.add_argument('--output', default=None, help='输出目录，默认为data目录下按参数命名的子目录')
+    arguments = parser.parse_args()
+
+    output = arguments.output or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data',
+        instance_name(arguments.time, arguments.customers, arguments.sites, arguments.pressure, arguments.density,
+                      arguments.seed))
+    generate_instance(output, arguments.time, arguments.customers, arguments.sites, arguments.pressure,
+                      arguments.density, arguments.seed, arguments.qos_constraint)
+    print('算例已写入{}！'.format(output))
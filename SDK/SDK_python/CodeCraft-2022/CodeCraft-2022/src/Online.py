@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: Online.py
+@time: 2022/4/2 10:40
+@description:在线流式分配模式：需求数据逐行到达（读取demand.csv时可持续等待新行，或直接传入迭代器），每到达一个时刻
+    立即完成分配并将对应的各行追加写入解决方案文件。
+    分配逻辑与initial_solution_generation_1（priority_update=True）相同：按客户节点分配顺序向量化注水，边缘节点
+    被选择的优先级由各边缘节点的95分位带宽值估计值更新；估计值基于最近online_history个时刻的负载（环形缓冲区上的
+    顺序统计结构），因此每个时刻的计算量为O(M*N+N*log H)，内存占用与已处理的时刻数量无关。
+    当online_history不小于时刻数量时，分配结果与initial_solution_generation_1逐位相同（见check_online）
+"""
+import os
+import time
+import numpy as np
+from ReadData import QosAdjacency, demand_file_name, parse_static, read_demand_header
+from Results import SiteLoadTracker, encode_timestep, node_prefixes
+from WaterFilling import water_fill
+from CallAlgorithm import customer_order
+from utils import Parameter, Tracer
+parameter = Parameter()
+
+
+def demand_stream(file_path: str, n_cus: int, follow=False, poll_interval=None, idle_timeout=None):
+    """
+    逐行读取需求文件（跳过表头），每行产生(时刻, 各客户节点的带宽需求数组)
+    :param n_cus: 客户节点数量，用于检查每行的列数
+    :param follow: 读到文件末尾后是否继续等待新行（不完整的行等待写入方补全后再解析）
+    :param poll_interval: 等待新行时的轮询间隔（秒），默认为parameter.online_poll_interval
+    :param idle_timeout: 持续该时长（秒）无新行时结束，默认为parameter.online_idle_timeout，None表示一直等待
+    """
+    poll_interval = parameter.online_poll_interval if poll_interval is None else poll_interval
+    idle_timeout = parameter.online_idle_timeout if idle_timeout is None else idle_timeout
+    with open(file_path, mode='r', encoding='utf-8') as f:
+        f.readline()  # 表头
+        pending = ''  # 尚未读完的行
+        idle_since = time.perf_counter()
+        while True:
+            line = f.readline()
+            if line.endswith('\n') or (line and not follow):
+                line, pending = (pending + line).strip(), ''
+                if line:
+                    mtime, rest = line.split(',', 1)
+                    row = np.fromstring(rest, dtype=np.int64, sep=',')
+                    if len(row) != n_cus:
+                        raise Exception("时刻{}的需求数据列数{}与客户节点数量{}不一致！".format(mtime, len(row), n_cus))
+                    yield mtime, row
+                idle_since = time.perf_counter()
+                continue
+            if not follow:
+                return
+            if line:
+                pending += line
+                idle_since = time.perf_counter()
+            if idle_timeout is not None and time.perf_counter() - idle_since > idle_timeout:
+                return
+            time.sleep(poll_interval)
+
+
+class OnlineAllocator:
+    """
+    在线分配器：持有与时刻无关的输入和各边缘节点的持久状态（最近history个时刻的负载、95分位带宽值估计值、
+    下一时刻的选择优先级），逐时刻分配并统计分配延迟
+    """
+
+    def __init__(self, cus_names: list, sit_names: list, band_width: np.ndarray, adjacency: QosAdjacency,
+                 history=None, alpha=None):
+        """
+        :param adjacency: 满足QoS约束的二部图邻接结构
+        :param history: 估计95分位带宽值所用的最近时刻数量，默认为parameter.online_history
+        :param alpha: 更新边缘节点被选择的优先级时使用的系数，默认为parameter.alpha
+        """
+        self.cus_names, self.sit_names = cus_names, sit_names  # 客户节点、边缘节点名称列表
+        self.band_width = np.asarray(band_width, dtype=np.int64)  # 边缘节点带宽上限，j
+        self.qos_mask = adjacency.mask  # 客户节点i能否被边缘节点j服务，i*j
+        self.cus_order = customer_order(adjacency.cus_degree.tolist())  # 客户节点分配顺序
+        self.alpha = parameter.alpha if alpha is None else alpha
+        self.history = parameter.online_history if history is None else history
+
+        # 最近history个时刻的负载（环形缓冲区）上的顺序统计结构，其95分位带宽值即为估计值
+        self.tracker = SiteLoadTracker(np.zeros((self.history, len(sit_names)), dtype=np.int64), length=0)
+        self.priority = np.full(len(sit_names), round(1 / len(sit_names), parameter.decimal))  # 下一时刻的选择优先级
+        self.n_timesteps = 0  # 已分配的时刻数量
+
+        self.cus_prefix, self.sit_prefix = node_prefixes(cus_names, sit_names)  # 写入解决方案时预先编码的节点名称
+
+        # 分配延迟统计：总用时、最大值、最近若干时刻的延迟（环形缓冲区，用于计算分位数）、超出延迟上限的次数
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_recent = np.zeros(parameter.online_latency_window)
+        self.overruns = 0
+
+    @property
+    def level(self) -> np.ndarray:
+        """各边缘节点的95分位带宽值估计值（基于最近history个时刻的负载），维度：j"""
+        return self.tracker.cost
+
+    def allocate(self, demand_row: np.ndarray) -> np.ndarray:
+        """
+        分配一个新到达的时刻，并更新各边缘节点的负载历史、95分位带宽值估计值和下一时刻的选择优先级
+        :param demand_row: 该时刻各客户节点的带宽需求，维度：i
+        :return: 该时刻的分配结果，维度：i*j
+        """
+        allocation = water_fill(np.asarray(demand_row, dtype=np.int64)[None], self.band_width, self.priority[None],
+                                self.qos_mask, self.cus_order, self.cus_names)[0]
+        loads = allocation.sum(axis=0)
+        tracker = self.tracker
+        if tracker.length < self.history:
+            cost = tracker.append(loads)
+        else:
+            # 环形缓冲区已满：以新时刻的负载覆盖最早时刻的负载
+            slot = self.n_timesteps % self.history
+            for j, value in enumerate(loads.tolist()):
+                tracker.set(slot, j, value)
+            cost = tracker.cost
+        self.n_timesteps += 1
+
+        total_cost = cost.sum()
+        if total_cost > 0:
+            self.priority = self.alpha * (cost / total_cost) + (1 - self.alpha) * self.priority
+        return allocation
+
+    def encode(self, allocation: np.ndarray) -> bytes:
+        """将一个时刻的分配结果编码为解决方案文件中的各行"""
+        i_index, j_index = np.nonzero(allocation)
+        return encode_timestep(self.cus_prefix, self.sit_prefix, i_index, j_index, allocation[i_index, j_index])
+
+    def record_latency(self, mtime: str, seconds: float):
+        """记录一个时刻的分配延迟，超出parameter.online_latency_budget时记录告警"""
+        self.latency_total += seconds
+        self.latency_max = max(self.latency_max, seconds)
+        self.latency_recent[(self.n_timesteps - 1) % len(self.latency_recent)] = seconds
+        if seconds > parameter.online_latency_budget:
+            self.overruns += 1
+            Tracer().emit('WARNING', '时刻{}的分配延迟{:.4f}秒超出上限{}秒！', mtime, seconds,
+                          parameter.online_latency_budget)
+
+    def run(self, rows, output=None) -> dict:
+        """
+        逐时刻分配
+        :param rows: 可迭代对象，元素为(时刻, 各客户节点的带宽需求数组)，如demand_stream的返回值
+        :param output: 以二进制模式打开的解决方案文件，每个时刻分配完成后追加写入并刷新，None表示不写入
+        :return: 分配延迟统计（见latency_summary）
+        """
+        tracer = Tracer()
+        start_timesteps, start_overruns = self.n_timesteps, self.overruns
+        for mtime, row in rows:
+            start = time.perf_counter()
+            allocation = self.allocate(row)
+            if output is not None:
+                output.write(self.encode(allocation))
+                output.flush()
+            self.record_latency(mtime, time.perf_counter() - start)
+            if tracer.debug:
+                tracer.emit('DEBUG', '时刻{}分配完成，95分位带宽值估计值之和为{}！', mtime, int(self.level.sum()))
+        tracer.count('online_timesteps', self.n_timesteps - start_timesteps)
+        tracer.count('online_latency_overruns', self.overruns - start_overruns)
+        return self.latency_summary()
+
+    def latency_summary(self) -> dict:
+        """分配延迟统计（秒）：时刻数量、平均值、最近若干时刻的中位数和99分位数、最大值、超出上限的次数"""
+        recent = self.latency_recent[:min(self.n_timesteps, len(self.latency_recent))]
+        return {
+            'timesteps': self.n_timesteps,
+            'mean': self.latency_total / self.n_timesteps if self.n_timesteps else 0.0,
+            'p50': float(np.percentile(recent, 50)) if len(recent) else 0.0,
+            'p99': float(np.percentile(recent, 99)) if len(recent) else 0.0,
+            'max': self.latency_max,
+            'overruns': self.overruns,
+        }
+
+    def report(self) -> str:
+        summary = self.latency_summary()
+        return ('在线分配结束！共{timesteps}个时刻，分配延迟：平均{mean:.6f}秒，中位数{p50:.6f}秒，99分位数{p99:.6f}秒，'
+                '最大{max:.6f}秒，超出上限{overruns}次！').format(**summary) + \
+            '95分位带宽值估计值之和为{}（最近{}个时刻）！'.format(int(self.level.sum()), min(self.n_timesteps, self.history))
+
+
+def make_allocator(data_path: str, history=None) -> OnlineAllocator:
+    """读取与时刻无关的输入（仅读取需求文件的表头），构建在线分配器"""
+    cus_names = read_demand_header(data_path)
+    static = parse_static(data_path, cus_names)
+    adjacency = QosAdjacency(static['qos'].T.copy(), int(static['qos_constraint']))
+    return OnlineAllocator(cus_names, static['sit_names'].tolist(), static['band_width'], adjacency, history)
+
+
+def run_online(data_path=None, solution_path=None, follow=None) -> OnlineAllocator:
+    """
+    在线流式分配：逐行读取data_path下的需求文件，逐时刻分配并追加写入solution_path
+    :param data_path: 数据目录，默认为parameter.data_path
+    :param solution_path: 解决方案文件路径，默认为parameter.solution_path
+    :param follow: 读到需求文件末尾后是否继续等待新行，默认为parameter.online_follow
+    """
+    parameter.produce_path()  # 与read_instance一致，按运行环境设置默认的数据目录和解决方案文件路径
+    data_path = parameter.data_path if data_path is None else data_path
+    solution_path = parameter.solution_path if solution_path is None else solution_path
+    follow = parameter.online_follow if follow is None else follow
+
+    allocator = make_allocator(data_path)
+    print('\n开始在线分配！{}个客户节点，{}个边缘节点，负载历史长度{}！'.format(
+        len(allocator.cus_names), len(allocator.sit_names), allocator.history))
+    with open(solution_path, mode='wb') as output:
+        allocator.run(demand_stream(os.path.join(data_path, demand_file_name), len(allocator.cus_names), follow),
+                      output)
+    print(allocator.report())
+    return allocator
+
+
+def check_online(data_path: str) -> bool:
+    """
+    检查在线分配（负载历史覆盖全部时刻）写入的解决方案文件与initial_solution_generation_1（priority_update=True）
+    写入的文件是否逐字节相同
+    """
+    import tempfile
+    from ReadData import Instance, load_data
+    from CallAlgorithm import initial_solution_generation_1
+
+    instance = Instance(load_data(data_path))
+    with tempfile.TemporaryDirectory() as directory:
+        online_path, offline_path = os.path.join(directory, 'online.txt'), os.path.join(directory, 'offline.txt')
+        allocator = make_allocator(data_path, history=len(instance.mtime))
+        with open(online_path, mode='wb') as output:
+            allocator.run(zip(instance.mtime, instance.demand), output)
+
+        priority_update, parameter.priority_update = parameter.priority_update, True
+        try:
+            offline = initial_solution_generation_1(instance.cus_list, instance.sit_list, instance.qos_dict(),
+                                                    instance.qos_constraint, write_file=False)
+        finally:
+            parameter.priority_update = priority_update
+        offline.write_to_file(offline_path)
+        with open(online_path, mode='rb') as f1, open(offline_path, mode='rb') as f2:
+            return f1.read() == f2.read()
+
+
+if __name__ == '__main__':
+    import contextlib
+    import io
+
+    parameter.produce_path()
+    with contextlib.redirect_stdout(io.StringIO()):
+        same = check_online(parameter.data_path)
+    print('在线分配与initial_solution_generation_1（priority_update=True）的解决方案{}！'.format(
+        '逐字节相同' if same else '不一致'))
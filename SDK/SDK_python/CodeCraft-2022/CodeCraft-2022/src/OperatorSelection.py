@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: OperatorSelection.py
+@time: 2022/4/4 10:20
+@description:ALNS算法的自适应算子选择：以(破坏算子, 修复算子)组合为单位，统计每个组合的调用次数、接受次数、
+    改进次数、目标函数累计改进量和CPU用时，以“单位CPU时间的目标函数改进量”（改进量与用时的指数平滑之比）作为
+    组合的权重，按轮盘赌选择组合（每个组合至少保留operator_min_share倍最大权重，保证探索），未被调用过的组合
+    优先被选择一次。
+    破坏比例随搜索进度（已用迭代次数比例与已用时间比例的较大者）从degree_of_destruction线性降至
+    min_degree_of_destruction：截止时刻临近时每次迭代的代价更小，以便在剩余时间内完成更多迭代
+"""
+import json
+import time
+import numpy as np
+from utils import Parameter
+parameter = Parameter()
+
+
+class OperatorStats:
+    """一个(破坏算子, 修复算子)组合的统计"""
+
+    def __init__(self, destroy, repair):
+        self.destroy, self.repair = destroy, repair  # 破坏算子、修复算子
+        self.calls = 0  # 调用次数
+        self.accepted = 0  # 候选解被接受的次数
+        self.improved = 0  # 候选解严格改进当前解的次数
+        self.improvement = 0  # 目标函数累计改进量
+        self.seconds = 0.0  # 累计CPU用时（秒）
+        self.smoothed_improvement = 0.0  # 每次调用的改进量的指数平滑
+        self.smoothed_seconds = 0.0  # 每次调用的CPU用时的指数平滑
+
+    @property
+    def rate(self) -> float:
+        """单位CPU时间的目标函数改进量（指数平滑）"""
+        return self.smoothed_improvement / self.smoothed_seconds if self.smoothed_seconds > 0 else 0.0
+
+    def update(self, improvement: int, seconds: float, accepted: bool, decay: float):
+        self.calls += 1
+        self.accepted += int(accepted)
+        self.improved += int(improvement > 0)
+        self.improvement += improvement
+        self.seconds += seconds
+        if self.calls == 1:
+            self.smoothed_improvement, self.smoothed_seconds = float(improvement), seconds
+        else:
+            self.smoothed_improvement += decay * (improvement - self.smoothed_improvement)
+            self.smoothed_seconds += decay * (seconds - self.smoothed_seconds)
+
+    def export(self) -> dict:
+        return {
+            'destroy': self.destroy.__name__,
+            'repair': self.repair.__name__,
+            'calls': self.calls,
+            'accepted': self.accepted,
+            'improved': self.improved,
+            'improvement': int(self.improvement),
+            'seconds': round(self.seconds, 6),
+            'improvement_per_second': round(self.improvement / self.seconds, 2) if self.seconds > 0 else 0.0,
+            'smoothed_rate': round(self.rate, 2),
+        }
+
+
+class OperatorSelector:
+    """
+    自适应算子选择器，adaptive=False时退化为均匀随机选择破坏算子和修复算子（与未启用时的随机数序列相同），
+    但仍然统计各个组合的用时和改进量
+    """
+
+    def __init__(self, destroy_operators: list, repair_operators: list, adaptive=None, decay=None, min_share=None):
+        """
+        :param adaptive: 是否按单位CPU时间的改进量选择组合，默认为parameter.adaptive_operators
+        :param decay: 指数平滑系数（反应因子），默认为parameter.operator_decay
+        :param min_share: 每个组合的权重下限占最大权重的比例，默认为parameter.operator_min_share
+        """
+        self.destroy_operators, self.repair_operators = destroy_operators, repair_operators
+        self.adaptive = parameter.adaptive_operators if adaptive is None else adaptive
+        self.decay = parameter.operator_decay if decay is None else decay
+        self.min_share = parameter.operator_min_share if min_share is None else min_share
+        self.stats = [OperatorStats(destroy, repair) for destroy in destroy_operators for repair in repair_operators]
+
+    def select(self, rnd_state: np.random.RandomState) -> OperatorStats:
+        """选择一个(破坏算子, 修复算子)组合"""
+        if not self.adaptive:
+            destroy = rnd_state.randint(len(self.destroy_operators))
+            repair = rnd_state.randint(len(self.repair_operators))
+            return self.stats[destroy * len(self.repair_operators) + repair]
+        for stats in self.stats:
+            if stats.calls == 0:
+                return stats
+        rates = np.array([stats.rate for stats in self.stats])
+        weights = np.maximum(rates, self.min_share * rates.max())
+        if weights.sum() <= 0:
+            return self.stats[rnd_state.randint(len(self.stats))]
+        return self.stats[rnd_state.choice(len(self.stats), p=weights / weights.sum())]
+
+    def update(self, stats: OperatorStats, improvement: int, seconds: float, accepted: bool):
+        """
+        记录组合stats的一次调用
+        :param improvement: 目标函数改进量（候选解未被接受时为0）
+        :param seconds: 破坏、修复和评估的CPU用时（秒）
+        """
+        stats.update(improvement, seconds, accepted, self.decay)
+
+    @staticmethod
+    def degree(progress: float) -> float:
+        """
+        当前的破坏比例：随搜索进度progress（0~1）从degree_of_destruction线性降至min_degree_of_destruction
+        """
+        progress = min(max(progress, 0.0), 1.0)
+        start, end = parameter.degree_of_destruction, min(parameter.min_degree_of_destruction,
+                                                          parameter.degree_of_destruction)
+        return start - (start - end) * progress
+
+    def export(self) -> dict:
+        """各个组合及各个算子（按破坏算子、修复算子分别汇总）的统计"""
+        pairs = [stats.export() for stats in self.stats]
+        operators = {}
+        for record in pairs:
+            for role in ('destroy', 'repair'):
+                total = operators.setdefault(role + ':' + record[role],
+                                             {'calls': 0, 'accepted': 0, 'improved': 0, 'improvement': 0,
+                                              'seconds': 0.0})
+                for key in total:
+                    total[key] += record[key]
+        for total in operators.values():
+            total['seconds'] = round(total['seconds'], 6)
+            total['improvement_per_second'] = round(total['improvement'] / total['seconds'], 2) \
+                if total['seconds'] > 0 else 0.0
+        return {'adaptive': self.adaptive, 'pairs': pairs, 'operators': operators}
+
+    def write_stats(self, path=None):
+        """将统计写入JSON文件path（默认为parameter.operator_stats_path），None表示不写入"""
+        path = parameter.operator_stats_path if path is None else path
+        if path is None:
+            return
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.export(), ensure_ascii=False) + '\n')
+
+    def report(self) -> str:
+        lines = ['ALNS算子统计（{}）：'.format('自适应选择' if self.adaptive else '均匀随机选择')]
+        for stats in self.stats:
+            record = stats.export()
+            lines.append('    {destroy}+{repair}：调用{calls}次，接受{accepted}次，改进{improved}次，累计改进{improvement}，'
+                         'CPU用时{seconds:.4f}秒，每秒改进{improvement_per_second}'.format(**record))
+        return '\n'.join(lines)
+
+
+class ProgressClock:
+    """ALNS搜索进度：已用迭代次数比例与已用时间比例（相对开始时的剩余时间）的较大者"""
+
+    def __init__(self, iterations: int, available: float):
+        self.iterations = iterations  # 迭代次数上限
+        self.available = available  # 开始时的剩余可用时间（秒）
+        self.start = time.perf_counter()
+
+    def progress(self, iteration: int) -> float:
+        by_iterations = iteration / self.iterations if self.iterations > 0 else 1.0
+        by_time = (time.perf_counter() - self.start) / self.available if self.available > 0 else 1.0
+        return max(by_iterations, by_time)
@@ -6,26 +6,141 @@
 @time: 2022/3/21 16:21
 @description:
 """
-import csv
 import datetime
+import hashlib
 import os
+import tempfile
 import numpy as np
 from utils import Parameter
+parameter = Parameter()
 
 demand_file_name = 'demand.csv'
 qos_file_name = 'qos.csv'
 site_bandwidth_file_name = 'site_bandwidth.csv'
 config_file_name = 'config.ini'
 
+cache_version = 1  # 二进制缓存格式的版本号，缓存内容或格式发生变化时需递增
+
+
+class QosAdjacency:
+    """
+    申明客户节点与边缘节点之间满足QoS约束的二部图邻接结构（CSR格式，不可变），每个问题实例只构建一次，
+    并被解决方案、初始解生成算法、可行性检查和修复算子按引用共享：
+        正向：客户节点i可被边缘节点cus_sites[cus_offsets[i]:cus_offsets[i+1]]服务（边按客户节点排列）
+        反向：边缘节点j可服务客户节点sit_customers[sit_offsets[j]:sit_offsets[j+1]]，对应的边为sit_edges中同一区间
+    """
+
+    def __init__(self, qos: np.ndarray, qos_constraint: int):
+        """
+        :param qos: 客户节点和边缘节点之间的时延，维度：i*j
+        :param qos_constraint: 客户节点和边缘节点之间的网络质量阈值
+        """
+        self.qos = qos  # 客户节点和边缘节点之间的时延，i*j
+        self.qos_constraint = qos_constraint  # 客户节点和边缘节点之间的网络质量阈值
+        self.mask = qos < qos_constraint  # 客户节点i能否被边缘节点j服务，i*j
+
+        # 正向邻接（客户节点->边缘节点），即按客户节点排列的边
+        self.edge_cus, self.cus_sites = np.nonzero(self.mask)
+        self.cus_offsets = np.searchsorted(self.edge_cus, np.arange(self.mask.shape[0] + 1))
+        self.cus_degree = np.diff(self.cus_offsets)  # 能为客户节点服务的边缘节点数量
+
+        # 反向邻接（边缘节点->客户节点）
+        self.sit_edges = np.argsort(self.cus_sites, kind='stable')
+        self.sit_customers = self.edge_cus[self.sit_edges]
+        self.sit_offsets = np.searchsorted(self.cus_sites[self.sit_edges], np.arange(self.mask.shape[1] + 1))
+        self.sit_degree = np.diff(self.sit_offsets)  # 边缘节点可服务的客户节点数量
+
+        # (i, j)->边索引，-1表示不满足QoS约束
+        self.edge_id = np.full(self.mask.shape, -1, dtype=np.int64)
+        self.edge_id[self.edge_cus, self.cus_sites] = np.arange(len(self.edge_cus))
+
+        for array in (self.qos, self.mask, self.edge_cus, self.cus_sites, self.cus_offsets, self.cus_degree,
+                      self.sit_edges, self.sit_customers, self.sit_offsets, self.sit_degree, self.edge_id):
+            array.flags.writeable = False
+
+        self._serve_lists = None
+
+    @property
+    def n_edges(self) -> int:
+        """满足QoS约束的(i, j)数量"""
+        return len(self.edge_cus)
+
+    def sites_of(self, i: int) -> np.ndarray:
+        """能为客户节点i服务的边缘节点索引"""
+        return self.cus_sites[self.cus_offsets[i]:self.cus_offsets[i + 1]]
+
+    def customers_of(self, j: int) -> np.ndarray:
+        """边缘节点j可服务的客户节点索引"""
+        return self.sit_customers[self.sit_offsets[j]:self.sit_offsets[j + 1]]
+
+    def serve_lists(self) -> dict:
+        """能对客户节点进行服务的边缘节点索引（Python列表，供逐元素访问的贪婪算法使用），{i_index:[j_index_1,j_index_2]}"""
+        if self._serve_lists is None:
+            self._serve_lists = {i: self.sites_of(i).tolist() for i in range(self.mask.shape[0])}
+        return self._serve_lists
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class Instance:
+    """
+    申明问题实例类，持有所有客户节点共用的时刻列表、连续存储的带宽需求矩阵及边缘节点带宽上限等数组，
+    客户节点类和边缘节点类仅为其上的轻量视图
+    """
+
+    __slots__ = ('mtime', 'demand', 'band_width', 'qos', 'qos_constraint', 'adjacency',
+                 'cus_names', 'sit_names', 'cus_index', 'sit_index', 'cus_list', 'sit_list')
+
+    def __init__(self, data: dict):
+        """
+        :param data: load_data返回的字典
+        """
+        self.mtime = data['mtime'].tolist()  # 所有客户节点共用的时刻列表，内部元素为原始时刻字符串
+        self.demand = np.ascontiguousarray(data['demand'], dtype=np.int64)  # 客户节点带宽需求，t*i
+        self.band_width = np.ascontiguousarray(data['band_width'], dtype=np.int64)  # 边缘节点带宽上限，j
+        self.qos = np.ascontiguousarray(data['qos'], dtype=np.int64)  # 边缘节点和客户节点之间的时延，j*i
+        self.qos_constraint = int(data['qos_constraint'])  # 客户节点和边缘节点之间的网络质量阈值
+        self.adjacency = QosAdjacency(self.qos.T.copy(), self.qos_constraint)  # 满足QoS约束的二部图邻接结构
+
+        self.cus_names = data['cus_names'].tolist()  # 客户节点名称列表
+        self.sit_names = data['sit_names'].tolist()  # 边缘节点名称列表
+        self.cus_index = {name: i for i, name in enumerate(self.cus_names)}  # 客户节点名称->索引
+        self.sit_index = {name: j for j, name in enumerate(self.sit_names)}  # 边缘节点名称->索引
+
+        self.cus_list = [Customer(self, i) for i in range(len(self.cus_names))]  # 客户类对象列表
+        self.sit_list = [Site(self, j) for j in range(len(self.sit_names))]  # 边缘节点类对象列表
+
+    def qos_dict(self) -> dict:
+        """边缘节点和客户之间的时延字典，键(site_name, customer_name)，值qos_value"""
+        qos = self.qos.tolist()
+        return {(self.sit_names[j], self.cus_names[i]): qos[j][i]
+                for j in range(len(self.sit_names)) for i in range(len(self.cus_names))}
+
 
 class Customer:
-    """申明客户节点类"""
+    """申明客户节点类（问题实例上的视图）"""
+
+    __slots__ = ('instance', 'index', 'name')
 
-    def __init__(self, name):
+    def __init__(self, instance: Instance, index: int):
 
-        self.name = name  # 客户姓名
-        self.mtime = []  # 时刻列表，内部元素为时间类型（datetime类型）
-        self.demand = []  # 带宽需求，内部元素为int类型
+        self.instance = instance  # 所属问题实例
+        self.index = index  # 客户节点索引
+        self.name = instance.cus_names[index]  # 客户姓名
+
+    @property
+    def mtime(self) -> list:
+        """时刻列表，内部元素为原始时刻字符串（可通过parse_mtime转换为datetime类型），所有客户节点共用"""
+        return self.instance.mtime
+
+    @property
+    def demand(self) -> np.ndarray:
+        """带宽需求，为需求矩阵中对应列的视图"""
+        return self.instance.demand[:, self.index]
 
     def check_equality(self):
         """mtime和demand列表长度应相同"""
@@ -33,86 +148,176 @@ class Customer:
 
 
 class Site:
-    """申明边缘节点类"""
+    """申明边缘节点类（问题实例上的视图）"""
 
-    def __init__(self, name, band_width):
+    __slots__ = ('instance', 'index', 'name', 'band_width')
 
-        self.name = name  # 节点名称
-        self.band_width = band_width  # 节点带宽大小
+    def __init__(self, instance: Instance, index: int):
 
+        self.instance = instance  # 所属问题实例
+        self.index = index  # 边缘节点索引
+        self.name = instance.sit_names[index]  # 节点名称
+        self.band_width = int(instance.band_width[index])  # 节点带宽大小
 
-def read_data():
+
+def parse_mtime(mtime: list) -> list:
     """
-    从data目录读取数据，并转换为内部可读取数据
-    :return: cus_list: 客户类对象列表
-    :return: sit_list: 边缘节点类对象列表
-    :return: qos_dict: 边缘节点和客户之间的时延字典，键(site_name, customer_name)，值qos_value
-    :return qos_const: 客户节点和边缘节点之间的网络质量
+    将原始时刻字符串列表转换为datetime类型列表（仅在需要时调用）
     """
-    cus_list = []  # 客户类对象列表
-    sit_list = []  # 边缘节点类对象列表
-    qos_dict = {}  # 边缘节点和客户之间的时延字典，键(site_name, customer_name)，值qos_value
+    return [datetime.datetime.strptime(m, "%Y-%m-%dT%H:%M") for m in mtime]
 
-    parameter = Parameter()
-    parameter.produce_path()
 
-    # 需求数据（客户节点数据）
-    with open(os.path.join(parameter.data_path, demand_file_name), mode='r', encoding='utf-8') as f:
-        results = list(csv.reader(f))
-        first_line = results[0]
-        for cus in first_line[1:]:
-            cus_list.append(
-                Customer(cus)
-            )
-        for demand in results[1:]:
-            # mtime = int(time.mktime(time.strptime(demand[0], "%Y-%m-%dT%H:%M")))
-            mtime = datetime.datetime.strptime(demand[0], "%Y-%m-%dT%H:%M")
-            for i in range(len(demand[1:])):
-                cus_list[i].mtime.append(mtime)
-                cus_list[i].demand.append(int(demand[i + 1]))
-    for cus in cus_list:
-        cus.check_equality()
-    print("\n需求数据（客户节点数据）读取成功！规模：{}个客户节点！".format(len(cus_list)))
-    print("每个客户包含的时刻数量：{}！".format(len(cus_list[0].mtime)))
+def _read_lines(file_path: str) -> list:
+    """读取文件的所有非空行"""
+    with open(file_path, mode='r', encoding='utf-8') as f:
+        return [line for line in f.read().splitlines() if line]
+
 
+def _parse_table(lines: list):
+    """
+    单次解析CSV表格：首列为行名，其余列为整数
+    :return: 表头（不含首列）、行名列表、numpy二维整数数组
+    """
+    header = lines[0].split(',')[1:]
+    row_names, values = [], []
+    for line in lines[1:]:
+        name, rest = line.split(',', 1)
+        row_names.append(name)
+        values.append(rest)
+    table = np.fromstring(','.join(values), dtype=np.int64, sep=',').reshape(len(row_names), len(header))
+    return header, row_names, table
+
+
+def read_demand_header(data_path: str) -> list:
+    """读取需求文件的表头，返回客户节点名称列表（不读取需求数据）"""
+    with open(os.path.join(data_path, demand_file_name), mode='r', encoding='utf-8') as f:
+        return f.readline().strip().split(',')[1:]
+
+
+def parse_static(data_path: str, cus_names: list) -> dict:
+    """
+    解析与时刻无关的输入（边缘节点带宽上限、网络时延、QoS约束上限），网络时延按照cus_names的顺序重排列
+    :return: 字典，包含sit_names、band_width、qos和qos_constraint（含义见parse_data）
+    """
     # 边缘节点数据
-    with open(os.path.join(parameter.data_path, site_bandwidth_file_name), mode='r', encoding='utf-8') as f:
-        site_info = csv.reader(f)
-        site_info.__next__()  # 跳过表头
-        for site in site_info:
-            site_name = site[0]
-            band_width = int(site[1])
-            assert band_width >= 0
-            sit_list.append(
-                Site(site_name, band_width)
-            )
-    print("\n边缘节点数据读取成功！规模：{}个边缘节点！".format(len(sit_list)))
-
-    # 网络时延数据
-    qos_data = np.loadtxt(
-        os.path.join(parameter.data_path, qos_file_name),
-        dtype='float',
-        delimiter=',',
-        skiprows=1,
-        usecols=(i for i in range(1, len(cus_list) + 1)),
-        encoding='utf-8'
-    )
-    with open(os.path.join(parameter.data_path, qos_file_name), mode='r', encoding='utf-8') as f:
-        qos_results = list(csv.reader(f))
-        cus_name = qos_results[0][1:]
-        for i in range(len(qos_results[1:])):
-            site_name = qos_results[1:][i][0]
-            for j in range(len(cus_name)):
-                qos_dict[site_name, cus_name[j]] = int(qos_data[i][j])
+    _, sit_names, band_width = _parse_table(_read_lines(os.path.join(data_path, site_bandwidth_file_name)))
+    band_width = band_width[:, 0]
+    assert np.all(band_width >= 0)
+
+    # 网络时延数据，按照名称将行、列重排为与边缘节点、客户节点一致的顺序
+    qos_cus_names, qos_sit_names, qos_table = _parse_table(_read_lines(os.path.join(data_path, qos_file_name)))
+    sit_index = {name: j for j, name in enumerate(qos_sit_names)}
+    cus_index = {name: i for i, name in enumerate(qos_cus_names)}
+    qos = qos_table[np.ix_([sit_index[name] for name in sit_names], [cus_index[name] for name in cus_names])]
+
+    # QoS约束上限
+    qos_constraint = None
+    for line in _read_lines(os.path.join(data_path, config_file_name)):
+        if line.startswith('qos_constraint='):
+            qos_constraint = int(line.replace('qos_constraint=', ''))
+
+    return {
+        'sit_names': np.array(sit_names),
+        'band_width': band_width,
+        'qos': qos,
+        'qos_constraint': np.array(qos_constraint, dtype=np.int64),
+    }
+
+
+def parse_data(data_path: str) -> dict:
+    """
+    逐个CSV文件单次解析，直接转换为稠密数组
+    :return: 字典，包含：
+        mtime: 时刻字符串数组，维度：t
+        cus_names: 客户节点名称数组，维度：i
+        sit_names: 边缘节点名称数组，维度：j
+        demand: 客户节点带宽需求，维度：t*i
+        band_width: 边缘节点带宽上限，维度：j
+        qos: 边缘节点和客户节点之间的时延，维度：j*i（行、列顺序分别与sit_names、cus_names一致）
+        qos_constraint: QoS约束上限
+    """
+    # 需求数据（客户节点数据）
+    cus_names, mtime, demand = _parse_table(_read_lines(os.path.join(data_path, demand_file_name)))
+
+    data = {
+        'mtime': np.array(mtime),
+        'cus_names': np.array(cus_names),
+        'demand': demand,
+    }
+    data.update(parse_static(data_path, cus_names))
+    return data
+
+
+def cache_file(data_path: str) -> str:
+    """
+    计算数据目录对应的缓存文件路径，缓存键由缓存版本号、输入文件的路径、大小及修改时间决定
+    """
+    key = ['v{}'.format(cache_version)]
+    for file_name in (demand_file_name, site_bandwidth_file_name, qos_file_name, config_file_name):
+        file_path = os.path.abspath(os.path.join(data_path, file_name))
+        stat = os.stat(file_path)
+        key.append('{}:{}:{}'.format(file_path, stat.st_size, stat.st_mtime_ns))
+    cache_dir = parameter.cache_path or os.path.join(tempfile.gettempdir(), 'codecraft2022_cache')
+    return os.path.join(cache_dir, hashlib.sha1('|'.join(key).encode('utf-8')).hexdigest() + '.npz')
+
+
+def load_data(data_path: str) -> dict:
+    """
+    读取数据目录中的数据（格式见parse_data），若存在有效的二进制缓存则直接读取缓存，
+    否则解析CSV文件并写入缓存（缓存写入失败不影响程序运行）
+    """
+    if not parameter.use_cache:
+        return parse_data(data_path)
+
+    path = cache_file(data_path)
+    if os.path.exists(path):
+        try:
+            with np.load(path, allow_pickle=False) as cache:
+                if int(cache['cache_version']) == cache_version:
+                    print("\n从缓存{}读取数据！".format(path))
+                    return {key: cache[key] for key in cache.files if key != 'cache_version'}
+        except (OSError, ValueError, KeyError):
+            pass
+
+    data = parse_data(data_path)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.{}.tmp.npz'.format(os.getpid())
+        np.savez(tmp_path, cache_version=np.array(cache_version), **data)
+        os.replace(tmp_path, path)
+    except OSError:
+        print("\n缓存{}写入失败！".format(path))
+    return data
+
+
+def read_instance() -> Instance:
+    """
+    从data目录读取数据，并转换为问题实例
+    """
+    parameter.produce_path()
+
+    instance = Instance(load_data(parameter.data_path))
+    for cus in instance.cus_list:
+        cus.check_equality()
+    print("\n需求数据（客户节点数据）读取成功！规模：{}个客户节点！".format(len(instance.cus_list)))
+    print("每个客户包含的时刻数量：{}！".format(len(instance.mtime)))
+    print("\n边缘节点数据读取成功！规模：{}个边缘节点！".format(len(instance.sit_list)))
     print("\n网络时延数据读取成功！")
+    print("\nQoS约束上限数据读取成功！为{}！".format(instance.qos_constraint))
+
+    return instance
 
-    # 读取QoS约束上限
-    with open(os.path.join(parameter.data_path, config_file_name), mode='r', encoding="utf-8") as f:
-        lines = f.readlines()
-        qos_const = int(lines[1].replace('qos_constraint=', ''))
-    print("\nQoS约束上限数据读取成功！为{}！".format(qos_const))
 
-    return cus_list, sit_list, qos_dict, qos_const
+def read_data():
+    """
+    从data目录读取数据，并转换为内部可读取数据
+    :return: cus_list: 客户类对象列表
+    :return: sit_list: 边缘节点类对象列表
+    :return: qos_dict: 边缘节点和客户之间的时延字典，键(site_name, customer_name)，值qos_value
+    :return qos_const: 客户节点和边缘节点之间的网络质量
+    """
+    instance = read_instance()
+    return instance.cus_list, instance.sit_list, instance.qos_dict(), instance.qos_constraint
 
 
 if __name__ == '__main__':
@@ -6,14 +6,503 @@
 @time: 2022/3/23 21:02
 @description:
 """
+import heapq
 import math
 import sys
+import time
 import numpy as np
-from utils import Parameter
+from utils import Parameter, RunController, Tracer
 
 # sys.stdout = None
 parameter = Parameter()
 
+write_buffer_size = 1 << 20  # 写入解决方案时，每次写入文件的缓冲区大小（字节）
+
+
+def percentile_index(n: int) -> int:
+    """
+    计算长度为n的负载序列中95分位带宽值的位次（从1开始计数），即第ceil(0.95*n)小的值
+    """
+    return min([math.ceil(0.95 * n), n])
+
+
+def node_prefixes(cus_names: list, sit_names: list) -> tuple:
+    """写入解决方案时预先编码的节点名称：客户节点行首"name:"，边缘节点分配项前缀"<name,"""
+    return [(name + ':').encode('utf-8') for name in cus_names], [('<' + name + ',').encode('utf-8') for name in sit_names]
+
+
+def encode_timestep(cus_prefix: list, sit_prefix: list, i_index, j_index, values) -> bytes:
+    """
+    将一个时刻的非零分配（按照客户节点、边缘节点的顺序排列）编码为解决方案文件中的若干行，每个客户节点一行
+    """
+    entries = [[] for _ in range(len(cus_prefix))]
+    for i, j, sol in zip(i_index.tolist(), j_index.tolist(), values.tolist()):
+        entries[i].append(sit_prefix[j] + b'%d>' % sol)
+    return b''.join([cus_prefix[i] + b','.join(entries[i]) + b'\n' for i in range(len(cus_prefix))])
+
+
+def order_band(partitioned: np.ndarray, k: int, size: int) -> np.ndarray:
+    """
+    由已在第k-1个位置划分（np.partition）的负载列，计算各列第k-1、k、k+1、...、k+size小的负载（位次从1开始计数），
+    位次小于1时取0，位次超过时刻数量时取最大负载
+    :param partitioned: numpy二维数组，维度：t*列数
+    :return: numpy二维数组，维度：(size+2)*列数
+    """
+    band = np.empty((size + 2, partitioned.shape[1]), dtype=np.int64)
+    band[0] = partitioned[:k - 1].max(axis=0) if k > 1 else 0
+    band[1] = partitioned[k - 1]
+    upper = partitioned[k:]
+    m = min(size, upper.shape[0])
+    if m > 0:
+        if m < upper.shape[0]:
+            upper = np.partition(upper, m - 1, axis=0)[:m]
+        band[2:2 + m] = np.sort(upper, axis=0)
+    band[2 + m:] = band[1 + m]
+    return band
+
+
+class SiteLoadTracker:
+    """
+    边缘节点负载序列的顺序统计结构，用来增量维护每个边缘节点的95分位带宽值，其逻辑为：
+        （1）对每个边缘节点j，将前n个时刻的负载w_j_t划分为两个堆：top为最大的n-p95+1个
+        负载（小顶堆），bottom为其余p95-1个负载（大顶堆），则top的堆顶即为95分位带宽值
+        （2）修改某个时刻t的负载w_j_t，只需在其所在堆中压入新值，并至多交换一次两个堆顶，
+        复杂度为O(log T)；堆中过期元素采用版本号惰性删除
+        （3）全量重算采用一次np.partition，并清空各个堆（在下一次增量修改时惰性重建）
+    同时支持在末尾追加新时刻（append），用于在构建初始解过程中维护截止到当前时刻的95分位带宽值；
+    此外维护各个边缘节点95分位附近的若干个负载（band），用于候选解目标函数变化量的下界（见Candidate.lower_bound），
+    全量重算和evaluate_rows/set_rows时顺带更新，单点修改和追加时标记过期，使用时惰性重算
+    """
+
+    def __init__(self, loads: np.ndarray, length=None):
+        """
+        :param loads: numpy二维数组，维度：t*j，即各个时刻各个边缘节点的负载
+        :param length: 当前有效的时刻数量（前length个时刻），默认为全部时刻
+        """
+        self.loads = loads  # 各个时刻各个边缘节点的负载，t*j
+        self.length = loads.shape[0] if length is None else length  # 当前有效的时刻数量
+        self.cost = np.zeros(loads.shape[1], dtype=np.int64)  # 各个边缘节点当前的95分位带宽值
+
+        self._top = [None] * loads.shape[1]  # 各个边缘节点的top堆，元素为(w_j_t, t, 版本号)
+        self._bottom = [None] * loads.shape[1]  # 各个边缘节点的bottom堆，元素为(-w_j_t, t, 版本号)
+        self._top_size = [0] * loads.shape[1]  # 各个边缘节点top堆中的有效元素数量
+        self._in_top = [None] * loads.shape[1]  # 各个边缘节点各个时刻的负载是否位于top堆
+        self._version = [None] * loads.shape[1]  # 各个边缘节点各个时刻的负载版本号
+
+        self.band_size = parameter.bound_band  # band中高于95分位带宽值的负载数量
+        self.band = np.zeros((self.band_size + 2, loads.shape[1]), dtype=np.int64)  # 各个边缘节点的band，见order_band
+        self._band_stale = np.ones(loads.shape[1], dtype=bool)  # 各个边缘节点的band是否过期
+        self._pending_band = None  # 最近一次evaluate_rows计算的(受影响的边缘节点索引, band)，由set_rows采用
+
+        self.rebuild()
+
+    def rebuild(self):
+        """
+        基于一次np.partition全量重算所有边缘节点的95分位带宽值
+        """
+        if self.length > 0:
+            k = percentile_index(self.length)
+            partitioned = np.partition(self.loads[:self.length], k - 1, axis=0)
+            self.cost = partitioned[k - 1].astype(np.int64)
+            self.band = order_band(partitioned, k, self.band_size)
+            self._band_stale[:] = False
+        else:
+            self.cost = np.zeros(self.loads.shape[1], dtype=np.int64)
+            self._band_stale[:] = True
+        for j in range(self.loads.shape[1]):
+            self._top[j] = None
+        return self.cost
+
+    def total(self) -> int:
+        """当前所有边缘节点的95分位带宽值之和，即目标函数值"""
+        return int(self.cost.sum())
+
+    def _build(self, j: int):
+        """基于前length个时刻的负载，重建边缘节点j的两个堆"""
+        n = self.length
+        column = self.loads[:n, j].tolist()
+        in_top = [False] * self.loads.shape[0]
+        version = [0] * self.loads.shape[0]
+        top, bottom = [], []
+        if n > 0:
+            k = percentile_index(n)
+            order = np.argpartition(self.loads[:n, j], k - 1)
+            for t in order[k - 1:].tolist():
+                in_top[t] = True
+                top.append((column[t], t, 0))
+            for t in order[:k - 1].tolist():
+                bottom.append((-column[t], t, 0))
+            heapq.heapify(top)
+            heapq.heapify(bottom)
+        self._top[j], self._bottom[j] = top, bottom
+        self._top_size[j] = len(top)
+        self._in_top[j], self._version[j] = in_top, version
+
+    def _peek(self, heap: list, version: list):
+        """弹出堆顶的过期元素，并返回有效的堆顶元素（堆为空时返回None）"""
+        while heap and heap[0][2] != version[heap[0][1]]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def _to_bottom(self, j: int):
+        """将边缘节点j的top堆顶移动到bottom堆"""
+        top, version = self._top[j], self._version[j]
+        self._peek(top, version)
+        value, t, ver = heapq.heappop(top)
+        heapq.heappush(self._bottom[j], (-value, t, ver))
+        self._in_top[j][t] = False
+        self._top_size[j] -= 1
+
+    def _to_top(self, j: int):
+        """将边缘节点j的bottom堆顶移动到top堆"""
+        bottom, version = self._bottom[j], self._version[j]
+        self._peek(bottom, version)
+        value, t, ver = heapq.heappop(bottom)
+        heapq.heappush(self._top[j], (-value, t, ver))
+        self._in_top[j][t] = True
+        self._top_size[j] += 1
+
+    def _settle(self, j: int) -> int:
+        """恢复边缘节点j两个堆之间的有序性，更新并返回其95分位带宽值"""
+        top, bottom, version = self._top[j], self._bottom[j], self._version[j]
+        head_top, head_bottom = self._peek(top, version), self._peek(bottom, version)
+        if head_top is not None and head_bottom is not None and -head_bottom[0] > head_top[0]:
+            self._to_bottom(j)
+            self._to_top(j)
+            head_top = self._peek(top, version)
+        self.cost[j] = head_top[0] if head_top is not None else 0
+        # 过期元素过多时，重建两个堆，防止堆无限增长
+        if len(top) + len(bottom) > 3 * self.length + 64:
+            self._build(j)
+        return int(self.cost[j])
+
+    def set(self, t: int, j: int, value: int) -> int:
+        """
+        将边缘节点j在时刻t的负载修改为value，复杂度为O(log T)
+        :return: 边缘节点j新的95分位带宽值
+        """
+        if self._top[j] is None:
+            self._build(j)
+        value = int(value)
+        self.loads[t, j] = value
+        self._band_stale[j] = True
+        version = self._version[j]
+        version[t] += 1
+        if self._in_top[j][t]:
+            heapq.heappush(self._top[j], (value, t, version[t]))
+        else:
+            heapq.heappush(self._bottom[j], (-value, t, version[t]))
+        return self._settle(j)
+
+    def add(self, t: int, j: int, delta: int) -> int:
+        """
+        将边缘节点j在时刻t的负载增加delta（可为负数），复杂度为O(log T)
+        :return: 边缘节点j新的95分位带宽值
+        """
+        return self.set(t, j, int(self.loads[t, j]) + int(delta))
+
+    def evaluate_rows(self, t_index, rows: np.ndarray):
+        """
+        在不修改当前状态的前提下，计算将时刻t_index的负载替换为rows之后，受影响边缘节点新的95分位带宽值，
+        仅对负载发生变化的边缘节点重算（一次np.partition）
+        :param t_index: 时刻索引数组
+        :param rows: numpy二维数组，维度：len(t_index)*j
+        :return: 受影响的边缘节点索引数组，及其新的95分位带宽值数组
+        """
+        j_index = np.nonzero(np.any(rows != self.loads[t_index], axis=0))[0]
+        if len(j_index) == 0:
+            return j_index, self.cost[j_index]
+        columns = self.loads[:self.length, j_index]
+        columns[t_index] = rows[:, j_index]
+        k = percentile_index(self.length)
+        partitioned = np.partition(columns, k - 1, axis=0)
+        self._pending_band = (j_index, order_band(partitioned, k, self.band_size))
+        return j_index, partitioned[k - 1].astype(np.int64)
+
+    def set_rows(self, t_index, rows: np.ndarray, j_index=None, cost=None):
+        """
+        将时刻t_index的负载批量替换为rows，并更新受影响边缘节点的95分位带宽值，受影响边缘节点的堆将惰性重建
+        :param j_index: 受影响的边缘节点索引数组，与cost均为evaluate_rows的返回值，未指定时重新计算
+        """
+        if j_index is None:
+            j_index, cost = self.evaluate_rows(t_index, rows)
+        self.loads[t_index] = rows
+        self.cost[j_index] = cost
+        if self._pending_band is not None and self._pending_band[0] is j_index:
+            self.band[:, j_index] = self._pending_band[1]
+            self._band_stale[j_index] = False
+        else:
+            self._band_stale[j_index] = True
+        self._pending_band = None
+        for j in j_index.tolist():
+            self._top[j] = None
+
+    def band_ranks(self) -> np.ndarray:
+        """band各行对应的位次（从1开始计数）：k-1、k、...、k+band_size，k为95分位带宽值的位次"""
+        k = percentile_index(self.length)
+        return np.arange(k - 1, k + self.band_size + 1)
+
+    def band_of(self, j_index) -> np.ndarray:
+        """
+        边缘节点j_index的band（过期的边缘节点基于一次np.partition重算），维度：(band_size+2)*len(j_index)
+        """
+        stale = j_index[self._band_stale[j_index]]
+        if len(stale) > 0:
+            k = percentile_index(self.length)
+            partitioned = np.partition(self.loads[:self.length, stale], k - 1, axis=0)
+            self.band[:, stale] = order_band(partitioned, k, self.band_size)
+            self._band_stale[stale] = False
+        return self.band[:, j_index]
+
+    def append(self, row) -> np.ndarray:
+        """
+        在末尾追加一个新时刻，row为该时刻各个边缘节点的负载，复杂度为O(N*log T)
+        :return: 追加后各个边缘节点截止到当前时刻的95分位带宽值
+        """
+        t = self.length
+        for j in range(self.loads.shape[1]):
+            if self._top[j] is None:
+                self._build(j)
+        self.loads[t] = row
+        self.length += 1
+        self._band_stale[:] = True
+        k = self.length - percentile_index(self.length) + 1  # top堆应包含的元素数量
+        for j in range(self.loads.shape[1]):
+            version = self._version[j]
+            version[t] = 0
+            # 先压入bottom堆，再将bottom堆顶移动到top堆，最后按k调整top堆的大小
+            heapq.heappush(self._bottom[j], (-int(self.loads[t, j]), t, 0))
+            self._to_top(j)
+            while self._top_size[j] > k:
+                self._to_bottom(j)
+            while self._top_size[j] < k:
+                self._to_top(j)
+            self.cost[j] = self._peek(self._top[j], version)[0]
+        return self.cost
+
+
+def segment_sum(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    按照CSR偏移数组对values的最后一维分段求和（空段的和为0）
+    :param values: numpy二维数组，维度：t*e
+    :param offsets: 偏移数组，长度为分段数量+1
+    :return: numpy二维数组，维度：t*分段数量
+    """
+    sums = np.zeros((values.shape[0], len(offsets) - 1), dtype=np.int64)
+    nonempty = np.nonzero(offsets[1:] > offsets[:-1])[0]
+    if len(nonempty) > 0:
+        sums[:, nonempty] = np.add.reduceat(values, offsets[nonempty], axis=1, dtype=np.int64)
+    return sums
+
+
+class SparseSolution:
+    """
+    稀疏解：仅存储满足QoS约束的边(i, j)上的分配带宽，维度：t*e（int32），e为满足QoS约束的(i, j)数量，
+    边按照客户节点、边缘节点的顺序排列，按客户节点和按边缘节点的聚合均基于预先计算的索引数组
+    """
+
+    def __init__(self, adjacency, n_time: int):
+        """
+        :param adjacency: 满足QoS约束的二部图邻接结构（ReadData.QosAdjacency），边的顺序与其正向邻接一致
+        :param n_time: 时刻数量
+        """
+        self.adjacency = adjacency  # 满足QoS约束的二部图邻接结构
+        self.shape = (n_time,) + adjacency.mask.shape  # 对应稠密解的维度：t*i*j
+        self.edge_cus, self.edge_sit = adjacency.edge_cus, adjacency.cus_sites  # 各条边的客户节点索引和边缘节点索引
+        self.edge_id = adjacency.edge_id  # (i, j)->边索引，-1表示不满足QoS约束
+        self.cus_offsets = adjacency.cus_offsets  # 按客户节点聚合的偏移数组
+        self.sit_order, self.sit_offsets = adjacency.sit_edges, adjacency.sit_offsets  # 按边缘节点聚合的边排列及偏移数组
+        self.flows = np.zeros((n_time, adjacency.n_edges), dtype=np.int32)  # 各个时刻各条边上的分配带宽，t*e
+
+    @classmethod
+    def from_dense(cls, solution: np.ndarray, adjacency):
+        """
+        由稠密解构建稀疏解（不满足QoS约束的位置上的分配将被丢弃，调用前应检查约束（2））
+        """
+        sparse = cls(adjacency, solution.shape[0])
+        sparse.flows[...] = solution[:, sparse.edge_cus, sparse.edge_sit]
+        return sparse
+
+    def to_dense(self) -> np.ndarray:
+        """转换为稠密解，维度：t*i*j"""
+        solution = np.zeros(self.shape, dtype=np.int64)
+        solution[:, self.edge_cus, self.edge_sit] = self.flows
+        return solution
+
+    def site_loads(self, terminated_t=None) -> np.ndarray:
+        """各个时刻各个边缘节点的负载，维度：t*j"""
+        flows = self.flows if terminated_t is None else self.flows[0:terminated_t + 1]
+        return segment_sum(flows[:, self.sit_order], self.sit_offsets)
+
+    def customer_loads(self) -> np.ndarray:
+        """各个时刻各个客户节点被满足的带宽，维度：t*i"""
+        return segment_sum(self.flows, self.cus_offsets)
+
+    def nonzero_at(self, t: int):
+        """时刻t的非零分配，按照客户节点、边缘节点的顺序排列：客户节点索引、边缘节点索引、分配带宽"""
+        e_index = np.nonzero(self.flows[t])[0]
+        return self.edge_cus[e_index], self.edge_sit[e_index], self.flows[t, e_index]
+
+    def negative(self) -> tuple:
+        """分配带宽为负数的位置，格式与np.nonzero在稠密解上的返回值相同：(t, i, j)"""
+        t_index, e_index = np.nonzero(self.flows < 0)
+        return t_index, self.edge_cus[e_index], self.edge_sit[e_index]
+
+    def __getitem__(self, index: tuple):
+        t, i, j = index
+        e = self.edge_id[i, j]
+        return 0 if e < 0 else self.flows[t, e]
+
+    def __setitem__(self, index: tuple, value):
+        t, i, j = index
+        e = self.edge_id[i, j]
+        if e < 0:
+            if value != 0:
+                raise ValueError("客户节点{}和边缘节点{}之间不满足QoS约束，无法分配带宽！".format(i, j))
+            return
+        self.flows[t, e] = value
+
+    @property
+    def nbytes(self) -> int:
+        """稀疏解占用的内存（字节）"""
+        return self.flows.nbytes
+
+
+class FeasibilityReport:
+    """
+    解的可行性检查报告，记录每条约束被违背的次数，以及前top_k个违背约束的索引：
+        约束（1）（2）的索引为(t, i, j)，约束（3）的索引为(t, i)，约束（4）的索引为(t, j)
+    """
+
+    constraint_desc = {
+        1: "x_ijt为非负整数",
+        2: "客户节点带宽需求只能分配到满足QoS约束的边缘节点",
+        3: "客户节点需求必须全部分配给边缘节点",
+        4: "边缘节点接受的带宽需求不能超过其带宽上限",
+    }
+
+    def __init__(self, results, top_k: int):
+
+        self.results = results  # 被检查的解决方案
+        self.top_k = top_k  # 每条约束最多记录的违背约束的索引数量
+        self.counts = {c: 0 for c in self.constraint_desc}  # 每条约束被违背的次数
+        self.offenders = {c: [] for c in self.constraint_desc}  # 每条约束前top_k个违背约束的索引
+        self.cus_loads = None  # 各个时刻各个客户节点被满足的带宽，t*i
+        self.site_loads = None  # 各个时刻各个边缘节点的负载，t*j
+
+    def add(self, constraint: int, index: tuple):
+        """记录约束constraint的违背情况，index为np.nonzero的返回值"""
+        self.counts[constraint] = len(index[0])
+        self.offenders[constraint] = list(zip(*(axis[:self.top_k].tolist() for axis in index)))
+
+    @property
+    def feasible(self) -> bool:
+        """True表示当前解为可行解"""
+        return sum(self.counts.values()) == 0
+
+    def __bool__(self):
+        return self.feasible
+
+    def describe(self, constraint: int, index: tuple) -> str:
+        """将违背约束的索引转换为可读的描述"""
+        results = self.results
+        if constraint in (1, 2):
+            t, i, j = index
+            return "在时刻{}客户节点{}和边缘节点{}分配带宽{}".format(
+                results.mtime_list[t], results.cus_list[i].name, results.sit_list[j].name, results.solution[t, i, j])
+        if constraint == 3:
+            t, i = index
+            return "在时刻{}客户节点{}需求{}，被满足{}".format(
+                results.mtime_list[t], results.cus_list[i].name, results.cus_list[i].demand[t], self.cus_loads[t, i])
+        t, j = index
+        return "在时刻{}边缘节点{}带宽上限{}，被分配{}".format(
+            results.mtime_list[t], results.sit_list[j].name, results.sit_list[j].band_width, self.site_loads[t, j])
+
+    def __str__(self):
+        lines = []
+        for c, desc in self.constraint_desc.items():
+            if self.counts[c] == 0:
+                lines.append("通过：约束（{}）{}！".format(c, desc))
+                continue
+            lines.append("不满足约束（{}）：{}！违背{}次，例如：".format(c, desc, self.counts[c]))
+            for index in self.offenders[c]:
+                lines.append("    " + self.describe(c, index))
+        lines.append("当前解为可行解！" if self.feasible else "警告！当前解为不可行解！")
+        return '\n'.join(lines)
+
+
+class UndoLog:
+    """
+    解的撤销日志：原地修改解之前记录被修改单元格的原值（按块记录，每块为时刻、客户节点、边缘节点索引（整数或
+    索引数组）和原值），回滚时按相反顺序写回原值，内存占用与被修改的单元格数量成正比
+    """
+
+    def __init__(self, solution: np.ndarray):
+        self.solution = solution  # 被修改的解，维度：t*i*j
+        self.blocks = []  # (时刻索引, 客户节点索引, 边缘节点索引, 原值)
+        self.n_cells = 0  # 已记录的单元格数量
+
+    def record(self, t, i, j):
+        """在修改solution[t, i, j]之前记录其原值（t、i、j为整数或索引数组）"""
+        old = self.solution[t, i, j]
+        self.blocks.append((t, i, j, old))
+        self.n_cells += np.size(old)
+
+    def rollback(self):
+        """按相反顺序写回原值，并清空日志"""
+        for t, i, j, old in reversed(self.blocks):
+            self.solution[t, i, j] = old
+        self.clear()
+
+    def clear(self):
+        """提交修改：丢弃已记录的原值"""
+        Tracer().count('undo_cells', self.n_cells)
+        self.blocks = []
+        self.n_cells = 0
+
+
+class SolutionSnapshot:
+    """
+    最优解快照：建立时复制一次完整的解，此后记录当前解被修改的时刻，仅在当前解优于快照时复制这些时刻，
+    因此当前解可以接受劣于最优解的候选解，而每次迭代的复制量与被修改的时刻数量成正比
+    """
+
+    def __init__(self, results):
+        self.results = results  # 当前解
+        self.solution = results.solution.copy()  # 最优解，维度：t*i*j
+        self.obj_value = results.obj_value  # 最优解的目标函数值
+        self.dirty = set()  # 自上次快照以来当前解被修改的时刻
+
+    def touch(self, t_index):
+        """记录当前解在时刻t_index被修改"""
+        self.dirty.update(np.asarray(t_index).tolist())
+
+    def _dirty_index(self) -> np.ndarray:
+        return np.fromiter(sorted(self.dirty), dtype=np.int64, count=len(self.dirty))
+
+    def update(self) -> bool:
+        """当前解严格优于最优解时，复制被修改的时刻作为新的最优解"""
+        if self.results.obj_value >= self.obj_value:
+            return False
+        t_index = self._dirty_index()
+        self.solution[t_index] = self.results.solution[t_index]
+        self.dirty.clear()
+        self.obj_value = self.results.obj_value
+        Tracer().count('snapshot_timesteps', len(t_index))
+        return True
+
+    def restore(self):
+        """当前解劣于最优解时，将被修改的时刻恢复为最优解，并重新计算目标函数值"""
+        if self.results.obj_value <= self.obj_value:
+            return
+        t_index = self._dirty_index()
+        self.results.solution[t_index] = self.solution[t_index]
+        self.dirty.clear()
+        if self.results.sit_residual is not None:
+            self.results.build_state()
+        else:
+            self.results.objective()
+
 
 class Results:
     """
@@ -23,150 +512,334 @@ class Results:
     def __init__(self, cus_list: list, sit_list: list, qos_dict: dict, qos_constraint: int):
 
         # numpy三维数组，对应于变量x_ijt及其值，维度：t*i*j，及时刻数量*客户节点数量*边缘节点数量
-        self.solution = np.zeros((len(cus_list[0].mtime), len(cus_list), len(sit_list)), dtype=np.int)
+        # 可通过compact()转换为仅存储满足QoS约束的边的稀疏解（SparseSolution），通过expand()转换回稠密解
+        self.solution = np.zeros((len(cus_list[0].mtime), len(cus_list), len(sit_list)), dtype=np.int64)
 
+        self.instance = cus_list[0].instance  # 问题实例，持有连续存储的带宽需求矩阵等数组
         self.cus_list = cus_list  # 客户类对象列表
         self.sit_list = sit_list  # 边缘节点类对象列表
         self.qos_constraint = qos_constraint  # 客户节点和边缘节点之间的网络质量阈值（超过该值将不得分配）
 
         self.qos_dict = qos_dict  # 边缘节点和客户之间的时延字典，键(site_name, customer_name)，值qos_value（Python字典结构）
+        self.adjacency = self.instance.adjacency  # 满足QoS约束的二部图邻接结构（问题实例内共享）
         self.qos_np = self.convert_qos_constraint()  # 客户节点和边缘节点之间的网络质量（Numpy二维数组结构），i*j
 
         self.obj_value = sys.maxsize  # 当前solution的目标函数值
 
         self.mtime_list = cus_list[0].mtime  # 所有客户节点共用时刻列表
-        self.percentile_95 = min([math.ceil(0.95 * len(cus_list[0].mtime)), len(cus_list[0].mtime)])  # 95分位数
+        self.percentile_95 = percentile_index(len(cus_list[0].mtime))  # 95分位数
+
+        self.tracker = None  # 各个边缘节点负载序列的顺序统计结构（SiteLoadTracker），调用objective()后建立
+        # 变更操作（assign/release/move）维护的剩余量，调用build_state()后建立，各个时刻各个边缘节点的负载即
+        # tracker.loads，各个边缘节点的95分位带宽值即tracker.cost
+        self.sit_residual = None  # 各个时刻各个边缘节点的剩余带宽，t*j
+        self.cus_residual = None  # 各个时刻各个客户节点未被满足的需求，t*i
 
     def convert_qos_constraint(self) -> np.array:
         """
-        将边缘节点和客户之间的时延关系qos（Python字典结构）转换为qos_np（Numpy二维数组结构）
+        边缘节点和客户之间的时延关系qos_np（Numpy二维数组结构），直接引用问题实例内共享的只读数组，不再查询qos_dict
         :return:
         """
-        qos_np = np.zeros((len(self.cus_list), len(self.sit_list)))
-        for i in range(len(self.cus_list)):
-            for j in range(len(self.sit_list)):
-                qos_np[i][j] = self.qos_dict[self.sit_list[j].name, self.cus_list[i].name]
-        return qos_np
+        return self.adjacency.qos
 
-    def check_feasible(self) -> bool:
+    def demand_matrix(self) -> np.ndarray:
         """
-        :return Status: True表示当前Solution为可行解，False为不可行解
-        检查当前solution是否为可行解，即满足如下约束：
+        各个时刻各个客户节点的带宽需求
+        :return: numpy二维数组，维度：t*i
+        """
+        return self.instance.demand
+
+    def capacity_vector(self) -> np.ndarray:
+        """
+        各个边缘节点的带宽上限
+        :return: numpy一维数组，维度：j
+        """
+        return self.instance.band_width
+
+    def check_feasible(self, top_k=parameter.violation_top_k):
+        """
+        :return FeasibilityReport: 可行性检查报告，可直接作为布尔值使用，True表示当前Solution为可行解
+        基于NumPy广播检查当前solution是否为可行解，即满足如下约束：
         （1）x_ijt为非负整数
         （2）客户节点带宽需求只能分配到满足QoS约束的边缘节点
         （3）客户节点需求必须全部分配给边缘节点
         （4）边缘节点接受的带宽需求不能超过其带宽上限
+        :param top_k: 每条约束最多记录的违背约束的索引数量
         """
-        print("\n开始验证当前解是否为可行解！")
-
         if isinstance(self.solution, str):
             return NotImplemented
 
-        count = 0  # 记录违背约束的次数
-
-        if np.any(self.solution < 0):
-            # raise Exception("不满足约束（1）：x_ijt为非负整数！")
-            print(self.solution)
-            print("不满足约束（1）：x_ijt为非负整数！")
-            count += 1
-        print("通过：约束（1）x_ijt为非负整数！")
-
-        for t in range(len(self.mtime_list)):
-            sub_solution = self.solution[t]
-            for i in range(len(self.cus_list)):
-                for j in range(len(self.sit_list)):
-                    if self.qos_np[i][j] >= self.qos_constraint and sub_solution[i][j] != 0:
-                        print("在时刻{}客户节点{}和边缘节点{}不满足".format(self.mtime_list[t],
-                                                             self.cus_list[i].name,
-                                                             self.sit_list[j].name), end='')
-                        print("约束（2）：客户节点带宽需求只能分配到满足QoS约束的边缘节点！")
-                        count += 1
-        print("通过：约束（2）客户节点带宽需求只能分配到满足QoS约束的边缘节点！")
-
-        for t in range(len(self.mtime_list)):
-            for i in range(len(self.cus_list)):
-                sub_solution = self.solution[t][i]
-                if sub_solution.sum() != self.cus_list[i].demand[t]:
-                    print("在时刻{}客户节点{}不满足".format(self.mtime_list[t], self.cus_list[i].name), end='')
-                    print("约束（3）：客户节点需求{}必须全部分配给边缘节点！被满足{}！".format(
-                        self.cus_list[i].demand[t], sub_solution.sum()
-                    ))
-                    count += 1
-        print("通过：约束（3）客户节点需求必须全部分配给边缘节点！")
-
-        for t in range(len(self.mtime_list)):
-            for j in range(len(self.sit_list)):
-                provide = sum(self.solution[t][i][j] for i in range(len(self.cus_list)))
-                if provide > self.sit_list[j].band_width:
-                    print("在时刻{}边缘节点{}不满足".format(self.mtime_list[t], self.cus_list[j].name), end='')
-                    print("约束（4）：边缘节点接受的带宽需求不能超过其带宽上限！为{}".format(provide))
-                    count += 1
-        print("通过：约束（4）边缘节点接受的带宽需求不能超过其带宽上限！")
-
-        if count == 0:
-            print("当前解为可行解！")
-            return True
+        report = FeasibilityReport(self, top_k)
+        report.cus_loads = self.customer_loads()
+        report.site_loads = self.site_loads()
+
+        if isinstance(self.solution, SparseSolution):
+            # 约束（1）：索引为(t, i, j)
+            report.add(1, self.solution.negative())
+            # 约束（2）：稀疏解仅存储满足QoS约束的边，必然满足
         else:
-            print("警告！当前解为不可行解！")
-            return False
+            # 约束（1）：索引为(t, i, j)
+            report.add(1, np.nonzero(self.solution < 0))
+
+            # 约束（2）：不满足QoS约束的掩码（i*j）乘以解，非零位置即为违背约束的(t, i, j)
+            qos_mask = (~self.adjacency.mask).astype(self.solution.dtype)
+            report.add(2, np.nonzero(self.solution * qos_mask))
+
+        # 约束（3）：索引为(t, i)
+        report.add(3, np.nonzero(report.cus_loads != self.demand_matrix()))
+
+        # 约束（4）：索引为(t, j)
+        report.add(4, np.nonzero(report.site_loads > self.capacity_vector()))
+
+        return report
+
+    def site_loads(self, terminated_t=None) -> np.ndarray:
+        """
+        计算各个时刻各个边缘节点的负载w_j_t，若terminated_t指定了，则仅计算mtime_list[0:terminated_t+1]
+        :return: numpy二维数组，维度：t*j
+        """
+        if isinstance(self.solution, SparseSolution):
+            return self.solution.site_loads(terminated_t)
+        if terminated_t is None:
+            return self.solution.sum(axis=1)
+        return self.solution[0:terminated_t + 1].sum(axis=1)
+
+    def customer_loads(self) -> np.ndarray:
+        """
+        计算各个时刻各个客户节点被满足的带宽
+        :return: numpy二维数组，维度：t*i
+        """
+        if isinstance(self.solution, SparseSolution):
+            return self.solution.customer_loads()
+        return self.solution.sum(axis=2)
+
+    def nonzero_at(self, t: int):
+        """
+        时刻t的非零分配，按照客户节点、边缘节点的顺序排列
+        :return: 客户节点索引数组、边缘节点索引数组、分配带宽数组
+        """
+        if isinstance(self.solution, SparseSolution):
+            return self.solution.nonzero_at(t)
+        sub_solution = self.solution[t]
+        i_index, j_index = np.nonzero(sub_solution)
+        return i_index, j_index, sub_solution[i_index, j_index]
+
+    def compact(self):
+        """
+        将稠密解转换为仅存储满足QoS约束的边的稀疏解（SparseSolution），以大幅降低内存占用，
+        稀疏解支持目标函数计算、可行性检查和写入文件，调用前应保证满足约束（2）
+        """
+        if not isinstance(self.solution, SparseSolution):
+            self.solution = SparseSolution.from_dense(self.solution, self.adjacency)
+        return self.solution
+
+    def expand(self):
+        """将稀疏解转换回稠密解"""
+        if isinstance(self.solution, SparseSolution):
+            self.solution = self.solution.to_dense()
+        return self.solution
 
     def objective(self):
         """
-        根据目标函数计算当前solution的目标函数值
+        根据目标函数计算当前solution的目标函数值，并重建各个边缘节点负载序列的顺序统计结构
         """
         if isinstance(self.solution, str):
             return NotImplemented
 
-        obj_value = 0
-
-        for j in range(len(self.sit_list)):
-            w_j_list = []
-            for t in range(len(self.mtime_list)):
-                w_j_t = sum(self.solution[t][i][j] for i in range(len(self.cus_list)))
-                w_j_list.append(w_j_t)
-            w_j_list.sort()
-            s_j = w_j_list[self.percentile_95 - 1]
-            obj_value += s_j
+        self.tracker = SiteLoadTracker(self.site_loads())
+        self.sit_residual = self.cus_residual = None  # solution可能已被直接修改，剩余量需重新建立
+        obj_value = self.tracker.total()
         self.obj_value = obj_value
+        Tracer().count('objective_evaluations')
         print("计算成功！当前解的目标函数值为{}！".format(obj_value))
 
+    def build_state(self):
+        """
+        重新计算目标函数值，并建立变更操作（assign/release/move）维护的聚合状态：各个时刻各个边缘节点的负载和
+        剩余带宽、各个时刻各个客户节点未被满足的需求、各个边缘节点的95分位带宽值。
+        此后应通过变更操作或set_rows修改解，直接修改solution后需重新调用
+        """
+        self.objective()
+        self.sit_residual = self.capacity_vector()[None, :] - self.tracker.loads
+        self.cus_residual = self.demand_matrix() - self.customer_loads()
+
+    def _ensure_state(self):
+        if self.sit_residual is None:
+            self.build_state()
+
+    def assign_error(self, t: int, i: int, j: int, amount: int):
+        """
+        检查能否在时刻t将客户节点i的amount带宽分配给边缘节点j，复杂度为O(1)
+        :return: 不能分配的原因，可以分配时返回None
+        """
+        self._ensure_state()
+        if amount <= 0:
+            return "分配的带宽{}必须为正整数！".format(amount)
+        if not self.adjacency.mask[i, j]:
+            return "客户节点{}和边缘节点{}之间不满足QoS约束！".format(i, j)
+        if amount > self.cus_residual[t, i]:
+            return "时刻{}客户节点{}未被满足的需求{}不足{}！".format(t, i, self.cus_residual[t, i], amount)
+        if amount > self.sit_residual[t, j]:
+            return "时刻{}边缘节点{}的剩余带宽{}不足{}！".format(t, j, self.sit_residual[t, j], amount)
+        return None
+
+    def release_error(self, t: int, i: int, j: int, amount: int):
+        """
+        检查能否在时刻t收回客户节点i分配给边缘节点j的amount带宽，复杂度为O(1)
+        :return: 不能收回的原因，可以收回时返回None
+        """
+        self._ensure_state()
+        if amount <= 0:
+            return "收回的带宽{}必须为正整数！".format(amount)
+        if amount > self.solution[t, i, j]:
+            return "时刻{}客户节点{}分配给边缘节点{}的带宽{}不足{}！".format(t, i, j, self.solution[t, i, j], amount)
+        return None
+
+    def move_error(self, t: int, i: int, j_from: int, j_to: int, amount: int):
+        """
+        检查能否在时刻t将客户节点i的amount带宽从边缘节点j_from转移到边缘节点j_to，复杂度为O(1)
+        :return: 不能转移的原因，可以转移时返回None
+        """
+        error = self.release_error(t, i, j_from, amount)
+        if error is not None:
+            return error
+        if j_from == j_to:
+            return "转出和转入的边缘节点均为{}！".format(j_from)
+        if not self.adjacency.mask[i, j_to]:
+            return "客户节点{}和边缘节点{}之间不满足QoS约束！".format(i, j_to)
+        if amount > self.sit_residual[t, j_to]:
+            return "时刻{}边缘节点{}的剩余带宽{}不足{}！".format(t, j_to, self.sit_residual[t, j_to], amount)
+        return None
+
+    def _shift(self, t: int, i: int, j: int, amount: int) -> int:
+        """将时刻t客户节点i分配给边缘节点j的带宽增加amount（可为负数），更新聚合状态，返回目标函数变化量"""
+        self.solution[t, i, j] += amount
+        self.sit_residual[t, j] -= amount
+        old_cost = int(self.tracker.cost[j])
+        delta = self.tracker.add(t, j, amount) - old_cost
+        self.obj_value += delta
+        return delta
+
+    def assign(self, t: int, i: int, j: int, amount: int) -> int:
+        """
+        在时刻t将客户节点i的amount带宽分配给边缘节点j，可行性检查为O(1)，边缘节点j的95分位带宽值的更新为O(log T)
+        :return: 目标函数变化量
+        """
+        error = self.assign_error(t, i, j, amount)
+        if error is not None:
+            raise Exception(error)
+        self.cus_residual[t, i] -= amount
+        return self._shift(t, i, j, amount)
+
+    def release(self, t: int, i: int, j: int, amount: int) -> int:
+        """
+        在时刻t收回客户节点i分配给边缘节点j的amount带宽（该部分需求变为未被满足）
+        :return: 目标函数变化量
+        """
+        error = self.release_error(t, i, j, amount)
+        if error is not None:
+            raise Exception(error)
+        self.cus_residual[t, i] += amount
+        return self._shift(t, i, j, -amount)
+
+    def move(self, t: int, i: int, j_from: int, j_to: int, amount: int) -> int:
+        """
+        在时刻t将客户节点i的amount带宽从边缘节点j_from转移到边缘节点j_to
+        :return: 目标函数变化量
+        """
+        error = self.move_error(t, i, j_from, j_to, amount)
+        if error is not None:
+            raise Exception(error)
+        return self._shift(t, i, j_from, -amount) + self._shift(t, i, j_to, amount)
+
+    def set_flow(self, t: int, i: int, j: int, value: int) -> int:
+        """
+        将时刻t客户节点i分配给边缘节点j的带宽修改为value（通过assign或release），并基于顺序统计结构以O(log T)的
+        复杂度更新边缘节点j的95分位带宽值和目标函数值
+        :return: 边缘节点j新的95分位带宽值
+        """
+        self._ensure_state()
+        delta = int(value) - int(self.solution[t, i, j])
+        if delta > 0:
+            self.assign(t, i, j, delta)
+        elif delta < 0:
+            self.release(t, i, j, -delta)
+        return int(self.tracker.cost[j])
+
+    def set_rows(self, t_index, rows: np.ndarray, j_index=None, cost=None):
+        """
+        将时刻t_index的解切片批量替换为rows（维度：len(t_index)*i*j），并更新受影响边缘节点的95分位带宽值、
+        目标函数值和剩余量（若已建立）
+        :param j_index: 受影响的边缘节点索引数组，与cost均为SiteLoadTracker.evaluate_rows的返回值，未指定时重新计算
+        """
+        if self.tracker is None:
+            self.objective()
+        self.solution[t_index] = rows
+        self.refresh_rows(t_index, rows.sum(axis=1), self.demand_matrix()[t_index] - rows.sum(axis=2), j_index, cost)
+
+    def refresh_rows(self, t_index, loads: np.ndarray, unmet=None, j_index=None, cost=None):
+        """
+        时刻t_index的解已被原地修改（如事务式候选解），据此更新受影响边缘节点的95分位带宽值、目标函数值和剩余量（若已建立）
+        :param loads: 这些时刻各个边缘节点的新负载，维度：len(t_index)*j
+        :param unmet: 这些时刻各个客户节点未被满足的需求，维度：len(t_index)*i，未指定时按solution重新计算
+        """
+        if j_index is None:
+            j_index, cost = self.tracker.evaluate_rows(t_index, loads)
+        self.obj_value += int(cost.sum() - self.tracker.cost[j_index].sum())
+        self.tracker.set_rows(t_index, loads, j_index, cost)
+        if self.sit_residual is not None:
+            self.sit_residual[t_index] = self.capacity_vector() - loads
+            self.cus_residual[t_index] = self.demand_matrix()[t_index] - self.solution[t_index].sum(axis=2) \
+                if unmet is None else unmet
+
+    def state_consistent(self) -> bool:
+        """检查增量维护的聚合状态与按当前solution全量重算的结果是否一致（用于调试）"""
+        if self.tracker is None:
+            return True
+        loads = self.site_loads()
+        k = percentile_index(loads.shape[0])
+        cost = np.partition(loads, k - 1, axis=0)[k - 1]
+        consistent = np.array_equal(self.tracker.loads, loads) and np.array_equal(self.tracker.cost, cost) and \
+            self.obj_value == int(cost.sum())
+        if self.sit_residual is not None:
+            consistent = consistent and np.array_equal(self.sit_residual, self.capacity_vector() - loads) and \
+                np.array_equal(self.cus_residual, self.demand_matrix() - self.customer_loads())
+        return consistent
+
     def objective_terminated_t(self, terminated_t, j_specific: list) -> int:
         """
         根据目标函数计算当前solution的目标函数值，基于mtime_list[0:terminated_t+1]进
         行计算，若j_specific指定了，则仅仅计算边缘j_specific的边缘节点成本
         """
-        mtime_list_specific = self.mtime_list[0:terminated_t+1]
-        obj_value = 0
-        percentile_95_specific = min([math.ceil(0.95 * len(mtime_list_specific)), len(mtime_list_specific)])
-        for j in j_specific:
-            w_j_list = []
-            for t in range(len(mtime_list_specific)):
-                w_j_t = sum(self.solution[t][i][j] for i in range(len(self.cus_list)))
-                w_j_list.append(w_j_t)
-            w_j_list.sort()
-            s_j = w_j_list[percentile_95_specific - 1]
-            obj_value += s_j
+        loads = self.site_loads(terminated_t)[:, j_specific]
+        k = percentile_index(loads.shape[0])
+        obj_value = int(np.partition(loads, k - 1, axis=0)[k - 1].sum())
         return round(obj_value, parameter.decimal)
 
-    def write_to_file(self):
-        """
-        将当前解决方案写入到文件中
-        """
-        mtime_list = self.cus_list[0].mtime
-        with open(parameter.solution_path, mode='w', encoding='utf-8') as f:
-            for t in range(len(mtime_list)):
-                for i in range(len(self.cus_list)):
-                    f.write(self.cus_list[i].name + ':')
-                    if self.cus_list[i].demand == 0:
-                        continue
-                    str_to_write = ''
-                    for j in range(len(self.sit_list)):
-                        sol = self.solution[t, i, j]
-                        if sol != 0:
-                            str_to_write += '<' + self.sit_list[j].name + ',' + str(int(sol)) + '>,'
-                    f.write(str_to_write[0:-1])
-                    f.write('\n')
-        print("\n\n成功将解决方案写入到文件{}!".format(parameter.solution_path))
+    def write_to_file(self, solution_path=None) -> float:
+        """
+        将当前解决方案写入到文件中：逐时刻通过np.nonzero获取非零分配，基于预先编码的节点名称拼接整行，
+        并以大块缓冲的方式写入，峰值内存不随时刻数量增长
+        :param solution_path: 写入路径，默认为parameter.solution_path
+        :return: 写入所用时间（秒）
+        """
+        start = time.perf_counter()
+        solution_path = parameter.solution_path if solution_path is None else solution_path
+        cus_prefix, sit_prefix = node_prefixes([cus.name for cus in self.cus_list], [sit.name for sit in self.sit_list])
+        with open(solution_path, mode='wb') as f:
+            buffer, buffer_size = [], 0
+            for t in range(len(self.mtime_list)):
+                chunk = encode_timestep(cus_prefix, sit_prefix, *self.nonzero_at(t))
+                buffer.append(chunk)
+                buffer_size += len(chunk)
+                if buffer_size >= write_buffer_size:
+                    f.write(b''.join(buffer))
+                    buffer, buffer_size = [], 0
+            f.write(b''.join(buffer))
+        elapsed = time.perf_counter() - start
+        RunController().record_write(elapsed)
+        print("\n\n成功将解决方案写入到文件{}！用时{:.4f}秒！".format(solution_path, elapsed))
+        return elapsed
 
 
 if __name__ == '__main__':
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: ScheduleCache.py
+@time: 2022/4/3 15:10
+@description:增量重算的解决方案缓存：需求文件经常只修改部分时刻后重新下发，缓存以与时刻无关的输入（客户节点、
+    边缘节点、带宽上限、网络时延、QoS约束上限）的指纹为键，记录上一次的解决方案（仅满足QoS约束的边上的分配带宽）
+    及其各个时刻带宽需求的哈希。重新运行时，时刻名称相同且需求哈希相同的时刻直接复用缓存的分配，其余时刻重新分配
+    （见CallAlgorithm.cached_generation）。
+    每个指纹对应缓存目录中的一个.npz文件，以文件修改时间记录最近访问时刻，总大小超过上限时按最近最少使用（LRU）淘汰
+"""
+import hashlib
+import os
+import tempfile
+import numpy as np
+from Results import SparseSolution
+from utils import Parameter, Tracer
+parameter = Parameter()
+
+schedule_cache_version = 1  # 缓存格式的版本号，缓存内容或格式发生变化时需递增
+
+
+def static_fingerprint(instance) -> str:
+    """与时刻无关的输入的指纹：客户节点名称、边缘节点名称、带宽上限、网络时延和QoS约束上限"""
+    digest = hashlib.sha1('v{}'.format(schedule_cache_version).encode('utf-8'))
+    for names in (instance.cus_names, instance.sit_names):
+        digest.update('\n'.join(names).encode('utf-8') + b'\x00')
+    for array in (instance.band_width, instance.qos):
+        digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+    digest.update(str(instance.qos_constraint).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def timestep_hashes(demand: np.ndarray) -> np.ndarray:
+    """
+    各个时刻带宽需求的64位哈希
+    :param demand: 带宽需求矩阵，维度：t*i
+    :return: numpy一维数组（uint64），维度：t
+    """
+    rows = np.ascontiguousarray(demand, dtype=np.int64)
+    return np.frombuffer(b''.join(hashlib.blake2b(row.tobytes(), digest_size=8).digest() for row in rows),
+                         dtype='<u8')
+
+
+class ScheduleCache:
+    """
+    基于文件的解决方案缓存（LRU）
+    """
+
+    def __init__(self, path=None, max_bytes=None):
+        """
+        :param path: 缓存目录，默认为parameter.schedule_cache_path，None表示使用系统临时目录
+        :param max_bytes: 缓存总大小上限（字节），默认为parameter.schedule_cache_size
+        """
+        self.path = path or parameter.schedule_cache_path or \
+            os.path.join(tempfile.gettempdir(), 'codecraft2022_schedule')
+        self.max_bytes = parameter.schedule_cache_size if max_bytes is None else max_bytes
+
+    def entry_path(self, fingerprint: str) -> str:
+        """指纹对应的缓存文件路径"""
+        return os.path.join(self.path, fingerprint + '.npz')
+
+    def load(self, instance):
+        """
+        读取问题实例对应的缓存条目，命中时更新其最近访问时刻
+        :return: (缓存的时刻列表, 各时刻带宽需求的哈希, 各时刻各条边上的分配带宽（维度：t*e）)，未命中时返回None
+        """
+        path = self.entry_path(static_fingerprint(instance))
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                if int(entry['cache_version']) != schedule_cache_version:
+                    return None
+                cached = entry['mtime'].tolist(), entry['hashes'], entry['flows']
+        except (OSError, ValueError, KeyError):
+            return None
+        if cached[2].shape[1] != instance.adjacency.n_edges:
+            return None
+        os.utime(path)
+        return cached
+
+    def match(self, instance):
+        """
+        将问题实例的各个时刻与缓存条目匹配：时刻名称相同且带宽需求的哈希相同的时刻可复用缓存的分配
+        :return: (可复用的时刻索引数组, 这些时刻缓存的各条边上的分配带宽（维度：len*e）, 需要重新分配的时刻索引数组)，
+            未命中时返回None
+        """
+        tracer = Tracer()
+        cached = self.load(instance)
+        if cached is None:
+            tracer.count('schedule_cache_misses')
+            return None
+        mtime, hashes, flows = cached
+        position = {m: c for c, m in enumerate(mtime)}
+        c_index = np.array([position.get(m, -1) for m in instance.mtime], dtype=np.int64)
+        reuse = c_index >= 0
+        reuse[reuse] = hashes[c_index[reuse]] == timestep_hashes(instance.demand)[reuse]
+        t_reuse, t_changed = np.nonzero(reuse)[0], np.nonzero(~reuse)[0]
+
+        tracer.count('schedule_cache_hits')
+        tracer.count('schedule_cache_reused_timesteps', len(t_reuse))
+        tracer.count('schedule_cache_changed_timesteps', len(t_changed))
+        return t_reuse, flows[c_index[t_reuse]], t_changed
+
+    def store(self, results):
+        """将可行解写入缓存（覆盖同一指纹的条目），并按LRU淘汰超出总大小上限的条目"""
+        instance = results.instance
+        solution = results.solution
+        flows = solution.flows if isinstance(solution, SparseSolution) else \
+            SparseSolution.from_dense(solution, results.adjacency).flows
+        path = self.entry_path(static_fingerprint(instance))
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = path + '.{}.tmp.npz'.format(os.getpid())
+            np.savez(tmp_path, cache_version=np.array(schedule_cache_version), mtime=np.array(instance.mtime),
+                     hashes=timestep_hashes(instance.demand), flows=flows)
+            os.replace(tmp_path, path)
+        except OSError:
+            print("\n解决方案缓存{}写入失败！".format(path))
+            return
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """按最近访问时刻从早到晚删除缓存条目，直到总大小不超过上限（不删除keep）"""
+        try:
+            entries = []
+            for name in os.listdir(self.path):
+                if name.endswith('.npz') and '.tmp.' not in name:
+                    stat = os.stat(os.path.join(self.path, name))
+                    entries.append((stat.st_mtime_ns, stat.st_size, os.path.join(self.path, name)))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                Tracer().count('schedule_cache_evictions')
+            except OSError:
+                pass
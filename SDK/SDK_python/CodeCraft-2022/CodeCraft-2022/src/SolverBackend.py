@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: SolverBackend.py
+@time: 2022/4/1 14:05
+@description:混合整数线性规划模型容器和求解器后端接口：模型以变量上下界、整数性、目标系数和稀疏约束矩阵
+    （COO三元组）描述，与具体求解器无关；后端负责将模型转换为求解器的输入并求解。
+    当前实现：HighsBackend（scipy.optimize.milp调用HiGHS，无需许可证，本地即可运行）
+             GurobiBackend（gurobipy，仅在使用时导入）
+"""
+import time
+import numpy as np
+from utils import Parameter
+parameter = Parameter()
+
+
+class LinearModel:
+    """
+    混合整数线性规划模型：min c^T x, s.t. row_lb <= A x <= row_ub, lb <= x <= ub, x_k为整数（integrality[k]=1）
+    """
+
+    def __init__(self, name='model'):
+        self.name = name  # 模型名称
+        self.lb, self.ub, self.obj, self.integrality = [], [], [], []  # 各变量块的上下界、目标系数、整数性
+        self.n_vars = 0  # 变量数量
+        self.rows, self.cols, self.vals = [], [], []  # 约束矩阵的非零元（行索引、列索引、系数）
+        self.row_lb, self.row_ub = [], []  # 各约束的上下界
+        self.n_rows = 0  # 约束数量
+        self.build_start = time.perf_counter()  # 开始构建模型的时刻
+        self.build_time = None  # 模型构建用时（秒），调用finish后有效
+
+    def add_variables(self, n: int, lb=0, ub=np.inf, obj=0, integer=False) -> np.ndarray:
+        """
+        添加n个变量
+        :return: 新变量的索引数组
+        """
+        index = np.arange(self.n_vars, self.n_vars + n)
+        self.lb.append(np.broadcast_to(np.asarray(lb, dtype=float), n))
+        self.ub.append(np.broadcast_to(np.asarray(ub, dtype=float), n))
+        self.obj.append(np.broadcast_to(np.asarray(obj, dtype=float), n))
+        self.integrality.append(np.full(n, 1 if integer else 0, dtype=np.int8))
+        self.n_vars += n
+        return index
+
+    def add_constraint(self, coeffs: dict, lb=-np.inf, ub=np.inf) -> int:
+        """
+        添加一个约束lb <= sum(coef * x[k] for k, coef in coeffs.items()) <= ub
+        :return: 约束索引
+        """
+        row = self.n_rows
+        self.rows.append(np.full(len(coeffs), row, dtype=np.int64))
+        self.cols.append(np.fromiter(coeffs.keys(), dtype=np.int64, count=len(coeffs)))
+        self.vals.append(np.fromiter(coeffs.values(), dtype=float, count=len(coeffs)))
+        self.row_lb.append(np.array([lb], dtype=float))
+        self.row_ub.append(np.array([ub], dtype=float))
+        self.n_rows += 1
+        return row
+
+    def add_constraints(self, n: int, rows: np.ndarray, cols: np.ndarray, vals, lb=-np.inf, ub=np.inf) -> np.ndarray:
+        """
+        批量添加n个约束（COO块）：第r个约束为lb[r] <= sum(vals[k] * x[cols[k]] for k if rows[k] == r) <= ub[r]
+        :param rows: 非零元在本块内的行索引（0~n-1）
+        :param cols: 非零元的变量索引
+        :param vals: 非零元的系数（标量或数组）
+        :return: 新约束的索引数组
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        index = np.arange(self.n_rows, self.n_rows + n)
+        self.rows.append(rows + self.n_rows)
+        self.cols.append(np.asarray(cols, dtype=np.int64))
+        self.vals.append(np.broadcast_to(np.asarray(vals, dtype=float), rows.shape))
+        self.row_lb.append(np.broadcast_to(np.asarray(lb, dtype=float), n))
+        self.row_ub.append(np.broadcast_to(np.asarray(ub, dtype=float), n))
+        self.n_rows += n
+        return index
+
+    def finish(self):
+        """结束构建：合并各个块，记录构建用时"""
+        def concat(blocks, dtype):
+            return np.concatenate(blocks).astype(dtype, copy=False) if blocks else np.zeros(0, dtype=dtype)
+        self.lb, self.ub = [concat(self.lb, float)], [concat(self.ub, float)]
+        self.obj, self.integrality = [concat(self.obj, float)], [concat(self.integrality, np.int8)]
+        self.rows, self.cols, self.vals = [concat(self.rows, np.int64)], [concat(self.cols, np.int64)], \
+            [concat(self.vals, float)]
+        self.row_lb, self.row_ub = [concat(self.row_lb, float)], [concat(self.row_ub, float)]
+        self.build_time = time.perf_counter() - self.build_start
+        return self
+
+    def matrix(self):
+        """约束矩阵（scipy.sparse.csr_matrix），维度：n_rows*n_vars"""
+        import scipy.sparse as sp
+        return sp.csr_matrix((self.vals[0], (self.rows[0], self.cols[0])), shape=(self.n_rows, self.n_vars))
+
+    def stats(self) -> dict:
+        """模型规模：变量数量（其中整数变量、0-1变量数量）、约束数量、非零元数量和构建用时"""
+        integer = self.integrality[0] == 1
+        binary = integer & (self.lb[0] == 0) & (self.ub[0] == 1)
+        return {
+            'name': self.name,
+            'variables': self.n_vars,
+            'integer': int(integer.sum() - binary.sum()),
+            'binary': int(binary.sum()),
+            'constraints': self.n_rows,
+            'nonzeros': int(len(self.vals[0])),
+            'build_time': round(self.build_time, 6),
+        }
+
+    def describe(self) -> str:
+        stats = self.stats()
+        return '模型{}：{}个变量（整数变量{}个，0-1变量{}个），{}个约束，{}个非零元，构建用时{:.4f}秒！'.format(
+            stats['name'], stats['variables'], stats['integer'], stats['binary'], stats['constraints'],
+            stats['nonzeros'], stats['build_time'])
+
+
+class SolveResult:
+    """求解结果"""
+
+    def __init__(self, status: str, x=None, objective=None, gap=None, solve_time=0.0):
+        self.status = status  # 'optimal'、'feasible'（到达时间上限但有可行解）、'infeasible'、'unknown'
+        self.x = x  # 变量取值，无可行解时为None
+        self.objective = objective  # 目标函数值
+        self.gap = gap  # 相对间隙
+        self.solve_time = solve_time  # 求解用时（秒）
+
+    @property
+    def has_solution(self) -> bool:
+        return self.x is not None
+
+    def __str__(self):
+        return '求解状态{}，目标函数值{}，相对间隙{}，求解用时{:.4f}秒！'.format(
+            self.status, self.objective, self.gap, self.solve_time)
+
+
+class SolverBackend:
+    """求解器后端接口"""
+    name = None  # 后端名称
+    supports_start = False  # 是否支持MIP初始解
+
+    def solve(self, model: LinearModel, time_limit=None, mip_gap=None, start=None) -> SolveResult:
+        """
+        求解模型
+        :param time_limit: 求解时间上限（秒），None表示不限
+        :param mip_gap: 相对间隙，None表示使用求解器默认值
+        :param start: MIP初始解（变量取值数组），不支持初始解的后端将忽略
+        """
+        raise NotImplementedError
+
+
+class HighsBackend(SolverBackend):
+    """基于scipy.optimize.milp（HiGHS）的后端，不支持MIP初始解"""
+    name = 'highs'
+
+    def solve(self, model: LinearModel, time_limit=None, mip_gap=None, start=None) -> SolveResult:
+        from scipy.optimize import Bounds, LinearConstraint, milp
+
+        options = {'disp': False}
+        if time_limit is not None:
+            options['time_limit'] = max(float(time_limit), 0.01)
+        if mip_gap is not None:
+            options['mip_rel_gap'] = mip_gap
+        constraints = LinearConstraint(model.matrix(), model.row_lb[0], model.row_ub[0]) if model.n_rows else None
+
+        start_time = time.perf_counter()
+        res = milp(model.obj[0], integrality=model.integrality[0], bounds=Bounds(model.lb[0], model.ub[0]),
+                   constraints=constraints, options=options)
+        solve_time = time.perf_counter() - start_time
+
+        if res.status == 0:
+            status = 'optimal'
+        elif res.status == 2:
+            status = 'infeasible'
+        elif res.x is not None:
+            status = 'feasible'
+        else:
+            status = 'unknown'
+        return SolveResult(status, res.x, res.fun if res.x is not None else None,
+                           getattr(res, 'mip_gap', None), solve_time)
+
+
+class GurobiBackend(SolverBackend):
+    """基于gurobipy的后端（需要许可证），支持MIP初始解"""
+    name = 'gurobi'
+    supports_start = True
+
+    def solve(self, model: LinearModel, time_limit=None, mip_gap=None, start=None) -> SolveResult:
+        import gurobipy as gp
+        from gurobipy import GRB
+
+        m = gp.Model(model.name)
+        m.Params.OutputFlag = 0
+        if time_limit is not None:
+            m.Params.TimeLimit = max(float(time_limit), 0.01)
+        if mip_gap is not None:
+            m.Params.MIPGap = mip_gap
+        vtype = np.where(model.integrality[0] == 1, GRB.INTEGER, GRB.CONTINUOUS)
+        x = m.addMVar(model.n_vars, lb=model.lb[0], ub=model.ub[0], obj=model.obj[0], vtype=vtype)
+        if model.n_rows:
+            matrix = model.matrix()
+            finite_lb, finite_ub = np.isfinite(model.row_lb[0]), np.isfinite(model.row_ub[0])
+            if finite_lb.any():
+                m.addMConstr(matrix[finite_lb], x, GRB.GREATER_EQUAL, model.row_lb[0][finite_lb])
+            if finite_ub.any():
+                m.addMConstr(matrix[finite_ub], x, GRB.LESS_EQUAL, model.row_ub[0][finite_ub])
+        if start is not None:
+            x.Start = start
+
+        start_time = time.perf_counter()
+        m.optimize()
+        solve_time = time.perf_counter() - start_time
+
+        if m.Status == GRB.INFEASIBLE:
+            return SolveResult('infeasible', solve_time=solve_time)
+        if m.SolCount == 0:
+            return SolveResult('unknown', solve_time=solve_time)
+        return SolveResult('optimal' if m.Status == GRB.OPTIMAL else 'feasible', np.array(x.X), m.ObjVal,
+                           m.MIPGap, solve_time)
+
+
+backends = {backend.name: backend for backend in (HighsBackend, GurobiBackend)}  # 后端名称->后端类
+
+
+def make_backend(name=None) -> SolverBackend:
+    """按名称创建求解器后端，None表示使用parameter.solver_backend"""
+    name = parameter.solver_backend if name is None else name
+    if name not in backends:
+        raise Exception("未知的求解器后端{}！可选：{}".format(name, '、'.join(backends)))
+    return backends[name]()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: WaterFilling.py
+@time: 2022/3/30 10:12
+@description:initial_solution_generation_1逐时刻分配的向量化注水内核：同一时刻内边缘节点的选择顺序只取决于
+    select_priority[t]（优先级小者优先，优先级相同时索引大者优先），因此可先对每个时刻的边缘节点排序一次，
+    再按客户节点分配顺序逐客户节点对所有时刻同时注水：在排序后的可服务边缘节点上对剩余带宽求累积和，按剩余需求
+    截断得到分配量并更新剩余带宽，每批时刻仅需M次向量化操作，结果与allocate_timesteps逐位相同
+"""
+import numpy as np
+from utils import InfeasibleError, Parameter, Tracer
+parameter = Parameter()
+
+
+def site_order(select_priority: np.ndarray) -> np.ndarray:
+    """
+    各个时刻边缘节点的选择顺序，与allocate_timesteps一致：优先级小者优先，优先级相同时索引大者优先
+    :param select_priority: 边缘节点被选择的优先级，维度：t*j
+    :return: 排序后的边缘节点索引，维度：t*j
+    """
+    index = np.broadcast_to(-np.arange(select_priority.shape[-1]), select_priority.shape)
+    return np.lexsort((index, select_priority), axis=-1)
+
+
+def water_fill(demand: np.ndarray, band_width: np.ndarray, select_priority: np.ndarray, qos_mask: np.ndarray,
+               cus_order: list, cus_names=None) -> np.ndarray:
+    """
+    对沿第一维堆叠的若干时刻同时注水分配
+    :param demand: 带宽需求矩阵，维度：t*i
+    :param band_width: 边缘节点带宽上限，维度：j
+    :param select_priority: 边缘节点被选择的优先级，维度：t*j
+    :param qos_mask: 客户节点i能否被边缘节点j服务，维度：i*j
+    :param cus_order: 客户节点分配顺序
+    :param cus_names: 客户节点名称列表（用于报错信息），None表示使用客户节点索引
+    :return: 分配结果，维度：t*i*j
+    """
+    order = site_order(select_priority)
+    capacity_sorted = np.asarray(band_width, dtype=np.int64)[order]  # 按选择顺序排列的带宽上限，t*j
+    residual = capacity_sorted.copy()  # 按选择顺序排列的剩余带宽，t*j
+    sorted_alloc = np.zeros(demand.shape + (order.shape[-1],), dtype=np.int64)  # 按选择顺序排列的分配结果，t*i*j
+
+    for i in cus_order:
+        capacity = np.where(qos_mask[i][order], residual, 0)  # 客户节点i可用的剩余带宽
+        before = np.cumsum(capacity, axis=1) - capacity  # 排在每个边缘节点之前的可用带宽之和
+        alloc = np.clip(demand[:, i, None] - before, 0, capacity)
+        if (alloc.sum(axis=1) != demand[:, i]).any():
+            raise InfeasibleError("无法满足客户节点{}的带宽需求！".format(i if cus_names is None else cus_names[i]))
+        residual -= alloc
+        sorted_alloc[:, i] = alloc
+
+    tracer = Tracer()
+    tracer.count('allocations', int(np.count_nonzero(sorted_alloc)))
+    tracer.count('site_exhaustions', int(np.count_nonzero((residual == 0) & (capacity_sorted > 0))))
+
+    solution = np.zeros_like(sorted_alloc)
+    np.put_along_axis(solution, np.broadcast_to(order[:, None, :], solution.shape), sorted_alloc, axis=2)
+    return solution
+
+
+def water_fill_timesteps(solution: np.ndarray, demand: np.ndarray, band_width: list, select_priority: np.ndarray,
+                         cus_serve_by_site: dict, cus_order: list, cus_names: list, mtime_list: list,
+                         t_start: int, t_end: int):
+    """
+    allocate_timesteps的向量化实现（参数相同），在时刻[t_start, t_end)内按每批parameter.water_fill_batch个时刻
+    调用water_fill，结果直接写入solution
+    """
+    qos_mask = np.zeros((len(cus_names), len(band_width)), dtype=bool)
+    for i, sites in cus_serve_by_site.items():
+        qos_mask[i, sites] = True
+
+    tracer = Tracer()
+    batch = max(1, parameter.water_fill_batch)
+    for start in range(t_start, t_end, batch):
+        end = min(start + batch, t_end)
+        if tracer.debug:
+            tracer.emit('DEBUG', '\n开始为时刻{}~{}安排流量分配计划（向量化注水）!', mtime_list[start], mtime_list[end - 1])
+        try:
+            solution[start:end] += water_fill(demand[start:end], band_width, select_priority[start:end],
+                                              qos_mask, cus_order, cus_names)
+        except InfeasibleError:
+            tracer.emit('ERROR', "分配失败！")
+            raise
+
@@ -6,11 +6,17 @@
 @time: 2022/3/24 11:17
 @description:
 """
+import json
 import os
 import sys
+from contextlib import contextmanager
 from functools import wraps
+from multiprocessing import shared_memory
 import time
 import heapq
+import numpy as np
+
+process_start = time.perf_counter()  # 进程开始时刻（本模块在程序入口处最先被导入）
 
 
 class Parameter(object):
@@ -18,6 +24,7 @@ class Parameter(object):
     基于单例模式实现算法参数类
     """
     instance = None  # 类属性，记录第一个被创建对象的引用
+    init_flag = False  # 类属性，记录是否已执行过初始化
 
     def __new__(cls, *args, **kwargs):
         if cls.instance is None:  # 判断类属性是否为空对象
@@ -25,22 +32,79 @@ class Parameter(object):
         return cls.instance  # 返回类属性保存的对象引用
 
     def __init__(self):
+        if Parameter.init_flag:  # 仅初始化一次，再次调用Parameter()不会重置运行时修改的参数
+            return
+        Parameter.init_flag = True
 
         self.alpha = 0.5  # 初始解生成算法中用来更新下一时刻边缘节点被选择的概率
+        self.priority_update = False  # 初始解生成算法中是否基于截止到当前时刻的95分位带宽值更新边缘节点被选择的优先级
 
         self.data_path = '/data/'  # 读取数据的路径（默认为比赛正式环境）
         self.solution_path = '/output/solution.txt'  # 写入解决方案的路径（默认为比赛正式环境）
+        self.use_cache = True  # 是否将读取的数据缓存为二进制文件，重复运行时跳过CSV解析
+        self.cache_path = None  # 二进制缓存目录，None表示使用系统临时目录
+        self.schedule_cache = False  # 是否启用解决方案缓存：需求文件重新下发时仅重新分配需求变化的时刻（见ScheduleCache）
+        self.schedule_cache_path = None  # 解决方案缓存目录，None表示使用系统临时目录
+        self.schedule_cache_size = 1 << 30  # 解决方案缓存的总大小上限（字节），超出时按最近最少使用淘汰
 
         self.decimal = 4  # 在算法过程中，涉及小数的保留位数，以降低时间开销
+        self.violation_top_k = 10  # 可行性检查报告中，每条约束最多记录的违背约束的索引数量
 
         self.env = 'norm'  # 'norm'表明当前为比赛环境，将减少部分计算以减少时间开销
         # self.env = 'test'  # 'test'表明当前为测试环境，部分功能将被使用
 
         self.method = 'algorithm'  # 使用何种求解方式，当前表示使用启发式算法
-        # self.method = 'solver'  # 使用何种求解方式，当前表示使用Gurobi求解器
+        # self.method = 'solver'  # 使用何种求解方式，当前表示使用求解器（见solver_backend）
+        # self.method = 'rolling'  # 使用何种求解方式，当前表示使用滚动时域分解求解（见rolling_*）
+        # self.method = 'online'  # 使用何种求解方式，当前表示逐行读取需求数据的在线分配（见online_*）
+
+        self.solver_backend = 'highs'  # 求解器后端：'highs'（scipy.optimize.milp，无需许可证）或'gurobi'
+        self.solver_time_limit = 60  # 求解器时间上限（秒），不超过剩余可用时间，None表示仅受剩余可用时间限制
+        self.solver_mip_gap = None  # 求解器相对间隙，None表示使用求解器默认值
+        self.rolling_window = 288  # 滚动时域求解（method='rolling'），每个窗口的时刻数量
+        self.rolling_overlap = 48  # 滚动时域求解，相邻窗口重叠的时刻数量（重叠部分留给下一窗口重新优化）
+        self.rolling_time_limit = 10  # 滚动时域求解，每个窗口的求解时间上限（秒）
+        self.rolling_min_time = 0.5  # 滚动时域求解，分到的时间少于该值（秒）时不再求解，直接使用初始解
+        self.rolling_kill_grace = 2  # 滚动时域求解，窗口子进程超过求解时间上限该时长（秒）后被终止
+        self.rolling_workers = 1  # 滚动时域求解，每轮并行求解的窗口数量（进程数量），None表示使用全部CPU核心
+
+        self.online_history = 8928  # 在线分配模式（method='online'），估计95分位带宽值所用的最近时刻数量（环形缓冲区）
+        self.online_follow = False  # 在线分配模式，读到需求文件末尾后是否继续等待新行（类似tail -f）
+        self.online_poll_interval = 0.2  # 在线分配模式，等待新行时的轮询间隔（秒）
+        self.online_idle_timeout = 60  # 在线分配模式，持续该时长（秒）无新行时结束，None表示一直等待
+        self.online_latency_budget = 0.05  # 在线分配模式，单个时刻的分配延迟上限（秒），超出时记录告警
+        self.online_latency_window = 1024  # 在线分配模式，统计延迟分位数所用的最近时刻数量
 
-        self.degree_of_destruction = 0.25  # ALNS算法，解被破坏的比例
+        self.degree_of_destruction = 0.25  # ALNS算法，解被破坏的比例（搜索开始时）
+        self.min_degree_of_destruction = 0.05  # ALNS算法，搜索结束时（迭代次数或时间用完）解被破坏的比例
+        self.adaptive_operators = True  # ALNS算法，是否按单位CPU时间的目标函数改进量自适应选择算子（见OperatorSelection）
+        self.operator_decay = 0.2  # ALNS算法，自适应选择算子时改进量和用时的指数平滑系数
+        self.operator_min_share = 0.05  # ALNS算法，自适应选择算子时每个算子组合的权重下限占最大权重的比例
+        self.operator_stats_path = None  # ALNS算法，写入算子统计（JSON）的路径，None表示不写入
+        self.acceptance = 'hc'  # ALNS算法的接受标准：'hc'（爬山）、'sa'（模拟退火）、'rrt'（record-to-record travel）
+        self.sa_start_ratio = 1e-3  # 模拟退火的初始温度占初始解目标函数值的比例
+        self.sa_end_ratio = 1e-5  # 模拟退火的结束温度占初始解目标函数值的比例
+        self.rrt_start_ratio = 0.01  # record-to-record travel允许劣于最优解的比例（搜索开始时），随搜索进度线性降至结束值
+        self.rrt_end_ratio = 0.0  # record-to-record travel允许劣于最优解的比例（搜索结束时）
+        self.bound_band = 4  # 计算候选解目标函数变化量的下界时，每个边缘节点维护的高于95分位带宽值的负载数量
         self.iterations = 2000  # ALNS算法，迭代次数
+        self.time_limit = 300  # 程序所有计算步骤（读取输入、计算、输出方案）所用时间总和上限（秒）
+        self.time_safety = 10  # 为防止超时预留的安全时间（秒）
+        self.phase_budget = {'load': 30, 'construct': 120, 'improve': None}  # 各阶段的时间预算（秒），None表示不限
+        self.write_reserve = 10  # 写入解决方案的预留时间（秒），首次写入后由实测时间更新
+        self.write_reserve_factor = 2  # 写入解决方案的预留时间=实测写入时间*该系数
+
+        self.multi_start = 1  # 多起点构建初始解的变体数量，小于等于1表示不启用
+        self.workers = None  # 多进程计算的进程数量，None表示使用全部CPU核心
+        self.construct_workers = 1  # 初始解生成算法逐时刻并行分配的进程数量，1表示串行，None表示使用全部CPU核心
+        self.water_fill = True  # initial_solution_generation_1是否使用向量化注水内核逐时刻分配（False表示逐元素循环）
+        self.water_fill_batch = 256  # 向量化注水内核每批同时分配的时刻数量
+
+        self.trace_level = 'INFO'  # 跟踪事件的输出级别：TRACE、DEBUG、INFO、WARNING、ERROR、OFF（逐时刻、逐客户节点的事件为DEBUG）
+        self.trace_summary_path = None  # 退出时写入JSON运行汇总（计数器、嵌套阶段用时）的路径，None表示写入标准错误
+
+        self.destroy_window = 5  # ALNS算法，每个被破坏的边缘节点移除其95分位附近的时刻数量为destroy_window+1
+        self.seed = 42  # ALNS算法，随机数种子
 
     def produce_path(self):
 
@@ -56,6 +120,13 @@ class Parameter(object):
             self.solution_path = os.path.join(os.path.dirname(os.getcwd()), 'output', 'solution.txt')
 
 
+parameter = Parameter()
+
+
+class InfeasibleError(Exception):
+    """初始解生成算法无法满足客户节点带宽需求（问题实例或当前变体不可行）时抛出的异常"""
+
+
 class PriorityQueue:
     """基于Python堆队列算法库heapq实现优先级队列"""
 
@@ -74,13 +145,336 @@ class PriorityQueue:
         return heapq.heappop(self.elements)[1]
 
 
+class IndexedPriorityQueue:
+    """
+    基于数组实现的索引优先级队列（二叉堆），元素为0~capacity-1的整数，支持按元素修改优先级（decrease-key/
+    increase-key）、删除任意元素和O(1)清空。优先级相同时元素越小越优先，出队顺序与PriorityQueue一致
+    """
+
+    def __init__(self, capacity: int):
+        self.heap = [0] * capacity  # 堆数组，存放元素
+        self.priority = [0] * capacity  # 元素->优先级
+        self.pos = [0] * capacity  # 元素->在堆数组中的位置
+        self.stamp = [0] * capacity  # 元素->入队时的版本号，与当前版本号不同表示不在队列中
+        self.version = 1  # 当前版本号，清空队列时自增
+        self.size = 0  # 队列中的元素数量
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, item: int) -> bool:
+        return self.stamp[item] == self.version
+
+    def empty(self) -> bool:
+        return self.size == 0
+
+    def reset(self):
+        """O(1)清空队列：仅自增版本号，使所有元素的入队标记失效"""
+        self.version += 1
+        self.size = 0
+
+    def build(self, priorities):
+        """清空队列，并将元素0~len(priorities)-1按给定优先级批量入队，O(n)建堆"""
+        self.reset()
+        n = len(priorities)
+        self.heap[:n] = range(n)
+        self.priority[:n] = priorities
+        self.pos[:n] = range(n)
+        self.stamp[:n] = [self.version] * n
+        self.size = n
+        for k in reversed(range(n // 2)):
+            self._sift_down(k)
+
+    def put(self, item: int, priority):
+        """将item以优先级priority入队，若item已在队列中则修改其优先级"""
+        if self.stamp[item] == self.version:
+            self.update(item, priority)
+            return
+        self.stamp[item] = self.version
+        self.priority[item] = priority
+        self.heap[self.size] = item
+        self.pos[item] = self.size
+        self.size += 1
+        self._sift_up(self.size - 1)
+
+    def update(self, item: int, priority):
+        """修改队列中元素item的优先级，O(log n)"""
+        old = self.priority[item]
+        self.priority[item] = priority
+        if priority < old:
+            self._sift_up(self.pos[item])
+        else:
+            self._sift_down(self.pos[item])
+
+    def peek(self) -> int:
+        """返回优先级最小的元素（不出队）"""
+        return self.heap[0]
+
+    def get(self) -> int:
+        """弹出并返回优先级最小的元素，O(log n)"""
+        heap = self.heap
+        item = heap[0]
+        self.stamp[item] = 0
+        self.size -= 1
+        if self.size:
+            last = heap[self.size]
+            heap[0] = last
+            self.pos[last] = 0
+            self._sift_down(0)
+        return item
+
+    def remove(self, item: int) -> int:
+        """从队列中删除元素item，O(log n)"""
+        k = self.pos[item]
+        self.stamp[item] = 0
+        self.size -= 1
+        if k != self.size:
+            last = self.heap[self.size]
+            self.heap[k] = last
+            self.pos[last] = k
+            self._sift_up(k)
+            self._sift_down(self.pos[last])
+        return item
+
+    def _sift_up(self, k: int):
+        heap, pos, priority = self.heap, self.pos, self.priority
+        item = heap[k]
+        key = priority[item]
+        while k > 0:
+            parent = (k - 1) >> 1
+            other = heap[parent]
+            if key < priority[other] or (key == priority[other] and item < other):
+                heap[k] = other
+                pos[other] = k
+                k = parent
+            else:
+                break
+        heap[k] = item
+        pos[item] = k
+
+    def _sift_down(self, k: int):
+        heap, pos, priority, size = self.heap, self.pos, self.priority, self.size
+        item = heap[k]
+        key = priority[item]
+        child = 2 * k + 1
+        while child < size:
+            other = heap[child]
+            if child + 1 < size:
+                right = heap[child + 1]
+                if priority[right] < priority[other] or (priority[right] == priority[other] and right < other):
+                    child, other = child + 1, right
+            if priority[other] < key or (priority[other] == key and other < item):
+                heap[k] = other
+                pos[other] = k
+                k = child
+                child = 2 * k + 1
+            else:
+                break
+        heap[k] = item
+        pos[item] = k
+
+
+class Tracer:
+    """
+    基于单例模式实现的跟踪类：分级、延迟格式化的事件，命名计数器和嵌套阶段计时，退出时汇总为一条JSON。
+    热点路径上的事件应以级别开关属性作为守卫（如 if tracer.debug: tracer.emit('DEBUG', ...)），级别关闭时
+    既不调用函数也不格式化字符串；热点路径上的计数应先在局部变量中累加，再一次性计入计数器
+    """
+    instance = None  # 类属性，记录第一个被创建对象的引用
+    levels = {'TRACE': 5, 'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40, 'OFF': 100}  # 级别名称->级别
+
+    def __new__(cls, *args, **kwargs):
+        if cls.instance is None:  # 判断类属性是否为空对象
+            cls.instance = super().__new__(cls)  # 调用父类方法，为第一个对象分配空间
+            cls.instance.reset()
+        return cls.instance  # 返回类属性保存的对象引用
+
+    def reset(self):
+        """清空计数器和阶段计时，并按参数设置输出级别"""
+        self.counters = {}  # 计数器名称->计数
+        self.spans = {}  # 嵌套阶段路径（以/分隔）->[进入次数, 累计用时]
+        self.stack = []  # 当前所处的嵌套阶段
+        self.set_level(parameter.trace_level)
+
+    def set_level(self, level):
+        """设置输出级别，并更新各级别的开关属性"""
+        self.level = self.levels[level.upper()] if isinstance(level, str) else int(level)
+        self.trace = self.level <= self.levels['TRACE']
+        self.debug = self.level <= self.levels['DEBUG']
+        self.info = self.level <= self.levels['INFO']
+
+    def enabled(self, level: str) -> bool:
+        return self.levels[level] >= self.level
+
+    def emit(self, level: str, message: str, *args, **kwargs):
+        """输出事件：级别未开启时直接返回，开启时才以args格式化message"""
+        if self.levels[level] < self.level:
+            return
+        print(message.format(*args) if args else message, **kwargs)
+
+    def count(self, name: str, n=1):
+        """计数器name累加n"""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def span(self, name: str):
+        """嵌套阶段计时上下文，阶段路径为当前所处各阶段名称以/连接"""
+        self.stack.append(name)
+        path = '/'.join(self.stack)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            record = self.spans.setdefault(path, [0, 0.0])
+            record[0] += 1
+            record[1] += time.perf_counter() - start
+            self.stack.pop()
+
+    def summary(self) -> dict:
+        """运行汇总：总用时、计数器和嵌套阶段用时"""
+        return {
+            'elapsed': round(time.perf_counter() - process_start, 6),
+            'counters': dict(self.counters),
+            'spans': {path: {'calls': calls, 'seconds': round(seconds, 6)}
+                      for path, (calls, seconds) in self.spans.items()},
+        }
+
+    def write_summary(self, path=None):
+        """将运行汇总写入文件path（默认为parameter.trace_summary_path），None表示写入标准错误"""
+        path = parameter.trace_summary_path if path is None else path
+        text = json.dumps(self.summary(), ensure_ascii=False)
+        if path is None:
+            print(text, file=sys.stderr)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+
+
+class RunController:
+    """
+    基于单例模式实现运行控制类，从进程开始计时，为写入解决方案预留实测时间，为各阶段（load、construct、
+    improve）分配时间预算，使改进阶段在截止时间之前停止，并在退出时汇总各阶段用时
+    """
+    instance = None  # 类属性，记录第一个被创建对象的引用
+
+    def __new__(cls, *args, **kwargs):
+        if cls.instance is None:  # 判断类属性是否为空对象
+            cls.instance = super().__new__(cls)  # 调用父类方法，为第一个对象分配空间
+            cls.instance.reset()
+        return cls.instance  # 返回类属性保存的对象引用
+
+    def reset(self, start=None):
+        """重置计时，start默认为进程开始时刻"""
+        self.start = process_start if start is None else start  # 计时起点
+        self.write_reserve = parameter.write_reserve  # 写入解决方案的预留时间（秒）
+        self.phases = {}  # 阶段名称->[阶段开始时刻, 阶段用时]
+        self.current_phase = None  # 当前所处阶段
+
+    def elapsed(self) -> float:
+        """自进程开始已用时间（秒）"""
+        return time.perf_counter() - self.start
+
+    def deadline(self) -> float:
+        """计算必须结束的时刻（相对进程开始，秒），已扣除安全时间和写入解决方案的预留时间"""
+        return parameter.time_limit - parameter.time_safety - self.write_reserve
+
+    def remaining(self) -> float:
+        """距离截止时刻的剩余时间（秒）"""
+        return self.deadline() - self.elapsed()
+
+    def record_write(self, seconds: float):
+        """记录一次写入解决方案的实测用时，并据此更新写入预留时间"""
+        self.write_reserve = seconds * parameter.write_reserve_factor
+
+    @contextmanager
+    def phase(self, name: str):
+        """阶段计时上下文"""
+        previous = self.current_phase
+        self.current_phase = name
+        start = time.perf_counter()
+        self.phases[name] = [start - self.start, 0.0]
+        try:
+            with Tracer().span(name):
+                yield self
+        finally:
+            self.phases[name][1] = time.perf_counter() - start
+            self.current_phase = previous
+
+    def should_stop(self, name=None) -> bool:
+        """
+        改进阶段是否应当停止：到达全局截止时刻，或阶段name用完其时间预算
+        """
+        if self.remaining() <= 0:
+            return True
+        name = self.current_phase if name is None else name
+        budget = parameter.phase_budget.get(name)
+        if budget is not None and name in self.phases:
+            return time.perf_counter() - self.start - self.phases[name][0] >= budget
+        return False
+
+    def report(self) -> str:
+        """各阶段用时汇总"""
+        lines = ['运行用时汇总：总用时{:.4f}秒，上限{}秒，写入预留{:.4f}秒！'.format(
+            self.elapsed(), parameter.time_limit, self.write_reserve)]
+        for name, (start, seconds) in self.phases.items():
+            lines.append('    阶段{}：开始于{:.4f}秒，用时{:.4f}秒，预算{}秒'.format(
+                name, start, seconds, parameter.phase_budget.get(name)))
+        return '\n'.join(lines)
+
+
+class SharedArray:
+    """
+    基于multiprocessing.shared_memory实现的共享NumPy数组：父进程创建并发布，子进程按描述信息挂载，
+    避免向每个任务序列化大数组
+    """
+
+    def __init__(self, shape, dtype, name=None):
+        """
+        :param name: 共享内存名称，None表示新建共享内存，否则挂载已有的共享内存
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+        self.owner = name is None  # 是否为创建者（创建者负责释放共享内存）
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @classmethod
+    def from_array(cls, array: np.ndarray):
+        """新建共享内存，并复制array的内容"""
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    def spec(self) -> tuple:
+        """用于在子进程中挂载的描述信息（名称、维度、数据类型）"""
+        return self.shm.name, self.shape, self.dtype.str
+
+    @classmethod
+    def attach(cls, spec: tuple):
+        """在子进程中按描述信息挂载共享内存"""
+        name, shape, dtype = spec
+        return cls(shape, dtype, name=name)
+
+    def close(self):
+        """释放数组视图并关闭共享内存，创建者同时删除共享内存"""
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
 def time_this(func):
-    """统计函数func的运行时间"""
+    """统计函数func的运行时间，计入跟踪类的嵌套阶段计时，并输出INFO级别事件"""
     @wraps(func)
     def wrapper(*args, **kwargs):
+        tracer = Tracer()
         start = time.perf_counter()
-        r = func(*args, **kwargs)
+        with tracer.span(func.__name__):
+            r = func(*args, **kwargs)
         end = time.perf_counter()
-        print('\n函数{}.{}运行时间 : {} 秒（来自装饰器）'.format(func.__module__, func.__name__, end - start))
+        if tracer.info:
+            tracer.emit('INFO', '\n函数{}.{}运行时间 : {} 秒（来自装饰器）', func.__module__, func.__name__, end - start)
         return r
     return wrapper
+
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: conftest.py
+@time: 2022/4/5 15:10
+@description:pytest配置：将src目录加入模块搜索路径（src中的模块以扁平方式互相导入），并提供构造小规模随机问题实例的夹具
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+from ReadData import Instance
+
+
+def random_instance(rnd_state: np.random.RandomState, n_time: int, n_cus: int, n_sit: int, demand=None,
+                    band_width=None) -> Instance:
+    """
+    构造小规模随机问题实例，时延在[0, 2*qos_constraint)内随机，保证每个客户节点至少有一个满足QoS约束的边缘节点
+    :param demand: 客户节点带宽需求（t*i），None表示随机生成
+    :param band_width: 边缘节点带宽上限（j），None表示随机生成
+    """
+    qos_constraint = 400
+    qos = rnd_state.randint(0, 2 * qos_constraint, size=(n_sit, n_cus))
+    qos[rnd_state.randint(n_sit, size=n_cus), np.arange(n_cus)] = 0
+    data = {
+        'mtime': np.array(['2021-11-01T00:{:02d}'.format(t) for t in range(n_time)]),
+        'demand': rnd_state.randint(0, 100, size=(n_time, n_cus)) if demand is None else np.asarray(demand),
+        'band_width': rnd_state.randint(50, 300, size=n_sit) if band_width is None else np.asarray(band_width),
+        'qos': qos,
+        'qos_constraint': qos_constraint,
+        'cus_names': np.array(['c{}'.format(i) for i in range(n_cus)]),
+        'sit_names': np.array(['s{}'.format(j) for j in range(n_sit)]),
+    }
+    return Instance(data)
+
+
+@pytest.fixture
+def make_instance():
+    """返回构造小规模随机问题实例的函数（见random_instance）"""
+    return random_instance
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: test_destroy_repair.py
+@time: 2022/4/5 15:20
+@description:ALNS破坏和修复算子的回归测试
+"""
+import contextlib
+import io
+import numpy as np
+import pytest
+from Results import Results
+from WaterFilling import water_fill
+from DestroyRepairOperator import destroy_sites, worst_destroy, random_destroy, single_destroy, greedy_repair, \
+    random_repair
+
+
+def zero_cost_results(instance) -> Results:
+    """将第0个时刻的需求分配给满足QoS约束的第一个边缘节点，其余时刻无需求，则所有边缘节点的95分位带宽值均为0"""
+    results = Results(instance.cus_list, instance.sit_list, instance.qos_dict(), instance.qos_constraint)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results.build_state()
+        for i in range(len(instance.cus_list)):
+            demand = int(instance.demand[0, i])
+            if demand > 0:
+                results.assign(0, i, int(instance.adjacency.sites_of(i)[0]), demand)
+    return results
+
+
+def random_results(instance, rnd_state: np.random.RandomState) -> Results:
+    """以随机的边缘节点选择优先级逐时刻注水分配，得到各个边缘节点负载序列各不相同的可行解"""
+    results = Results(instance.cus_list, instance.sit_list, instance.qos_dict(), instance.qos_constraint)
+    select_priority = rnd_state.random_sample((len(instance.mtime), len(instance.sit_list)))
+    results.solution = water_fill(instance.demand, instance.band_width, select_priority, instance.adjacency.mask,
+                                  rnd_state.permutation(len(instance.cus_list)).tolist())
+    with contextlib.redirect_stdout(io.StringIO()):
+        results.build_state()
+    return results
+
+
+@pytest.mark.parametrize('window', [0, 5, 100])
+@pytest.mark.parametrize('seed', range(5))
+def test_destroy_level_is_order_statistic(monkeypatch, make_instance, seed, window):
+    """被破坏的时刻为负载序列中第k-window~k小的时刻，负载上限为第k-window-1小的负载（k为95分位带宽值的位次）"""
+    monkeypatch.setattr('DestroyRepairOperator.parameter.destroy_window', window)
+    rnd_state = np.random.RandomState(seed)
+    instance = make_instance(rnd_state, 60, 5, 12, band_width=np.full(12, 1000))
+    results = random_results(instance, rnd_state)
+    k = results.percentile_95
+    window = min(window, k - 1)
+    loads = results.tracker.loads[:results.tracker.length].copy()
+    for j in range(len(instance.sit_list)):
+        candidate = destroy_sites(results, [j])
+        ordered = np.sort(loads[:, j])
+        m, level = candidate.floor[j]
+        assert m == window + 1
+        assert level == (ordered[k - 2 - window] if k - 2 - window >= 0 else 0)
+        assert np.array_equal(np.sort(loads[candidate.t_index, j]), ordered[k - 1 - window:k])
+        candidate.reject()
+
+
+@pytest.mark.parametrize('destroy', [worst_destroy, random_destroy, single_destroy])
+@pytest.mark.parametrize('repair', [greedy_repair, random_repair])
+def test_all_zero_cost_solution(make_instance, destroy, repair):
+    """所有边缘节点的95分位带宽值均为0时，破坏算子返回空的候选解，修复、下界、评估、接受和拒绝均不报错"""
+    rnd_state = np.random.RandomState(0)
+    n_time, n_cus, n_sit = 20, 4, 6
+    demand = np.zeros((n_time, n_cus), dtype=np.int64)
+    demand[0] = rnd_state.randint(1, 10, size=n_cus)
+    instance = make_instance(rnd_state, n_time, n_cus, n_sit, demand=demand, band_width=np.full(n_sit, 1000))
+    results = zero_cost_results(instance)
+    assert results.obj_value == 0 and not results.tracker.cost.any()
+    solution = results.solution.copy()
+
+    for accept in (False, True):
+        candidate = repair(destroy(results, rnd_state), rnd_state)
+        assert candidate.feasible
+        assert candidate.lower_bound() <= candidate.evaluate() == 0
+        if accept:
+            candidate.accept()
+        else:
+            candidate.reject()
+        assert results.obj_value == 0
+        assert np.array_equal(results.solution, solution)
+        assert results.state_consistent()
+
+
+@pytest.mark.parametrize('bound_band', [0, 4])
+@pytest.mark.parametrize('seed', range(10))
+def test_lower_bound_never_exceeds_delta(monkeypatch, make_instance, seed, bound_band):
+    """
+    随机破坏和修复的候选解上，目标函数变化量的下界不超过精确评估的变化量（基于下界的提前拒绝才是安全的），
+    候选解被随机接受或拒绝，使后续候选解基于不断变化的当前解
+    """
+    monkeypatch.setattr('Results.parameter.bound_band', bound_band)
+    rnd_state = np.random.RandomState(seed)
+    n_sit = 12
+    instance = make_instance(rnd_state, 60, 6, n_sit, band_width=rnd_state.randint(300, 1000, size=n_sit))
+    results = random_results(instance, rnd_state)
+    destroys, repairs = (worst_destroy, random_destroy, single_destroy), (greedy_repair, random_repair)
+    for _ in range(60):
+        destroy, repair = destroys[rnd_state.randint(3)], repairs[rnd_state.randint(2)]
+        candidate = repair(destroy(results, rnd_state, degree=rnd_state.uniform(0.05, 0.5)), rnd_state)
+        if not candidate.feasible:
+            candidate.reject()
+            continue
+        assert candidate.lower_bound() <= candidate.evaluate()
+        if rnd_state.random_sample() < 0.5:
+            candidate.accept()
+        else:
+            candidate.reject()
+    assert results.state_consistent()
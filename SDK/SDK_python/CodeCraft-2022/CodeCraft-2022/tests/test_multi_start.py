@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: test_multi_start.py
+@time: 2022/4/5 17:00
+@description:多起点构建中单个变体（_run_variant）的测试：无法满足需求时返回异常信息，其余异常向上传递
+"""
+import contextlib
+import io
+import multiprocessing
+import sys
+import types
+import numpy as np
+import pytest
+import CallAlgorithm
+from CallAlgorithm import construction_variants, _run_variant
+
+
+def setup_worker(monkeypatch, instance):
+    """在当前进程中设置_run_variant使用的子进程全局状态"""
+    shape = (len(instance.mtime), len(instance.cus_list), len(instance.sit_list))
+    monkeypatch.setitem(CallAlgorithm._worker, 'instance', instance)
+    monkeypatch.setitem(CallAlgorithm._worker, 'qos_dict', instance.qos_dict())
+    monkeypatch.setitem(CallAlgorithm._worker, 'output', types.SimpleNamespace(array=np.zeros(shape, dtype=np.int64)))
+    monkeypatch.setitem(CallAlgorithm._worker, 'best', multiprocessing.Array('q', [sys.maxsize, sys.maxsize]))
+
+
+@pytest.mark.parametrize('index', [0, 1])
+def test_feasible_variant(monkeypatch, make_instance, index):
+    """可行算例上返回变体的目标函数值，并将解写入输出数组"""
+    instance = make_instance(np.random.RandomState(index), 20, 4, 6, band_width=np.full(6, 1000))
+    setup_worker(monkeypatch, instance)
+    variant = construction_variants(2)[index]
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = _run_variant(variant)
+    assert result[0] == index and result[1] < sys.maxsize and result[2] is None
+    assert np.array_equal(CallAlgorithm._worker['output'].array.sum(axis=2), instance.demand)
+
+
+@pytest.mark.parametrize('index', [0, 1])
+def test_infeasible_variant(monkeypatch, make_instance, index):
+    """需求超过带宽上限时返回无法满足需求的异常信息"""
+    instance = make_instance(np.random.RandomState(index), 20, 4, 6, demand=np.full((20, 4), 1000),
+                             band_width=np.full(6, 100))
+    setup_worker(monkeypatch, instance)
+    with contextlib.redirect_stdout(io.StringIO()):
+        variant_index, obj_value, error = _run_variant(construction_variants(2)[index])
+    assert (variant_index, obj_value) == (index, sys.maxsize)
+    assert '无法满足客户节点' in error
+
+
+def test_programming_error_propagates(monkeypatch, make_instance):
+    """初始解生成算法中的其他异常（如TypeError）不被吞掉"""
+    def broken(*args, **kwargs):
+        raise TypeError('broken')
+
+    setup_worker(monkeypatch, make_instance(np.random.RandomState(0), 20, 4, 6))
+    monkeypatch.setattr(CallAlgorithm, 'initial_solution_generation', broken)
+    with pytest.raises(TypeError, match='broken'):
+        _run_variant(construction_variants(1)[0])
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: test_online.py
+@time: 2022/4/5 17:20
+@description:在线流式分配入口run_online的测试
+"""
+import contextlib
+import io
+import os
+from utils import Parameter, parameter
+from Online import run_online
+
+data_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'data')
+
+
+def test_run_online_uses_produce_path(monkeypatch, tmp_path):
+    """run_online按parameter.produce_path设置的数据目录和解决方案文件路径运行（与read_instance一致）"""
+    data_path = os.path.join(data_root, 'simulated100t10cus100site0.3pressure')
+    solution_path = str(tmp_path / 'solution.txt')
+
+    def produce_path(self):
+        self.data_path, self.solution_path = data_path, solution_path
+
+    monkeypatch.setattr(parameter, 'data_path', '/data/')
+    monkeypatch.setattr(parameter, 'solution_path', '/output/solution.txt')
+    monkeypatch.setattr(Parameter, 'produce_path', produce_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        allocator = run_online(follow=False)
+    with open(os.path.join(data_path, 'demand.csv'), encoding='utf-8') as f:
+        n_time = sum(1 for _ in f) - 1
+    with open(solution_path, encoding='utf-8') as f:
+        assert sum(1 for _ in f) == n_time * len(allocator.cus_names)
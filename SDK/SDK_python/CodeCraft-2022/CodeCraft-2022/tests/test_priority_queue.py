@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: test_priority_queue.py
+@time: 2022/4/5 16:30
+@description:索引优先级队列IndexedPriorityQueue的随机化测试：以heapq实现的参考堆（延迟删除）对照入队、修改优先级、
+    出队、删除、批量建堆和O(1)清空
+"""
+import heapq
+import numpy as np
+import pytest
+from utils import IndexedPriorityQueue, PriorityQueue
+
+
+class ReferenceHeap:
+    """参考堆：heapq按(优先级, 元素)排序，修改优先级或删除时仅使旧条目失效（出队时跳过）"""
+
+    def __init__(self):
+        self.entries = []
+        self.priority = {}  # 队列中的元素->优先级
+
+    def put(self, item, priority):
+        self.priority[item] = priority
+        heapq.heappush(self.entries, (priority, item))
+
+    def _discard_stale(self):
+        while self.entries and self.priority.get(self.entries[0][1]) != self.entries[0][0]:
+            heapq.heappop(self.entries)
+
+    def peek(self):
+        self._discard_stale()
+        return self.entries[0][1]
+
+    def get(self):
+        item = self.peek()
+        heapq.heappop(self.entries)
+        del self.priority[item]
+        return item
+
+    def remove(self, item):
+        del self.priority[item]
+
+    def reset(self):
+        self.entries = []
+        self.priority = {}
+
+
+def check_invariants(queue: IndexedPriorityQueue, reference: ReferenceHeap):
+    """检查队列的元素集合、优先级、位置索引和堆序与参考堆一致"""
+    assert len(queue) == len(reference.priority)
+    assert queue.empty() == (not reference.priority)
+    assert sorted(queue.heap[:queue.size]) == sorted(reference.priority)
+    for k in range(queue.size):
+        item = queue.heap[k]
+        assert item in queue and queue.pos[item] == k and queue.priority[item] == reference.priority[item]
+        if k > 0:
+            parent = queue.heap[(k - 1) >> 1]
+            assert (queue.priority[parent], parent) < (queue.priority[item], item)
+    for item in range(len(queue.heap)):
+        assert (item in queue) == (item in reference.priority)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_against_reference_heap(seed):
+    """随机操作序列上，每次出队的元素与参考堆相同，且每次操作后队列的不变式均成立"""
+    rnd = np.random.RandomState(seed)
+    capacity = 30
+    queue, reference = IndexedPriorityQueue(capacity), ReferenceHeap()
+    n_priority = 5 if seed % 2 == 0 else 1000  # 偶数种子下大量相同优先级，检查按元素打破平局
+    for _ in range(2000):
+        op = rnd.randint(100)
+        item, priority = int(rnd.randint(capacity)), int(rnd.randint(n_priority))
+        if op < 35:
+            queue.put(item, priority)
+            reference.put(item, priority)
+        elif op < 55 and reference.priority:
+            item = int(rnd.choice(sorted(reference.priority)))
+            queue.update(item, priority)
+            reference.put(item, priority)
+        elif op < 80 and reference.priority:
+            assert queue.peek() == reference.peek()
+            assert queue.get() == reference.get()
+        elif op < 90 and reference.priority:
+            item = int(rnd.choice(sorted(reference.priority)))
+            assert queue.remove(item) == item
+            reference.remove(item)
+        elif op < 97:
+            queue.reset()
+            reference.reset()
+        else:
+            priorities = rnd.randint(n_priority, size=rnd.randint(capacity + 1)).tolist()
+            queue.build(priorities)
+            reference.reset()
+            for item, priority in enumerate(priorities):
+                reference.put(item, priority)
+        check_invariants(queue, reference)
+
+    while reference.priority:
+        assert queue.get() == reference.get()
+    assert queue.empty()
+
+
+def test_same_order_as_priority_queue():
+    """出队顺序与PriorityQueue一致（优先级相同时元素越小越优先）"""
+    rnd = np.random.RandomState(0)
+    priorities = rnd.randint(10, size=200).tolist()
+    queue, heap = IndexedPriorityQueue(len(priorities)), PriorityQueue()
+    for item in rnd.permutation(len(priorities)).tolist():
+        queue.put(item, priorities[item])
+        heap.put(item, priorities[item])
+    assert [queue.get() for _ in priorities] == [heap.get() for _ in priorities]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: test_run_controller.py
+@time: 2022/4/5 15:40
+@description:运行控制类和跟踪类的测试：二者的方法不得重置运行时修改的参数
+"""
+import io
+import contextlib
+from utils import Parameter, RunController, Tracer, parameter
+
+
+def test_runtime_overrides_survive(monkeypatch):
+    """运行时修改的参数在调用运行控制类、跟踪类的方法之后保持不变，且被这些方法使用"""
+    monkeypatch.setattr(parameter, 'time_limit', 5)
+    monkeypatch.setattr(parameter, 'acceptance', 'sa')
+    monkeypatch.setattr(parameter, 'priority_update', True)
+    monkeypatch.setattr(parameter, 'phase_budget', {'improve': 0.0})
+
+    controller = RunController()
+    controller.reset()
+    assert controller.remaining() <= 5 - parameter.time_safety - parameter.write_reserve
+    controller.record_write(0.1)
+    assert controller.deadline() == 5 - parameter.time_safety - 0.1 * parameter.write_reserve_factor
+    with controller.phase('improve'):
+        assert controller.should_stop()
+    assert '上限5秒' in controller.report()
+
+    tracer = Tracer()
+    tracer.reset()
+    with contextlib.redirect_stderr(io.StringIO()):
+        tracer.write_summary()
+
+    assert Parameter.instance is parameter
+    assert (parameter.time_limit, parameter.acceptance, parameter.priority_update) == (5, 'sa', True)
+    controller.reset()
+
+
+def test_parameter_initialised_once(monkeypatch):
+    """再次调用Parameter()（如延迟导入的模块在导入时调用）返回同一对象，且不重置运行时修改的参数"""
+    monkeypatch.setattr(parameter, 'use_cache', False)
+    monkeypatch.setattr(parameter, 'time_limit', 5)
+    assert Parameter() is parameter
+    assert (parameter.use_cache, parameter.time_limit) == (False, 5)
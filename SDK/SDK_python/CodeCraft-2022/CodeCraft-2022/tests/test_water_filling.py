@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+@author: yuan_xin
+@contact: yuanxin9997@qq.com
+@file: test_water_filling.py
+@time: 2022/4/5 16:00
+@description:向量化注水内核water_fill_timesteps与参考实现allocate_timesteps的对比测试
+"""
+import contextlib
+import io
+import numpy as np
+import pytest
+from CallAlgorithm import allocate_timesteps
+from WaterFilling import water_fill_timesteps
+
+
+def random_timesteps(seed: int, n_time=40, n_cus=8, n_sit=20, pressure=0.9) -> tuple:
+    """
+    随机生成allocate_timesteps的参数（不含solution）：部分边缘节点带宽上限为0，选择优先级只取5个值（包含大量相同
+    优先级，检查排序的稳定性），客户节点的需求约为其可达带宽之和的pressure/n_cus倍
+    """
+    rnd = np.random.RandomState(seed)
+    qos_mask = rnd.random_sample((n_cus, n_sit)) < 0.4
+    qos_mask[np.arange(n_cus), rnd.randint(0, n_sit, size=n_cus)] = True
+    band_width = rnd.randint(0, 1000, size=n_sit)
+    band_width[rnd.randint(0, n_sit, size=max(1, n_sit // 10))] = 0
+    reachable = (qos_mask * band_width).sum(axis=1)
+    demand = (rnd.random_sample((n_time, n_cus)) * pressure * reachable / n_cus).astype(np.int64)
+    select_priority = rnd.randint(0, 5, size=(n_time, n_sit)) / 4
+    cus_serve_by_site = {i: np.nonzero(qos_mask[i])[0].tolist() for i in range(n_cus)}
+    cus_order = rnd.permutation(n_cus).tolist()
+    cus_names = [str(i) for i in range(n_cus)]
+    mtime_list = [str(t) for t in range(n_time)]
+    return (demand, band_width.tolist(), select_priority, cus_serve_by_site, cus_order, cus_names, mtime_list,
+            0, n_time)
+
+
+def allocate_both(args: tuple) -> tuple:
+    """
+    分别以两种实现分配
+    :return: (参考实现的分配结果或异常, 向量化实现的分配结果或异常)
+    """
+    shape = (len(args[6]), len(args[5]), len(args[1]))
+    outcomes = []
+    for allocate in (allocate_timesteps, water_fill_timesteps):
+        solution = np.zeros(shape, dtype=np.int64)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                allocate(solution, *args)
+        except Exception as e:
+            outcomes.append(e)
+        else:
+            outcomes.append(solution)
+    return tuple(outcomes)
+
+
+@pytest.mark.parametrize('batch', [1, 7, 256])
+@pytest.mark.parametrize('seed', range(10))
+def test_matches_reference(monkeypatch, seed, batch):
+    """可行算例上，两种实现的分配结果逐位相同，且与每批同时分配的时刻数量无关"""
+    monkeypatch.setattr('WaterFilling.parameter.water_fill_batch', batch)
+    args = random_timesteps(seed)
+    reference, vectorized = allocate_both(args)
+    assert isinstance(reference, np.ndarray)
+    assert np.array_equal(reference, vectorized)
+    assert np.array_equal(vectorized.sum(axis=2), args[0])
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_demand_above_reachable_capacity(seed):
+    """某个客户节点在某个时刻的需求超过其可达边缘节点的带宽之和时，两种实现均报错"""
+    args = random_timesteps(seed)
+    demand, band_width, cus_serve_by_site = args[0], args[1], args[3]
+    rnd = np.random.RandomState(seed)
+    t, i = rnd.randint(len(demand)), rnd.randint(len(cus_serve_by_site))
+    demand[t, i] = sum(band_width[j] for j in cus_serve_by_site[i]) + 1
+    for outcome in allocate_both(args):
+        assert isinstance(outcome, Exception) and '无法满足客户节点' in str(outcome)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_high_pressure(seed):
+    """需求接近或超过可达带宽的随机算例（部分可行、部分不可行）上，两种实现要么分配结果逐位相同，要么均报错"""
+    reference, vectorized = allocate_both(random_timesteps(seed, pressure=2.0))
+    if isinstance(reference, Exception):
+        assert isinstance(vectorized, Exception)
+    else:
+        assert np.array_equal(reference, vectorized)